@@ -1,10 +1,11 @@
 import streamlit as st
 import pandas as pd
-from io import BytesIO
 from PIL import Image
 import os
 import numpy as np
-from datetime import datetime, timedelta
+from valuation import engine, exclusions, fx, instrument, jobs, prophet
+from valuation.preview import paged_dataframe
+from valuation.stages import IncrementalPipeline
 
 # Set Streamlit page configuration
 st.set_page_config(page_title="VALUATION AUTOMATION", layout="wide")
@@ -71,30 +72,40 @@ st.subheader("Step 1: Choose Valuation Date")
 valuation_date = st.date_input("Select Valuation Date:")
 st.markdown("</div>", unsafe_allow_html=True)
 
+# Pipeline stages are memoised in session state, so a widget change only re-runs the steps below it
+pipeline = IncrementalPipeline(st.session_state)
+# Time, rows and memory of every step of this script run; the run is logged if a step ran (not only cache hits)
+run_log = instrument.RunLog("app", valuation_date=valuation_date).start()
+
 # Load RI_Company Table (Preloaded from TABLE folder)
-ri_company_path = "TABLE/RI_Company.csv"
 try:
-    ri_company_df = pd.read_csv(ri_company_path, dtype=str)
-    ri_company_dict = dict(zip(ri_company_df['PolicyNo'].astype(str).str.strip(), ri_company_df['RI_Company'].astype(str).str.strip()))
+    ri_company_dict = engine.load_ri_company_dict()
 except Exception as e:
     st.error(f"Error loading RI_Company table: {e}")
     ri_company_dict = {}
 
 # Load MRP_LOAN_TYPE Table (Preloaded from TABLE folder)
-mrp_loan_type_path = "TABLE/MRP_LOAN_TYPE.csv"
 try:
-    mrp_loan_type_df = pd.read_csv(mrp_loan_type_path, dtype=str)
-    mrp_loan_type_dict = dict(zip(mrp_loan_type_df['Product Code'].astype(str).str.strip(),
-                                  mrp_loan_type_df['Loan Type - RBC'].astype(str).str.strip()))
+    mrp_loan_type_dict = engine.load_mrp_loan_type_dict()
 except Exception as e:
     st.error(f"Error loading MRP_LOAN_TYPE table: {e}")
     mrp_loan_type_dict = {}
 
+# Load FX_RATE Table (Preloaded from TABLE folder; without it the fixed LKR / USD rates apply)
+try:
+    fx_rates = engine.load_fx_rates()
+except Exception as e:
+    st.error(f"Error loading FX_RATE table: {e}")
+    fx_rates = None
+
 
 # ✅ Function to clean DataFrame and replace NaN values safely
 def clean_dataframe(df):
-    """Ensure all columns and values are JSON-safe."""
+    """Ensure all columns and values are JSON-safe. Works on a copy: the frame passed in may be cached."""
+    df = df.copy()
     df.columns = df.columns.astype(str).fillna("Missing_Column")  # Fix NaN in column names
+    nullable = [col for col, dtype in df.dtypes.items() if isinstance(dtype, pd.api.extensions.ExtensionDtype)]
+    df[nullable] = df[nullable].astype(object).where(df[nullable].notna(), None)  # Typed output columns can't hold "Missing"
     df = df.replace({np.nan: "Missing", None: "Missing"})  # Fix NaN in data
     for col in df.columns:
         if df[col].dtype == "float64" or df[col].dtype == "int64":
@@ -106,6 +117,31 @@ def clean_dataframe(df):
 
 
 
+# Background conversions: re-attach to a running or finished job by its ID
+with st.sidebar:
+    st.subheader("Background Jobs")
+    job_id = st.text_input("Job ID:", value=st.session_state.get("job_id", ""),
+                           help="Shown when a conversion is started in the background (Step 8)")
+    if job_id.strip():
+        job = jobs.job_runner.get(job_id.strip())
+        if job is None:
+            st.warning("No job with this ID (finished jobs are kept for 24 hours).")
+        else:
+            jobs.show_job(job)
+
+# Admin view (open the app with ?admin): memory held by the caches shared by all sessions
+if "admin" in st.query_params:
+    with st.sidebar.expander("Memory Use (all sessions)", expanded=True):
+        artefacts, totals = pipeline.memory_report()
+        for name, stats in totals.items():
+            on_disk = f", {stats['disk_bytes'] / 1024 ** 2:.1f} MB on disk" if "disk_bytes" in stats else ""
+            st.caption(f"{name}: {stats['bytes'] / 1024 ** 2:.1f} MB of {stats['max_bytes'] / 1024 ** 2:.0f} MB{on_disk} · "
+                       f"{stats['hits']} hits, {stats['misses']} misses")
+        st.dataframe(artefacts, hide_index=True)
+        if st.button("Clear Shared Caches"):
+            pipeline.clear_shared()
+
+
 # Step 2: File Upload Section
 st.markdown("<div class='frame'>", unsafe_allow_html=True)
 st.subheader("Step 2: Upload Your File (Excel or CSV)")
@@ -116,64 +152,55 @@ st.markdown("</div>", unsafe_allow_html=True)
 if uploaded_file:
     try:
         # Read file without headers to preview data
-        preview_df = pd.read_csv(uploaded_file, header=None, dtype=str, nrows=10) if uploaded_file.name.endswith(".csv") else pd.read_excel(uploaded_file, header=None, dtype=str, nrows=10)
+        preview_df = pipeline.ingest(uploaded_file.getvalue(), uploaded_file.name, file_id=getattr(uploaded_file, "file_id", None))
+        run_log.context["file"] = uploaded_file.name
         
         # Display preview for user reference        
         preview_df = clean_dataframe(preview_df)    # ✅ FIX: Ensure NaN values do not break Streamlit
-        #preview_df = preview_df.fillna("")          # Fill NaN values before displaying
         st.markdown("<div class='frame'>", unsafe_allow_html=True)        
         st.subheader("Uploaded File Preview:")
         st.dataframe(preview_df)
+        cache_stats = pipeline.upload_stats()
+        st.caption(f"Upload cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                   f"{cache_stats['entries']} files ({cache_stats['bytes'] / 1024 ** 2:.1f} MB)")
         st.markdown("</div>", unsafe_allow_html=True)
         
         # Step 3: Header Row Selection
         st.markdown("<div class='frame'>", unsafe_allow_html=True)
         st.subheader("Step 3: Select Header Row")
-        header_row = st.number_input("Header Row:", min_value=0, max_value=len(preview_df)-1, value=4, step=1)
+        header_row = st.number_input("Header Row:", min_value=0, max_value=max(len(preview_df)-1, pipeline.detected_header_row),
+                                     value=pipeline.detected_header_row, step=1)
         st.markdown("</div>", unsafe_allow_html=True)
         
-        # Read file again with the chosen header row
-        uploaded_file.seek(0)  # Reset file pointer
-        input_df = pd.read_csv(uploaded_file, skiprows=header_row) if uploaded_file.name.endswith(".csv") else pd.read_excel(uploaded_file, skiprows=header_row)
-        
-        if input_df.empty or len(input_df.columns) == 0:
-            st.error("Error: No valid columns detected after skipping the selected header row. Please choose a different row.")
+        # Apply the chosen header row
+        try:
+            input_df = pipeline.header(header_row)
+        except ValueError as e:
+            st.error(f"Error: {e}")
         else:
             try:
-                # Rename columns based on the chosen header row
-                input_df.columns = input_df.iloc[0].fillna("Unnamed_Column").tolist()  # Convert Series to list
-                #input_df.columns = input_df.iloc[0]
-                input_df = input_df[1:].reset_index(drop=True)
-                
-                # Display processed file    
-                input_df = clean_dataframe(input_df)     # ✅ FIX: Ensure JSON-safe values before displaying
-                #input_df = input_df.fillna("")    # **Fix: Fill NaN values before displaying**
+                # Display processed file (clean_dataframe is applied to the visible page only)
                 st.subheader("Processed File:")
-                st.dataframe(input_df)
+                paged_dataframe(input_df, key="processed", format_page=clean_dataframe)
                 
                 # Step 4: Ignore Group Data
                 st.subheader("Step 4: Ignore Group Life MCR Policies")
-                if 'Product Code' in input_df:
-                    product_code_options = input_df['Product Code'].dropna().unique().tolist()
-                    ignored_product_codes = st.multiselect("Select Product Codes of Group to Ignore:", product_code_options)
-            
-                selected_policies = input_df[input_df['Product Code'].isin(ignored_product_codes)]
-                input_df = input_df[~input_df['Product Code'].isin(ignored_product_codes)]
+                ignored_product_codes = st.multiselect("Select Product Codes of Group to Ignore:", engine.product_code_options(input_df))
+                # Steps 4-6 are evaluated in one pass; each step shows its part of the plan
+                plan = pipeline.exclusions(input_df, ignored_product_codes, valuation_date)
+                selected_policies = plan.group_policies
             
                 if not selected_policies.empty:
                     st.markdown("<div class='frame'>", unsafe_allow_html=True)
                     st.subheader("Selected Policies (Ignored Product Codes)")
-                    st.dataframe(selected_policies)
+                    paged_dataframe(selected_policies, key="group", format_page=clean_dataframe)
                 
                 # Download selected policies
-                buffer = BytesIO()
-                selected_policies.to_excel(buffer, index=False)
-                buffer.seek(0)
                 st.download_button(
                     label="Download Group MCR Policies",
-                    data=buffer,
-                    file_name="selected_policies.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    data=pipeline.export(selected_policies, engine.GROUP_FILE),
+                    file_name=engine.GROUP_FILE,
+                    mime=engine.XLSX_MIME,
                 )
                 st.markdown("</div>", unsafe_allow_html=True)
 
@@ -181,96 +208,40 @@ if uploaded_file:
                 # Step 5: Ignore Policies by Commencement Date and Preview Ignored Policies
                 st.subheader("Step 5: Ignore Policies by Commencement Date")
                 st.write("In Step 5, we will filter out policies based on their commencement date. If the commencement date is greater than the valuation date, we will remove those policies from the valuation.")
-                if 'Policy Start Date' in input_df:
-                    input_df['Policy Start Date'] = pd.to_datetime(input_df['Policy Start Date'], errors='coerce')
-                    ignored_policies = input_df[input_df['Policy Start Date'] > pd.to_datetime(valuation_date)]
-                    input_df = input_df[input_df['Policy Start Date'] <= pd.to_datetime(valuation_date)]
+                ignored_policies = plan.commencement_policies
     
                 if not ignored_policies.empty:
                     st.markdown("<div class='frame'>", unsafe_allow_html=True)
                     st.subheader("Ignored Policies (Commencement Date After Valuation Date)")
-                    st.dataframe(ignored_policies)
+                    paged_dataframe(ignored_policies, key="commencement", format_page=clean_dataframe)
         
                 # Download ignored policies
-                buffer = BytesIO()
-                ignored_policies.to_excel(buffer, index=False)
-                buffer.seek(0)
                 st.download_button(
                     label="Download Ignored Policies by Commencement Date",
-                    data=buffer,
-                    file_name="ignored_policies.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    data=pipeline.export(ignored_policies, engine.COMMENCEMENT_FILE),
+                    file_name=engine.COMMENCEMENT_FILE,
+                    mime=engine.XLSX_MIME,
                     )
                 st.markdown("</div>", unsafe_allow_html=True)
-
-                # Step 6: Ignore Policies by Maturity Date and Preview Ignored Policies
+                no_start_date = (plan.reason == exclusions.NO_START_DATE).sum()
+                if no_start_date:
+                    st.warning(f"{no_start_date} policies have no readable Policy Start Date and are not valued.")
 
                 # Step 6: Ignore Policies by Maturity Date and Preview Ignored Policies
                 st.subheader("Step 6: Ignore Policies by Maturity Date")
-
-                if 'Policy Start Date' in input_df and 'Policy Term (Months)' in input_df:
-                    def convert_to_date(value):
-                        """Converts different date formats into a valid datetime."""
-                        try:
-                            if isinstance(value, (int, float)) and value > 30000:  # Likely an Excel date serial number
-                                return datetime(1899, 12, 30) + timedelta(days=value)
-                            
-                            # Try parsing standard datetime formats
-                            parsed_date = pd.to_datetime(value, errors='coerce', dayfirst=True)
-                            if pd.notna(parsed_date):
-                                return parsed_date
-                            
-                            # If still invalid, return NaT
-                            return pd.NaT
-                        except:
-                            return pd.NaT
-
-                    # Convert Policy Start Date
-                    input_df['Policy Start Date'] = input_df['Policy Start Date'].apply(convert_to_date)
-                    input_df['Policy Term (Months)'] = pd.to_numeric(input_df['Policy Term (Months)'], errors='coerce')
-
-                    # Correct Maturity Date Calculation: Year is adjusted by quotient, Month by remainder, Fractional Months to Days
-                    def calculate_maturity(row):
-                        if pd.isna(row['Policy Start Date']) or pd.isna(row['Policy Term (Months)']) or row['Policy Term (Months)'] == 0:
-                            return "Error"
-                        
-                        # Split into integer and fractional parts
-                        total_months = row['Policy Term (Months)']
-                        years = int(total_months // 12)  # Quotient for years
-                        months = int(total_months % 12)  # Remainder for months
-                        
-                        # Handle fractional months (convert to approximate days)
-                        fractional_month = total_months % 1  # Extract decimal part
-                        days = int(fractional_month * 30)  # Convert fractional month to days (approximation)
-
-                        # Add years and months to the Policy Start Date
-                        maturity_date = row['Policy Start Date'] + pd.DateOffset(years=years, months=months, days=days)
-                        return maturity_date
-
-                    input_df['Maturity Date'] = input_df.apply(calculate_maturity, axis=1)
-                    
-                    # Convert only valid maturity dates to datetime for comparison, set "Error" values to NaT
-                    input_df['Maturity Date'] = pd.to_datetime(input_df['Maturity Date'], errors='coerce')
-                    
-                    # Filter ignored policies (only those with valid maturity dates)
-                    ignored_maturity_policies = input_df[input_df['Maturity Date'].notna() & (input_df['Maturity Date'] <= pd.to_datetime(valuation_date))]
-                    error_maturity_policies = input_df[input_df['Maturity Date'].isna()]  # Policies where Maturity Date is "Error"
-                    input_df = input_df[input_df['Maturity Date'].isna() | (input_df['Maturity Date'] > pd.to_datetime(valuation_date))]
+                ignored_maturity_policies, error_maturity_policies = plan.maturity_policies, plan.maturity_error_policies
 
                 # Preview and download ignored policies
                 if not ignored_maturity_policies.empty:
                     st.markdown("<div class='frame'>", unsafe_allow_html=True)
                     st.subheader("Ignored Policies (Maturity Date Less Than or Equal to Valuation Date)")
-                    st.dataframe(ignored_maturity_policies)
+                    paged_dataframe(ignored_maturity_policies, key="maturity", format_page=clean_dataframe)
 
-                    buffer = BytesIO()
-                    ignored_maturity_policies.to_excel(buffer, index=False)
-                    buffer.seek(0)
                     st.download_button(
                         label="Download Ignored Maturity Policies",
-                        data=buffer,
-                        file_name="ignored_maturity_policies.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        data=pipeline.export(ignored_maturity_policies, engine.MATURITY_FILE),
+                        file_name=engine.MATURITY_FILE,
+                        mime=engine.XLSX_MIME,
                     )
                     st.markdown("</div>", unsafe_allow_html=True)
 
@@ -278,403 +249,76 @@ if uploaded_file:
                 if not error_maturity_policies.empty:
                     st.markdown("<div class='frame'>", unsafe_allow_html=True)
                     st.subheader("Error Value Policies (Maturity Date Calculation Failed)")
-                    st.dataframe(error_maturity_policies)
+                    paged_dataframe(error_maturity_policies, key="maturity_error", format_page=clean_dataframe)
 
-                    buffer = BytesIO()
-                    error_maturity_policies.to_excel(buffer, index=False)
-                    buffer.seek(0)
                     st.download_button(
                         label="Download Error Value Policies",
-                        data=buffer,
-                        file_name="error_maturity_policies.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        data=pipeline.export(error_maturity_policies, engine.MATURITY_ERROR_FILE),
+                        file_name=engine.MATURITY_ERROR_FILE,
+                        mime=engine.XLSX_MIME,
                     )
                     st.markdown("</div>", unsafe_allow_html=True)
-
-
-
-
-
-
                 
                 
                 # Step 7: Filter Data by Policy Status
                 st.subheader("Step 7: Filter Data by Policy Status")
-                policy_status_options = input_df['Policy Status'].dropna().unique().tolist() if 'Policy Status' in input_df else []
-                selected_status = st.multiselect("Select Policy Status to Include:", policy_status_options)
+                selected_status = st.multiselect("Select Policy Status to Include:", plan.status_options())
 
                 if selected_status:
-                    filtered_df = input_df[input_df['Policy Status'].isin(selected_status)]
+                    plan = pipeline.status(plan, selected_status)
+                    filtered_df = plan.filtered_df
                     st.subheader("Status Wise Filtered Data")
                     st.write(f"Total Records Selected for MP File Conversion: {len(filtered_df)}")
-                    st.dataframe(filtered_df)
+                    paged_dataframe(filtered_df, key="status", format_page=clean_dataframe)
+                    with st.expander("Exclusion Summary"):
+                        st.dataframe(plan.summary(), hide_index=True)
                     
                 # Step 8: Generate Output Fields
                     st.subheader("Step 8: Generate Output Fields")
-                    
-                    def process_data(df):
-                        output_data = pd.DataFrame(index=df.index)
-                        #output_data = pd.DataFrame()
-                        
-                        # 1. SPCODE (Static Value)
-                        output_data['SPCODE'] = 1
-                        output_data['SPCODE'] = output_data['SPCODE'].astype(int)
-
-                        # 2. PROPHET_CODE (Derived from Plan Code)
-                        def get_prophet_code(plan_code):
-                            if str(plan_code).startswith("PLAN07"):
-                                return "C_07MRP"
-                            elif str(plan_code).startswith("PLAN11"):
-                                return "C_11MICRO"
-                            elif str(plan_code).startswith("PLAN25"):
-                                return "C_25MRPTAKAFUL"
-                            return "Error"
-                        
-                        output_data['PROPHET_CODE'] = df['Plan Code'].apply(get_prophet_code)
-                        
-                        # 3. PolNo (Integer or Text Based on Original Data Type)
-                        def convert_policy_number(value):
-                            try:
-                                return int(value) if value.replace(".", "", 1).isdigit() else value
-                            except:
-                                return value
-                        output_data['PolNo'] = df['Policy Number'].apply(convert_policy_number)
-                        
-                        # 4. PLAN_NO (Derived from Plan Code as Integer)
-                        def get_plan_no(plan_code):
-                            if str(plan_code).startswith("PLAN07"):
-                                return 7
-                            elif str(plan_code).startswith("PLAN11"):
-                                return 11
-                            elif str(plan_code).startswith("PLAN25"):
-                                return 25
-                            return "Error"
-                        
-                        output_data['PLAN_NO'] = df['Plan Code'].apply(get_plan_no)
-                        
-                        # 5. COMM_DAT (Formatted as 8-digit YYYYMMDD as Integer from Policy Start Date)
-                        # def convert_date_to_8_digits(date):
-                        #     try:
-                        #         date_obj = pd.to_datetime(date, errors='coerce')
-                        #         return int(f"{date_obj.year:04d}{date_obj.month:02d}{date_obj.day:02d}")
-                        #     except:
-                        #         return 0
-                            
-                        # output_data['COMM_DAT'] = df['Policy Start Date'].apply(convert_date_to_8_digits)
-
-
-                        # 5. COMM_DAT (Formatted as 8-digit YYYYMMDD as Integer from Policy Start Date)
-                        def convert_date_to_8_digits(date):
-                            if pd.isna(date) or str(date).strip() == "" or str(date).strip() == "0":  # Check for None, NaN, empty string, or "0"
-                                return "Error"
-                            
-                            try:
-                                date_obj = pd.to_datetime(date, errors='coerce')  # Convert to datetime
-                                if pd.isna(date_obj):  # If conversion fails, return "Error"
-                                    return "Error"
-                                
-                                return int(f"{date_obj.year:04d}{date_obj.month:02d}{date_obj.day:02d}")  # Format as YYYYMMDD integer
-                            except:
-                                return "Error"  # Catch any unexpected errors and return "Error"
-
-                        # Apply the function to the column
-                        output_data['COMM_DAT'] = df['Policy Start Date'].apply(convert_date_to_8_digits)
-
-                        
-                        # 6. NEXT_DUE_DATE (Static Value)
-                        output_data['NEXT_DUE_DATE'] = 0
-                        
-                        # 7. BIRTH_DAT (Formatted as 8-digit YYYYMMDD as Integer from DOB (Life 1))
-                        output_data['BIRTH_DAT'] = df['DOB (Life 1)'].apply(convert_date_to_8_digits)
-                        
-                        # 8. SEX (Mapped from Gender (Life 1))
-                        # def map_gender(gender):
-                        #     gender = str(gender).strip().lower()
-                        #     if gender in ["male", "m"]:
-                        #         return 0
-                        #     elif gender in ["female", "f"]:
-                        #         return 1
-                        #     return "Error"
-                        # output_data['SEX'] = df['Gender (Life 1)'].apply(map_gender)
-
-
-                        def map_gender(gender):
-                            if pd.isna(gender) or str(gender).strip() == "":  # Check for None, NaN, or empty string
-                                return "Error"
-                            
-                            gender = str(gender).strip().lower()  # Convert to lowercase string
-                            
-                            if gender in ["male", "m"]:
-                                return 0  # Convert male to 0
-                            elif gender in ["female", "f"]:
-                                return 1  # Convert female to 1
-                            
-                            return "Error"  # Return "Error" for unexpected values
-
-
-                        output_data['SEX'] = df['Gender (Life 1)'].apply(map_gender)
-
-
-
-
-                        # 9. BIRTH_DAT2 (Formatted as 8-digit YYYYMMDD as Integer from DOB (Life 2))
-
-                        def convert_date_to_8_digits2(date):
-                            try:
-                                date_obj = pd.to_datetime(date, errors='coerce')
-                                return int(f"{date_obj.year:04d}{date_obj.month:02d}{date_obj.day:02d}")
-                            except:
-                                return 0
-                            
-
-                        output_data['BIRTH_DAT2'] = df['DOB (Life 2)'].apply(convert_date_to_8_digits2)
-                        
-                        # 10. SEX2 (Mapped from Gender (Life 2))
-                        output_data['SEX2'] = df['Gender (Life 2)'].apply(map_gender)
-
-                        # 11. POL_TERM_Y (Policy Term in Years)
-                        #output_data['POL_TERM_Y'] = df['Policy Term (Months)'].apply(lambda x: int(x) / 12 if str(x).isdigit() else 0)
-
-                        # 11. POL_TERM_Y (Policy Term in Years)
-                        def convert_policy_term(months):
-                            if pd.isna(months) or str(months).strip() == "" or str(months).strip() == "0" or float(months) < 0 or months == 0:
-                                return "Error"  # Return "Error" for empty, blank, 0, or negative values
-                            
-                            try:
-                                months = float(months)  # Convert to number
-                                return months / 12  # Convert to years
-                            except:
-                                return "Error"  # Return "Error" if conversion fails
-
-                        # Apply function to Policy Term (Months) column
-                        output_data['POL_TERM_Y'] = df['Policy Term (Months)'].apply(convert_policy_term)
-
-
-                        # 12. PREM_FREQ (Static Value)
-                        output_data['PREM_FREQ'] = 0
-
-                        # 13. ANNUAL_PREM (Static Value)
-                        output_data['ANNUAL_PREM'] = 0
-
-
-                        # 14. SINGLE_PREM (Extracted from Single Premium as Number)
-
-                        def convert_to_number(value):
-                            try:
-                                return float(value) if str(value).replace(".", "", 1).isdigit() else 0
-                            except:
-                                return 0
-                            
-
-                        def calculate_single_prem(row):
-                            single_premium = convert_to_number(row['Single Premium'])  # First convert to number format
-                            if row['Currency'] == 'USD':
-                                return single_premium * 450  # Multiply by 450 if currency is USD
-                            elif row['Currency'] == 'LKR':
-                                return single_premium  # Keep the original value for LKR
-                            else:
-                                return 0  # Default value for unexpected currency types
-
-                        output_data['SINGLE_PREM'] = df.apply(calculate_single_prem, axis=1)
-
-                        # 15. SUM_ASSURED
-                        output_data['SUM_ASSURED'] = 0
-
-                        # 16. INIT_DECB_IF
-                        output_data['INIT_DECB_IF'] = 0
-
-                        # 17. LOAN_AMT_1
-                        # Convert 'Loan Amount (Death Benefit) -Life 1' to numeric
-                        df['Loan Amount (Death Benefit) -Life 1'] = df['Loan Amount (Death Benefit) -Life 1'].apply(convert_to_number)
-
-                        def calculate_loan_amt_1(row):
-                            if row['Currency'] == 'USD':
-                                return row['Loan Amount (Death Benefit) -Life 1'] * 450
-                            elif row['Currency'] == 'LKR':
-                                return row['Loan Amount (Death Benefit) -Life 1']
-                            else:
-                                return "Error"  # Default value for unexpected currency types
-
-                        output_data['LOAN_AMT_1'] = df.apply(calculate_loan_amt_1, axis=1)
-
-                        # 18. LOAN_AMT_2
-                        output_data['LOAN_AMT_2'] = 0
-
-                        # 19. LOAN_AMT_3
-                        output_data['LOAN_AMT_3'] = 0
-
-                        # 20. LOAN_INT_1 Calculation
-                        def calculate_loan_int(row):
-                            try:
-                                if str(row['Interest Type']).strip().lower() == "fixed":
-                                    return float(row['Fixed Interest']) if str(row['Fixed Interest']).replace(".", "", 1).isdigit() else 0
-                                elif str(row['Interest Type']).strip().lower() == "variable":
-                                    current_awplr = float(row['Current AWPLR']) if str(row['Current AWPLR']).replace(".", "", 1).isdigit() else 0
-                                    additional_awplr = float(row['Additional AWPLR']) if str(row['Additional AWPLR']).replace(".", "", 1).isdigit() else 0
-                                    return current_awplr + additional_awplr
-                                else:
-                                    return 0
-                            except:
-                                return 0
-                        
-                        output_data['LOAN_INT_1'] = df.apply(calculate_loan_int, axis=1)
-
-                     
-                        # 21. LOAN_INT_2
-                        output_data['LOAN_INT_2'] = 0
-
-                        # 22. LOAN_INT_3
-                        output_data['LOAN_INT_3'] = 0
-
-                        # 23. TPD_DECLINE Calculation
-
-                        # def calculate_tpd_decline(value):
-                        #     value = str(value).strip().lower()
-                        #     if value == "yes":
-                        #         return "N"
-                        #     elif value == "no":
-                        #         return "Y"
-                        #     else:
-                        #         return "Error"
-                        
-                        #output_data['TPD_DECLINE'] = df['TPD Option  - Life 1'].apply(calculate_tpd_decline)
-
-                        def calculate_tpd_decline(value):
-                            if pd.isna(value) or str(value).strip() == "" or str(value).strip() == "0":  # Check for None, NaN, empty string, or "0"
-                                return "Error"
-                            
-                            value = str(value).strip().lower()  # Convert to lowercase string
-                            
-                            if value == "yes":
-                                return "N"
-                            elif value == "no":
-                                return "Y"
-                            
-                            return "Error"  # Return "Error" for unexpected values
-
-                        # Apply function to TPD Option - Life 1 column
-                        output_data['TPD_DECLINE'] = df['TPD Option  - Life 1'].apply(calculate_tpd_decline)
-
-
-                        # 24. TPD_DECLINE2 Calculation
-                        # def calculate_tpd_decline2(value):
-                        #     value = str(value).strip().lower()
-                        #     if value == "yes":
-                        #         return "N"
-                        #     elif value == "no":
-                        #         return "Y"
-                        #     else:
-                        #         return 0
-                            
-
-                        def calculate_tpd_decline2(value):
-                            if pd.isna(value) or str(value).strip() == "" or str(value).strip() == "0":  # Check for None, NaN, empty string, or "0"
-                                return 0
-                            
-                            value = str(value).strip().lower()  # Convert to lowercase string
-                            
-                            if value == "yes":
-                                return "N"
-                            elif value == "no":
-                                return "Y"
-                            
-                            return 0  # Return 0 for unexpected values
-
-                        # Apply function to TPD Option - Life 2 column
-                        output_data['TPD_DECLINE2'] = df['TPD Option  - Life 2'].apply(calculate_tpd_decline2)
-                        
-
-                        
-                        # 25. MAT_BEN_PP
-                        output_data['MAT_BEN_PP'] = 0
-
-                        # 26. CURR_FUND_BAL
-                        output_data['CURR_FUND_BAL'] = 0
-
-                        # 27. SUM_ASSD_HB
-                        output_data['SUM_ASSD_HB'] = 0
-
-                        # 28. ANN_ANNUITY
-                        output_data['ANN_ANNUITY'] = 0
-
-                        # 29. DEFER_PER_Y
-                        output_data['DEFER_PER_Y'] = 0
-
-                        # 30. RPR_COMPANY Mapping (Using Preloaded Table)
-                        def map_ri_company(polno):
-                            return ri_company_dict.get(str(polno), "MunichRe")
-                        
-                        output_data['RPR_COMPANY'] = df['Policy Number'].apply(map_ri_company)
-                        
-                        # 31. SERIES_NO
-                        output_data['SERIES_NO'] = 0
-
-                        # 32. PREM_TERM_Y
-                        output_data['PREM_TERM_Y'] = 0
-
-                        # 33. GRACE_START_ONE
-                        output_data['GRACE_START_ONE'] = 0
-
-                        # 34. GRACE_PERIOD_ONE
-                        output_data['GRACE_PERIOD_ONE'] = 0
-
-                        # 35. DOV_INDICATOR Calculation
-                        def generate_dov_indicator(date):
-                            return f"M{date.month}_{date.year}"
-                            #return f"M{date.month:02d}_{date.year}"
-                    
-                        output_data['DOV_INDICATOR'] = generate_dov_indicator(valuation_date)
-
-                        # 36. GRACE_START_TWO
-                        output_data['GRACE_START_TWO'] = 0
-
-                        # 37. GRACE_PERIOD_TWO
-                        output_data['GRACE_PERIOD_TWO'] = 0
-
-                        # 38. STUDY_GUARD_TYPE
-                        output_data['STUDY_GUARD_TYPE'] = 0
-
-                        # 39. MRP_LOAN_TYPE Mapping (Using Preloaded Table)
-                        def map_loan(Product_CODE):
-                            return mrp_loan_type_dict.get(str(Product_CODE), "Error")
-
-
-                        output_data['LoanType'] = df['Product Code'].apply(map_loan)       
-
-                        # 40. GRACE_START_THREE
-                        output_data['GRACE_START_THREE'] = 0                        
-
-                        # 41. GRACE_PERIOD_THREE
-                        output_data['GRACE_PERIOD_THREE'] = 0 
-
-                        # 42. MCR_LOAN_TYPE
-                        output_data['MCR_LOAN_TYPE'] = 0 
-
-                        # 43. CHANNEL_CODE
-                        output_data['CHANNEL_CODE'] = "Partnership"
-
-
-
-                        return output_data
-            
-                    
-                    output_df = process_data(filtered_df)
+                    rate_labels = {fx.TABLE: "FX_RATE table (as of the valuation date)",
+                                   **{source: f"Extract: {column}" for source, column in fx.RATE_COLUMNS.items()}}
+                    rate_source = st.radio("Exchange Rate to LKR:", fx.RATE_SOURCES, format_func=rate_labels.get, horizontal=True)
+                    conversion = fx.Conversion(fx_rates if rate_source == fx.TABLE else None, rate_source)
+                    output_df = pipeline.output(filtered_df, valuation_date, ri_company_dict, mrp_loan_type_dict, conversion)
                     
                     # Display Output Data
                     st.subheader("Generated Output Preview")
-                    st.dataframe(output_df)
+                    paged_dataframe(output_df, key="output", format_page=clean_dataframe)
+                    unmatched = engine.unmatched_counts(output_df)
+                    st.caption(f"Not in the RI_Company table: {unmatched.get('RPR_COMPANY', 0):,} policies "
+                               f"(RPR_COMPANY {engine.RI_COMPANY_DEFAULT}) · not in the MRP_LOAN_TYPE table: "
+                               f"{unmatched.get('LoanType', 0):,} (LoanType {engine.LOAN_TYPE_DEFAULT})")
+                    with st.expander("Validation Report"):
+                        st.dataframe(engine.validation_report(output_df), hide_index=True)
+                    error_values = st.checkbox('Write "Error" in invalid fields of the downloads', value=True,
+                                               help="Unchecked, invalid fields are left blank and keep the column types")
                     
                     # Download Output Data
-                    buffer = BytesIO()
-                    output_df.to_excel(buffer, index=False)
-                    buffer.seek(0)
-                    
                     st.download_button(
                         label="Download Generated Output",
-                        data=buffer,
-                        file_name="generated_output.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        data=pipeline.export_output(output_df, error_values),
+                        file_name=engine.OUTPUT_FILE,
+                        mime=engine.XLSX_MIME,
                     )
+                    st.download_button(
+                        label="Download Prophet Model Point Files (.RPT)",
+                        data=pipeline.export_mpf(output_df, error_values),
+                        file_name=prophet.MPF_ZIP_FILE,
+                        mime=prophet.ZIP_MIME,
+                    )
+
+                    # Convert the whole file again in a worker, with progress in the sidebar
+                    if st.button("Convert in the Background", help="Writes every output file outside this page; "
+                                                                   "re-attach later with the job ID"):
+                        try:
+                            job = jobs.job_runner.submit(uploaded_file.getvalue(), jobs.JobSpec(
+                                uploaded_file.name, valuation_date, ignored_product_codes, selected_status, header_row,
+                                ri_company_dict, mrp_loan_type_dict, conversion, error_values))
+                        except jobs.QueueFull as e:
+                            st.error(f"Error: {e}")
+                        else:
+                            st.session_state["job_id"] = job.id
+                            st.rerun()
             except Exception as e:
                 st.error(f"Error processing data: {e}")
     except Exception as e:
@@ -683,6 +327,12 @@ else:
     st.info("Please upload a file to proceed.")
 
 
+# Per-step wall and CPU time, rows and memory: the last run of each step in this session, and the downloads
+with st.sidebar.expander("Performance"):
+    st.dataframe(pipeline.performance(), hide_index=True)
+    st.caption(f"peak_delta_mb is the memory growth while the step ran. Runs are logged to {instrument.RUN_LOG_PATH}.")
+run_log.finish()
+
 # Load and Display Video at the End
 video_path = "IMAGE/Thank.mp4"
 
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from valuation.dates import (CENTURY_PIVOT, MISSING, SERIAL, TEXT, add_months, infer_day_first, normalise_dates,
+                             parse_dates)
+
+
+def dates(*values):
+    return pd.to_datetime(list(values), format="ISO8601")
+
+
+def assert_dates(actual, *expected):
+    assert list(pd.Series(actual)) == list(pd.Series(dates(*expected)))
+
+
+# ---------------------------------------------------------------------------
+# Serial numbers and dd-mm-yy text
+# ---------------------------------------------------------------------------
+
+def test_serial_numbers_and_text_in_one_column():
+    parsed = normalise_dates(pd.Series([45292, 45292.5, "45292", "28-07-80 0:00", "07-06-24 13:45"], dtype=object))
+    assert_dates(parsed.dates, "2024-01-01", "2024-01-01 12:00", "2024-01-01", "1980-07-28", "2024-06-07 13:45")
+    assert list(parsed.encoding) == [SERIAL, SERIAL, SERIAL, TEXT, TEXT]
+    assert list(parsed.yyyymmdd) == [20240101, 20240101, 20240101, 19800728, 20240607]
+
+
+def test_serial_text_is_not_read_as_a_year():
+    # "2024" is day 2024 of the Excel calendar, not the year
+    parsed = normalise_dates(pd.Series(["2024"]))
+    assert_dates(parsed.dates, "1905-07-16")
+    assert list(parsed.encoding) == [SERIAL]
+
+
+def test_blank_and_zero_are_missing():
+    parsed = normalise_dates(pd.Series(["", "0", 0, None, "not a date"], dtype=object))
+    assert parsed.dates.isna().all()
+    assert list(parsed.yyyymmdd) == [0, 0, 0, 0, 0]
+    assert list(parsed.encoding)[:4] == [MISSING] * 4
+
+
+def test_each_distinct_value_keeps_its_row():
+    values = pd.Series(["01-02-24", "45292", "01-02-24"], index=[10, 20, 30])
+    parsed = parse_dates(values)
+    assert list(parsed.index) == [10, 20, 30]
+    assert_dates(parsed, "2024-02-01", "2024-01-01", "2024-02-01")
+
+
+# ---------------------------------------------------------------------------
+# Day / month order
+# ---------------------------------------------------------------------------
+
+def test_ambiguous_date_is_day_first_by_default():
+    assert_dates(parse_dates(pd.Series(["03-04-24"])), "2024-04-03")
+
+
+def test_ambiguous_date_follows_the_column():
+    # A second field over 12 makes the whole column month-first
+    assert_dates(parse_dates(pd.Series(["03-04-24", "04-13-24"])), "2024-03-04", "2024-04-13")
+    assert_dates(parse_dates(pd.Series(["03-04-24", "13-04-24"])), "2024-04-03", "2024-04-13")
+
+
+def test_infer_day_first():
+    assert infer_day_first(np.array([3, 4]), np.array([4, 5]))
+    assert infer_day_first(np.array([13]), np.array([4]))
+    assert not infer_day_first(np.array([4]), np.array([13]))
+    # Both positions over 12: the extract's day-first layout wins
+    assert infer_day_first(np.array([13, 4]), np.array([4, 13]))
+
+
+def test_impossible_date_is_missing():
+    assert parse_dates(pd.Series(["31-02-24"])).isna().all()
+
+
+# ---------------------------------------------------------------------------
+# Two-digit years
+# ---------------------------------------------------------------------------
+
+def test_century_pivot_at_68():
+    assert CENTURY_PIVOT == 68
+    assert_dates(parse_dates(pd.Series(["01-01-00", "01-01-68", "01-01-69", "01-01-99"])),
+                 "2000-01-01", "2068-01-01", "1969-01-01", "1999-01-01")
+
+
+def test_four_digit_years_are_not_pivoted():
+    assert_dates(parse_dates(pd.Series(["01-01-1968", "01-01-2069"])), "1968-01-01", "2069-01-01")
+
+
+def test_not_after_moves_future_two_digit_years_back_a_century():
+    valuation_date = pd.Timestamp("2024-12-31")
+    parsed = parse_dates(pd.Series(["15-06-60", "31-12-24", "01-01-25"]), valuation_date)
+    assert_dates(parsed, "1960-06-15", "2024-12-31", "1925-01-01")
+
+
+def test_not_after_leaves_four_digit_years():
+    parsed = parse_dates(pd.Series(["11-05-2030"]), pd.Timestamp("2024-12-31"))
+    assert_dates(parsed, "2030-05-11")
+
+
+# ---------------------------------------------------------------------------
+# add_months
+# ---------------------------------------------------------------------------
+
+@pytest.mark.parametrize("start, months, expected", [
+    ("2024-01-31", 1, "2024-02-29"),
+    ("2023-01-31", 1, "2023-02-28"),
+    ("2024-03-31", -1, "2024-02-29"),
+    ("2024-05-31", 1, "2024-06-30"),
+    ("2024-02-29", 12, "2025-02-28"),
+    ("2024-01-15", 240, "2044-01-15"),
+])
+def test_add_months_clamps_to_month_end(start, months, expected):
+    assert_dates(add_months(dates(start), np.array([months])), expected)
+
+
+def test_add_months_matches_date_offset():
+    start = dates("2024-01-31", "2023-08-31 06:30", "2020-02-29")
+    months, days = np.array([1, 6, 48]), np.array([-1, 0, 1])
+    expected = [s + pd.DateOffset(months=int(m), days=int(d)) for s, m, d in zip(start, months, days)]
+    assert list(pd.Series(add_months(start, months, days))) == expected
+
+
+def test_add_months_keeps_missing_start():
+    result = add_months(np.array(["NaT", "2024-01-31"], dtype="datetime64[ns]"), np.array([1, 1]))
+    assert np.isnat(result[0])
+    assert_dates(result[1:], "2024-02-29")
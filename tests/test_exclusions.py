@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from valuation.engine import run_pipeline
+from valuation.exclusions import (GROUP, MATURED, NO_START_DATE, NOT_COMMENCED, REASONS, RETAINED, STATUS, maturity_dates,
+                                  plan_exclusions)
+from valuation.numbers import to_numeric
+
+
+VALUATION_DATE = pd.Timestamp("2024-12-31")
+
+
+def dates(*values):
+    return pd.Series(pd.to_datetime(list(values), format="ISO8601"))
+
+
+# ---------------------------------------------------------------------------
+# Step 6 maturity dates
+# ---------------------------------------------------------------------------
+
+@pytest.mark.parametrize("start, months, expected", [
+    ("2014-01-15", 120, "2024-01-15"),
+    ("2023-03-31", 11, "2024-02-29"),
+    ("2020-01-31", 13.5, "2021-03-15"),  # 13 months, then half a month as 15 days
+    ("2024-06-30", 0.25, "2024-07-07"),  # 7.5 days, truncated
+])
+def test_start_date_plus_term(start, months, expected):
+    maturity, error = maturity_dates(dates(start), pd.Series([months]))
+    assert list(maturity) == list(dates(expected))
+    assert not error.any()
+
+
+def test_missing_term_or_start_date_is_an_error():
+    start = dates("2020-01-01", "2020-01-01", "2020-01-01", None)
+    term = to_numeric(pd.Series(["", "0", "abc", "12"]))
+    maturity, error = maturity_dates(start, term)
+    assert list(error) == [True, True, True, True]
+    assert maturity.isna().all()
+
+
+def test_maturity_errors_are_flagged_not_excluded():
+    input_df = pd.DataFrame({
+        'Policy Number': ["matured", "in force", "blank term", "zero term"],
+        'Policy Start Date': ["15-01-14", "15-01-20", "15-01-20", "15-01-20"],
+        'Policy Term (Months)': ["120", "120", "", "0"],
+    })
+    plan = plan_exclusions(input_df, [], VALUATION_DATE)
+    assert list(plan.maturity_policies['Policy Number']) == ["matured"]
+    assert list(plan.maturity_error_policies['Policy Number']) == ["blank term", "zero term"]
+    assert list(plan.filtered_df['Policy Number']) == ["in force", "blank term", "zero term"]
+    assert list(plan.maturity_policies['Maturity Date']) == list(dates("2024-01-15"))
+    assert np.array_equal(plan.maturity_error, [False, False, True, True])
+
+
+# ---------------------------------------------------------------------------
+# Exclusion plan (Steps 4-7)
+# ---------------------------------------------------------------------------
+
+# Columns Step 8 reads besides the ones the exclusion steps use, left blank
+STEP_8_COLUMNS = ['Plan Code', 'DOB (Life 1)', 'Gender (Life 1)', 'DOB (Life 2)', 'Gender (Life 2)', 'Single Premium',
+                  'Currency', 'Loan Amount (Death Benefit) -Life 1', 'Interest Type', 'Fixed Interest',
+                  'Current AWPLR', 'Additional AWPLR', 'TPD Option  - Life 1', 'TPD Option  - Life 2']
+
+
+def one_policy_per_reason():
+    """One policy excluded by each step, one retained; named by the reason code expected for it."""
+    input_df = pd.DataFrame({
+        'Policy Number': ["GROUP", "NOT_COMMENCED", "NO_START_DATE", "MATURED", "STATUS", "RETAINED"],
+        'Product Code': ["MCR1", "P1", "P1", "P1", "P1", "P1"],
+        'Policy Start Date': ["15-01-20", "15-01-25", "", "15-01-14", "15-01-20", "15-01-20"],
+        'Policy Term (Months)': ["120", "120", "120", "120", "120", "120"],
+        'Policy Status': ["IN-FORCE", "IN-FORCE", "IN-FORCE", "IN-FORCE", "LAPSED", "IN-FORCE"],
+    })
+    return input_df.assign(**dict.fromkeys(STEP_8_COLUMNS, ""))
+
+
+def test_one_reason_per_policy():
+    plan = plan_exclusions(one_policy_per_reason(), ["MCR1"], VALUATION_DATE).with_status(["IN-FORCE"])
+    assert list(plan.reason) == [GROUP, NOT_COMMENCED, NO_START_DATE, MATURED, STATUS, RETAINED]
+    assert list(plan.group_policies['Policy Number']) == ["GROUP"]
+    assert list(plan.commencement_policies['Policy Number']) == ["NOT_COMMENCED"]
+    assert list(plan.maturity_policies['Policy Number']) == ["MATURED"]
+    assert list(plan.filtered_df['Policy Number']) == ["RETAINED"]
+
+
+def test_status_candidates_are_retained_until_a_status_is_selected():
+    plan = plan_exclusions(one_policy_per_reason(), ["MCR1"], VALUATION_DATE)
+    assert list(plan.filtered_df['Policy Number']) == ["STATUS", "RETAINED"]
+    assert plan.status_options() == ["LAPSED", "IN-FORCE"]
+
+
+def test_exclusion_summary():
+    input_df = one_policy_per_reason()
+    summary = plan_exclusions(input_df, ["MCR1"], VALUATION_DATE).with_status(["IN-FORCE"]).summary()
+    assert list(summary["code"]) == list(REASONS)
+    assert list(summary["policies"]) == [1] * len(REASONS)
+    assert list(summary["maturity errors"]) == [0] * len(REASONS)
+    assert summary["policies"].sum() == len(input_df)
+
+    result = run_pipeline(input_df, VALUATION_DATE, ["MCR1"], ["IN-FORCE"])
+    pd.testing.assert_frame_equal(result.exclusion_summary, summary)
+    assert len(result.output_df) == 1
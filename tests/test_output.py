@@ -0,0 +1,185 @@
+import pandas as pd
+import pytest
+
+from valuation.output import export_frame, process_data
+
+
+VALUATION_DATE = pd.Timestamp("2024-12-31")
+RI_COMPANY = {"1001": "SwissRe"}
+LOAN_TYPES = {"P1": "Housing", "P2": "Personal"}
+
+
+def extract():
+    """
+    Policies as the CSV reader gives them: text, missing where blank. Dates
+    are day-first with the day over 12 and two-digit years the original
+    parser and ``dates.CENTURY_PIVOT`` put in the same century.
+    """
+    return pd.DataFrame({
+        'Plan Code': ["PLAN07X", "PLAN25A", "XLAN11", "PLAN11Q"],
+        'Policy Number': ["1001", "A-22", "3003", "12.5"],
+        'Policy Start Date': ["15-06-24", "20-01-23", "", "0"],
+        'DOB (Life 1)': ["28-07-80 0:00", "", "13-05-90", "30-11-88"],
+        'Gender (Life 1)': ["Male", "F", "x", None],
+        'DOB (Life 2)': [None, "25-03-85", "", "31-10-82"],
+        'Gender (Life 2)': [None, "female", "m", None],
+        'Policy Term (Months)': ["120", "0", "", "-12"],
+        'Single Premium': ["1000", "200", "abc", ""],
+        'Currency': ["LKR", "USD", "EUR", "LKR"],
+        'Loan Amount (Death Benefit) -Life 1': ["500000", "1000", "", "abc"],
+        'Interest Type': ["Fixed", "Variable", "other", " variable "],
+        'Fixed Interest': ["12.5", "abc", "", ""],
+        'Current AWPLR': [None, "10", "", "9"],
+        'Additional AWPLR': [None, "1.5", "", ""],
+        'TPD Option  - Life 1': ["Yes", "No", "", "0"],
+        'TPD Option  - Life 2': [None, "yes", "No", "0"],
+        'Product Code': ["P1", "P2", "P9", "P1"],
+    })
+
+
+# ---------------------------------------------------------------------------
+# The original row-by-row rules (Series.apply / DataFrame.apply(axis=1))
+# ---------------------------------------------------------------------------
+
+def get_prophet_code(plan_code):
+    for prefix, code in [("PLAN07", "C_07MRP"), ("PLAN11", "C_11MICRO"), ("PLAN25", "C_25MRPTAKAFUL")]:
+        if str(plan_code).startswith(prefix):
+            return code
+    return "Error"
+
+
+def get_plan_no(plan_code):
+    for prefix, number in [("PLAN07", 7), ("PLAN11", 11), ("PLAN25", 25)]:
+        if str(plan_code).startswith(prefix):
+            return number
+    return "Error"
+
+
+def convert_policy_number(value):
+    try:
+        return int(value) if value.replace(".", "", 1).isdigit() else value
+    except:
+        return value
+
+
+def convert_date_to_8_digits(date):
+    if pd.isna(date) or str(date).strip() in ("", "0"):
+        return "Error"
+    date_obj = pd.to_datetime(date, errors='coerce')
+    if pd.isna(date_obj):
+        return "Error"
+    return int(f"{date_obj.year:04d}{date_obj.month:02d}{date_obj.day:02d}")
+
+
+def convert_date_to_8_digits2(date):
+    try:
+        date_obj = pd.to_datetime(date, errors='coerce')
+        return int(f"{date_obj.year:04d}{date_obj.month:02d}{date_obj.day:02d}")
+    except:
+        return 0
+
+
+def map_gender(gender):
+    if pd.isna(gender) or str(gender).strip() == "":
+        return "Error"
+    gender = str(gender).strip().lower()
+    if gender in ["male", "m"]:
+        return 0
+    elif gender in ["female", "f"]:
+        return 1
+    return "Error"
+
+
+def convert_policy_term(months):
+    if pd.isna(months) or str(months).strip() in ("", "0") or float(months) < 0 or months == 0:
+        return "Error"
+    return float(months) / 12
+
+
+def convert_to_number(value):
+    return float(value) if str(value).replace(".", "", 1).isdigit() else 0
+
+
+def calculate_single_prem(row):
+    single_premium = convert_to_number(row['Single Premium'])
+    if row['Currency'] == 'USD':
+        return single_premium * 450
+    elif row['Currency'] == 'LKR':
+        return single_premium
+    return 0
+
+
+def calculate_loan_amt_1(row):
+    amount = convert_to_number(row['Loan Amount (Death Benefit) -Life 1'])
+    if row['Currency'] == 'USD':
+        return amount * 450
+    elif row['Currency'] == 'LKR':
+        return amount
+    return "Error"
+
+
+def calculate_loan_int(row):
+    interest_type = str(row['Interest Type']).strip().lower()
+    if interest_type == "fixed":
+        return convert_to_number(row['Fixed Interest'])
+    elif interest_type == "variable":
+        return convert_to_number(row['Current AWPLR']) + convert_to_number(row['Additional AWPLR'])
+    return 0
+
+
+def calculate_tpd_decline(value, blank_value="Error"):
+    if pd.isna(value) or str(value).strip() in ("", "0"):
+        return blank_value
+    return {"yes": "N", "no": "Y"}.get(str(value).strip().lower(), blank_value)
+
+
+def baseline_fields(df):
+    """The fields the original ``process_data`` derived from the policy columns."""
+    return {
+        'PROPHET_CODE': df['Plan Code'].apply(get_prophet_code),
+        'PolNo': df['Policy Number'].apply(convert_policy_number),
+        'PLAN_NO': df['Plan Code'].apply(get_plan_no),
+        'COMM_DAT': df['Policy Start Date'].apply(convert_date_to_8_digits),
+        'BIRTH_DAT': df['DOB (Life 1)'].apply(convert_date_to_8_digits),
+        'SEX': df['Gender (Life 1)'].apply(map_gender),
+        'BIRTH_DAT2': df['DOB (Life 2)'].apply(convert_date_to_8_digits2),
+        'SEX2': df['Gender (Life 2)'].apply(map_gender),
+        'POL_TERM_Y': df['Policy Term (Months)'].apply(convert_policy_term),
+        'SINGLE_PREM': df.apply(calculate_single_prem, axis=1),
+        'LOAN_AMT_1': df.apply(calculate_loan_amt_1, axis=1),
+        'LOAN_INT_1': df.apply(calculate_loan_int, axis=1),
+        'TPD_DECLINE': df['TPD Option  - Life 1'].apply(calculate_tpd_decline),
+        'TPD_DECLINE2': df['TPD Option  - Life 2'].apply(calculate_tpd_decline, blank_value=0),
+        'RPR_COMPANY': df['Policy Number'].apply(lambda polno: RI_COMPANY.get(str(polno), "MunichRe")),
+        'LoanType': df['Product Code'].apply(lambda product_code: LOAN_TYPES.get(str(product_code), "Error")),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Columnar builder against the original rules
+# ---------------------------------------------------------------------------
+
+@pytest.fixture(scope="module")
+def exported():
+    return export_frame(process_data(extract(), VALUATION_DATE, RI_COMPANY, LOAN_TYPES))
+
+
+@pytest.mark.parametrize("name", list(baseline_fields(extract())))
+def test_field_matches_the_row_rule(exported, name):
+    assert list(exported[name]) == list(baseline_fields(extract())[name])
+
+
+def test_error_rows(exported):
+    output_df = exported
+    assert list(output_df['PROPHET_CODE']) == ["C_07MRP", "C_25MRPTAKAFUL", "Error", "C_11MICRO"]
+    assert list(output_df['COMM_DAT']) == [20240615, 20230120, "Error", "Error"]
+    assert list(output_df['SEX']) == [0, 1, "Error", "Error"]
+    assert list(output_df['LOAN_AMT_1']) == [500000.0, 450000.0, "Error", 0]
+
+
+def test_static_fields(exported):
+    output_df = exported
+    assert len(output_df.columns) == 43
+    assert list(output_df['SPCODE']) == [1] * 4
+    assert list(output_df['DOV_INDICATOR']) == ["M12_2024"] * 4
+    assert list(output_df['CHANNEL_CODE']) == ["Partnership"] * 4
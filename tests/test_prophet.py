@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from valuation.prophet import MpfWriter, omitted_rows, rpt_file_name, variable_types, write_mpf_files
+
+
+def output_frame():
+    """An exported frame: "Error" in C_07MRP's rows makes SEX and POL_TERM_Y object for the whole frame."""
+    return pd.DataFrame({
+        "SPCODE": [1, 1, 1, 1, 1],
+        "PROPHET_CODE": ["C_07MRP", "C_07MRP", "C_25MRPTAKAFUL", "C_25MRPTAKAFUL", "Error"],
+        "PolNo": ["A1", "A22", "B1", "B2", "C1"],
+        "SEX": pd.Series([0, "Error", 1, 0, 1], dtype=object),
+        "POL_TERM_Y": pd.Series(["Error", 2.5, 10.0, 1.5, 3.0], dtype=object),
+        "SEX2": pd.Series([pd.NA, pd.NA, pd.NA, pd.NA, 1], dtype="Int8"),
+    })
+
+
+def chunks(frame):
+    """The same rows as a streamed run produces them: each chunk typed from its own values."""
+    first = frame.iloc[:2].copy()
+    second = frame.iloc[2:].reset_index(drop=True)
+    second["SEX"] = second["SEX"].astype("Int8")
+    second["POL_TERM_Y"] = second["POL_TERM_Y"].astype("float64")
+    return [first, second]
+
+
+def rpt_lines(path):
+    with open(path, "rb") as f:
+        return f.read().split(b"\r\n")
+
+
+def test_types_come_from_the_file_rows():
+    frame = output_frame()
+    types = variable_types(frame[frame["PROPHET_CODE"] == "C_25MRPTAKAFUL"])
+    assert types == ["I", "T14", "T2", "I", "N", "N"]
+    assert variable_types(frame[frame["PROPHET_CODE"] == "C_07MRP"]) == ["I", "T7", "T3", "T5", "T5", "N"]
+
+
+def test_streamed_and_in_memory_files_match(tmp_path):
+    frame = output_frame()
+    in_memory = write_mpf_files(frame, tmp_path / "memory")
+
+    writer = MpfWriter(tmp_path / "streamed")
+    for chunk in chunks(frame):
+        writer.write(chunk)
+    streamed = writer.close()
+
+    assert [os.path.basename(path) for path in in_memory] == [rpt_file_name("C_07MRP"), rpt_file_name("C_25MRPTAKAFUL")]
+    for memory_path, streamed_path in zip(in_memory, streamed):
+        assert rpt_lines(memory_path) == rpt_lines(streamed_path)
+    assert rpt_lines(in_memory[1])[2] == b"VARIABLE_TYPES,T1,I,T14,T2,I,N,N"
+
+
+def test_rows_without_a_prophet_code_are_counted():
+    frame = output_frame()
+    assert omitted_rows(frame) == 1
+    assert omitted_rows(frame.assign(PROPHET_CODE=["C_07MRP", np.nan, "C_11MICRO", "C_11MICRO", "C_11MICRO"])) == 1
+
+
+def test_streamed_omitted_rows(tmp_path):
+    writer = MpfWriter(tmp_path)
+    for chunk in chunks(output_frame()):
+        writer.write(chunk)
+    writer.close()
+    assert writer.omitted == 1
+    assert writer.counts == {"C_07MRP": 2, "C_25MRPTAKAFUL": 2}
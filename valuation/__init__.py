@@ -0,0 +1,23 @@
+"""
+Valuation automation engine for the MRP / Micro / Takaful MP file.
+
+The Streamlit apps (``app.py``, ``app8.py``) are thin clients over this
+package; ``python -m valuation`` runs the same pipeline from the command line.
+"""
+from valuation.engine import (
+    PipelineResult,
+    apply_header,
+    preview_rows,
+    process_data,
+    read_extract,
+    read_projected,
+    read_raw,
+    run_pipeline,
+    run_pipeline_dates,
+    write_outputs,
+)
+from valuation.output import RULES, export_frame, invalid_counts, render_errors, rule_mask, validation_report
+from valuation.exclusions import ExclusionPlan, plan_exclusions, plan_exclusions_dates
+from valuation.instrument import RunLog, load_run_log, step
+from valuation.joins import ReferenceTable, reference_table
+from valuation.tables import load_fx_rates, load_mapping_tables, load_mrp_loan_type_dict, load_ri_company_dict, table_stats
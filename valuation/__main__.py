@@ -0,0 +1,3 @@
+from valuation.cli import main
+
+raise SystemExit(main())
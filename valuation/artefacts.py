@@ -0,0 +1,280 @@
+"""
+Process-wide cache of pipeline artefacts, shared by every session.
+
+One Streamlit server serves the whole team, and each session used to hold
+its own raw grid, extract, exclusion plan and output frame. The stage
+results now live here once, keyed by a content digest of the stage key:
+the SHA-256 of the uploaded bytes, then every parameter of every stage
+down to the one asked for (``key_digest``). Two users converting the same
+extract with the same choices get the same objects and share the work;
+a stage another session is computing is waited for, not run again.
+
+The cache has a byte budget. Over it, the least recently used artefacts
+leave memory: the large ones (``spill_bytes`` and up) are pickled to
+disk and loaded back on their next use, the rest are dropped and
+recomputed when needed. The spill directory has its own budget, also
+LRU. ``report`` lists every artefact with its size and where it is, for
+the admin view of the app.
+
+Sizes are what each artefact holds on its own (``artefact_bytes``); an
+extract sliced from a cached grid is counted in both.
+"""
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+SPILL_DIR = os.path.join(".cache", "artefacts")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+DEFAULT_MAX_DISK_BYTES = 8 * 1024 ** 3
+DEFAULT_SPILL_BYTES = 32 * 1024 ** 2
+
+MEMORY, DISK = "memory", "disk"
+
+
+def fingerprint(value):
+    """Stable text of a stage key: plain values by type and repr, tables and conversions by their content ``digest``."""
+    if isinstance(value, (tuple, list)):
+        return "(" + ",".join(fingerprint(item) for item in value) + ")"
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{fingerprint(key)}:{fingerprint(item)}" for key, item in sorted(value.items(), key=repr)) + "}"
+    if hasattr(value, "digest"):
+        return f"{type(value).__name__}#{value.digest}"
+    return f"{type(value).__name__}:{value!r}"
+
+
+def key_digest(key):
+    return hashlib.sha256(fingerprint(key).encode()).hexdigest()
+
+
+def artefact_bytes(value):
+    """Bytes held by a stage result: frames deep, arrays by size; objects may report their own ``memory_usage()``."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list)):
+        return sum(artefact_bytes(item) for item in value)
+    if hasattr(value, "memory_usage"):
+        return int(value.memory_usage())
+    return 0
+
+
+@dataclass
+class Entry:
+    stage: str
+    bytes: int
+    value: object = None
+    path: str = None
+    hits: int = 0
+    created: float = 0.0
+    used: float = 0.0
+
+    @property
+    def location(self):
+        return MEMORY if self.path is None else DISK
+
+
+class ArtefactCache:
+    """
+    Artefacts by key digest, at most ``max_bytes`` in memory (LRU); the
+    evicted ones of ``spill_bytes`` and up are kept in ``directory``, at
+    most ``max_disk_bytes`` of them.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, directory=SPILL_DIR, max_disk_bytes=DEFAULT_MAX_DISK_BYTES,
+                 spill_bytes=DEFAULT_SPILL_BYTES):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.spill_bytes = spill_bytes
+        self._entries = OrderedDict()  # least recently used first
+        self._computing = {}
+        self._lock = threading.Lock()
+        self._directory_lock = threading.Lock()
+        self._directory_ready = False
+        self.hits = 0
+        self.misses = 0
+        self.spills = 0
+        self.evictions = 0
+
+    def get_or_compute(self, digest, stage, func, *args):
+        """
+        The artefact under ``digest``; computed with ``func(*args)`` and
+        stored if there is none. Returns (value, whether it was cached).
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(digest)
+                if entry is not None and entry.path is None:
+                    self._entries.move_to_end(digest)
+                    entry.hits += 1
+                    entry.used = time.time()
+                    self.hits += 1
+                    return entry.value, True
+                pending = self._computing.get(digest)
+                if pending is None:
+                    # This call loads (spilled) or computes it; others wait for it
+                    path = entry.path if entry is not None else None
+                    if path is not None:
+                        self.hits += 1
+                    else:
+                        self.misses += 1
+                    pending = self._computing[digest] = threading.Event()
+                    break
+            pending.wait()
+
+        try:
+            value = None
+            if path is not None:
+                try:
+                    with open(path, "rb") as f:
+                        value = pickle.load(f)
+                except Exception:
+                    path = None
+            if path is None:
+                value = func(*args)
+            self.put(digest, stage, value)
+            if path is not None:
+                os.remove(path)
+        finally:
+            with self._lock:
+                self._computing.pop(digest, None)
+            pending.set()
+        return value, path is not None
+
+    def remeasure(self):
+        """Re-measure the artefacts that grow after they are stored (exclusion plans select their frames on demand)."""
+        with self._lock:
+            growing = [entry for entry in self._entries.values()
+                       if entry.path is None and not isinstance(entry.value, (pd.DataFrame, pd.Series, np.ndarray, tuple, list))
+                       and hasattr(entry.value, "memory_usage")]
+        for entry in growing:
+            entry.bytes = artefact_bytes(entry.value)
+
+    def put(self, digest, stage, value):
+        now = time.time()
+        entry = Entry(stage, artefact_bytes(value), value, created=now, used=now)
+        self.remeasure()
+        with self._lock:
+            previous = self._entries.pop(digest, None)
+            if previous is not None:
+                entry.hits, entry.created = previous.hits + (previous.path is not None), previous.created
+            self._entries[digest] = entry
+            spill = self._evict()
+        for evicted_digest, evicted in spill:
+            self._spill(evicted_digest, evicted)
+
+    def _evict(self):
+        """Take the least recently used artefacts out of memory until under budget; returns the ones to spill."""
+        spill = []
+        in_memory = sum(entry.bytes for entry in self._entries.values() if entry.path is None)
+        for digest, entry in list(self._entries.items()):
+            if in_memory <= self.max_bytes:
+                break
+            if entry.path is not None or digest in self._computing:
+                continue
+            in_memory -= entry.bytes
+            if entry.bytes >= self.spill_bytes and self.max_disk_bytes:
+                spill.append((digest, Entry(entry.stage, entry.bytes, entry.value, hits=entry.hits,
+                                            created=entry.created, used=entry.used)))
+            del self._entries[digest]
+            self.evictions += 1
+        return spill
+
+    def _spill(self, digest, entry):
+        try:
+            self._prepare_directory()
+            path = os.path.join(self.directory, f"{digest}.pkl")
+            # Write under a temporary name so a concurrent load never sees half a file
+            temporary = os.path.join(self.directory, f".{uuid.uuid4().hex}.tmp")
+            with open(temporary, "wb") as f:
+                pickle.dump(entry.value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, path)
+            size = os.path.getsize(path)
+        except Exception:
+            return
+        # On disk an artefact counts its file (a pickled plan includes the extract it was made from)
+        entry.value, entry.path, entry.bytes = None, path, size
+        with self._lock:
+            if digest in self._entries:
+                # Recomputed in the meantime; the memory copy wins
+                os.remove(path)
+                return
+            self._entries[digest] = entry
+            self._entries.move_to_end(digest, last=False)
+            self.spills += 1
+            removed = self._trim_disk()
+        for path in removed:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _prepare_directory(self):
+        with self._directory_lock:
+            if not self._directory_ready:
+                # Spilled files of an earlier process are not indexed here
+                shutil.rmtree(self.directory, ignore_errors=True)
+                os.makedirs(self.directory, exist_ok=True)
+                self._directory_ready = True
+
+    def _trim_disk(self):
+        on_disk = [(digest, entry) for digest, entry in self._entries.items() if entry.path is not None]
+        total = sum(entry.bytes for _, entry in on_disk)
+        removed = []
+        for digest, entry in sorted(on_disk, key=lambda item: item[1].used):
+            if total <= self.max_disk_bytes:
+                break
+            total -= entry.bytes
+            removed.append(entry.path)
+            del self._entries[digest]
+            self.evictions += 1
+        return removed
+
+    def clear(self):
+        with self._lock:
+            paths = [entry.path for entry in self._entries.values() if entry.path is not None]
+            self._entries.clear()
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def report(self):
+        """
+        One row per artefact, most recently used first: stage, bytes (in
+        memory, or of the spilled file), location, hits and age.
+        """
+        now = time.time()
+        self.remeasure()
+        with self._lock:
+            rows = [{"key": digest[:12], "stage": entry.stage, "bytes": entry.bytes, "location": entry.location,
+                     "hits": entry.hits, "age_s": round(now - entry.created, 1), "idle_s": round(now - entry.used, 1)}
+                    for digest, entry in reversed(self._entries.items())]
+        return pd.DataFrame(rows, columns=["key", "stage", "bytes", "location", "hits", "age_s", "idle_s"])
+
+    def stats(self):
+        self.remeasure()
+        with self._lock:
+            entries = list(self._entries.values())
+            return {"artefacts": len(entries),
+                    "bytes": sum(entry.bytes for entry in entries if entry.path is None),
+                    "disk_bytes": sum(entry.bytes for entry in entries if entry.path is not None),
+                    "max_bytes": self.max_bytes, "max_disk_bytes": self.max_disk_bytes,
+                    "hits": self.hits, "misses": self.misses, "spills": self.spills, "evictions": self.evictions}
+
+
+artefact_cache = ArtefactCache()
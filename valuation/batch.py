@@ -0,0 +1,144 @@
+"""
+Batch mode: many extracts (or a directory such as ``INPUT/``) in one run.
+
+Each extract is read and put through Steps 3-8 on its own, in a process
+pool, exactly as if it were converted alone; the per-file results are then
+merged in the order the files were given (directories in name order), so
+the consolidated outputs do not depend on the number of workers or on
+which file finishes first. The mapping and exchange rate tables are loaded
+once by the caller and sent to every worker.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from valuation import engine
+from valuation.exclusions import combine_summaries
+from valuation.prophet import MpfWriter
+
+
+EXTRACT_EXTENSIONS = (".csv", ".xlsx")
+
+
+def extract_paths(paths):
+    """
+    The extracts named by ``paths``: files as given, directories expanded to
+    their CSV and Excel files in name order. Each file is listed once.
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(name for name in os.listdir(path)
+                           if name.lower().endswith(EXTRACT_EXTENSIONS) and not name.startswith("~$"))
+            found.extend(os.path.join(path, name) for name in names)
+        else:
+            found.append(path)
+    return list(dict.fromkeys(found))
+
+
+@dataclass
+class FileResult:
+    """One extract's run. ``result`` is None when the file could not be processed (see ``error``)."""
+    path: str
+    rows: int = 0
+    result: engine.PipelineResult = None
+    error: str = None
+    seconds: float = 0.0
+
+
+def process_file(path, valuation_date, ignored_product_codes, selected_status,
+                 ri_company_dict=None, mrp_loan_type_dict=None, header_row=None, projected=False, conversion=None):
+    """
+    Read one extract and run Steps 4-8 on it (the worker of ``run_batch``).
+    The input and filtered frames are not sent back, only their columns.
+    """
+    start = time.perf_counter()
+    try:
+        input_df = engine.read_projected(path, header_row) if projected else engine.read_extract(path, header_row)
+        result = engine.run_pipeline(input_df, valuation_date, ignored_product_codes, selected_status,
+                                     ri_company_dict, mrp_loan_type_dict, conversion)
+    except Exception as e:
+        return FileResult(path, error=str(e), seconds=time.perf_counter() - start)
+    result.input_df = input_df.iloc[:0]
+    result.filtered_df = result.filtered_df.iloc[:0]
+    return FileResult(path, len(input_df), result, seconds=time.perf_counter() - start)
+
+
+@dataclass
+class BatchResult:
+    """Per-file results, in input order, and their merged outputs."""
+    files: list = field(default_factory=list)
+
+    @property
+    def failed(self):
+        return [file for file in self.files if file.error is not None]
+
+    def merged(self):
+        """One PipelineResult whose frames are the per-file frames stacked in input order."""
+        results = [file.result for file in self.files if file.result is not None]
+
+        def stack(attribute):
+            return pd.concat([getattr(result, attribute) for result in results], ignore_index=True)
+
+        timings = {}
+        unmatched = {}
+        for result in results:
+            for step, seconds in result.timings.items():
+                timings[step] = timings.get(step, 0.0) + seconds
+            for name, count in result.unmatched.items():
+                unmatched[name] = unmatched.get(name, 0) + count
+        output_df = stack("output_df")
+        output_df.attrs[engine.UNMATCHED_ATTR] = unmatched
+        return engine.PipelineResult(stack("input_df"), stack("group_policies"), stack("commencement_policies"),
+                                     stack("maturity_policies"), stack("maturity_error_policies"),
+                                     stack("filtered_df"), output_df, timings,
+                                     combine_summaries(result.exclusion_summary for result in results))
+
+
+def run_batch(paths, valuation_date, ignored_product_codes, selected_status,
+              ri_company_dict=None, mrp_loan_type_dict=None, header_row=None, projected=False, workers=None,
+              conversion=None):
+    """
+    Process every extract in ``paths`` (see ``extract_paths``) with up to
+    ``workers`` processes (default: one per CPU; 1 runs them in this process).
+    """
+    files = extract_paths(paths)
+    if not files:
+        raise ValueError("No CSV or Excel extracts found.")
+    args = (valuation_date, ignored_product_codes, selected_status, ri_company_dict, mrp_loan_type_dict, header_row, projected,
+            conversion)
+    workers = min(workers or os.cpu_count() or 1, len(files))
+    if workers == 1:
+        return BatchResult([process_file(path, *args) for path in files])
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Results are collected in submission order, whatever order the files finish in
+        futures = [executor.submit(process_file, path, *args) for path in files]
+        return BatchResult([future.result() for future in futures])
+
+
+def write_batch_outputs(batch, output_dir, error_values=True):
+    """
+    Write the consolidated MP file, model point files and exclusion files
+    (the files ``engine.write_outputs`` writes for one extract) into
+    ``output_dir``. The model point files are written file by file, so
+    every value is formatted as in that file's own run.
+    """
+    merged = batch.merged()
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    for file_name, frame in [(engine.OUTPUT_FILE, engine.export_frame(merged.output_df, error_values))] + merged.exclusion_files():
+        if frame.empty and file_name in (engine.MATURITY_FILE, engine.MATURITY_ERROR_FILE):
+            continue
+        path = os.path.join(output_dir, file_name)
+        frame.to_excel(path, index=False)
+        written.append(path)
+
+    mpf = MpfWriter(output_dir)
+    for file in batch.files:
+        if file.result is not None:
+            mpf.write(engine.export_frame(file.result.output_df, error_values))
+    written.extend(mpf.close())
+    return written
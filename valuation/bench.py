@@ -0,0 +1,326 @@
+"""
+Benchmarks of every pipeline step on synthetic extracts.
+
+Each extract size is generated once (``valuation.synthetic``, kept in
+``--data-dir``) and then run through the steps the app runs, one at a
+time: ingest, header detection, header apply, the Steps 4-6 plan with
+Steps 4, 5 and 6 as its parts, Step 7, Step 8 and every export. Each
+step reports its wall time, CPU time, rows, rows per second and the peak
+RSS of the process while it ran (measured by ``valuation.instrument``).
+The results are written as JSON, with the git commit and library
+versions, and ``--compare`` sets them against the JSON of an earlier
+version::
+
+    python -m valuation.bench --rows 10k 100k 1m --output bench.json
+    git checkout other-branch
+    python -m valuation.bench --rows 10k 100k 1m --output other.json --compare bench.json
+
+The peak RSS is exact on Linux, where the high-water mark can be reset
+before each step. Elsewhere it is the peak of the whole process so far
+(``peak_reset`` is false in the JSON), so only growth shows.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import date, datetime
+from io import BytesIO
+
+from valuation import engine, fx, instrument, prophet, synthetic
+from valuation.cli import load_table, parse_date
+from valuation.joins import reference_table
+from valuation.output import export_frame, process_data
+
+
+FORMAT_VERSION = 1
+DATA_DIR = os.path.join(".cache", "bench")
+
+VALUATION_DATE = date(2024, 12, 31)
+IGNORED_PRODUCT_CODES = ["PLAN07_V3", "PLAN11_V2"]
+SELECTED_STATUS = ["IN-FORCE"]
+
+# openpyxl takes minutes on millions of rows; larger frames skip the xlsx exports
+XLSX_MAX_ROWS = 200_000
+
+
+# ---------------------------------------------------------------------------
+# Measuring
+# ---------------------------------------------------------------------------
+
+class Recorder:
+    """Stage measurements of one extract, over ``repeat`` runs: the fastest time and the highest peak are kept."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def measure(self, stage, func, *args, rows=len, parts=False):
+        """
+        Run ``func(*args)`` as ``stage``; ``rows(value)`` counts the rows it
+        produced. With ``parts``, the engine's own steps inside it are
+        recorded as stages too (rows are those they evaluated). Returns the
+        value.
+        """
+        gc.collect()
+        # The engine's own steps inside are parts of this one, so their peaks count here
+        with instrument.step(stage) as step:
+            value = func(*args)
+        self.record(stage, rows(value), step.wall_s, step.cpu_s, step.peak_rss, step.start_rss, step.peak_exact)
+        if parts:
+            for part in instrument.merged(step.parts):
+                self.record(part.step, part.rows_in, part.wall_s, part.cpu_s, part.peak_rss, part.start_rss,
+                            part.peak_exact, part.rows_out)
+        return value
+
+    def record(self, stage, rows, seconds, cpu_seconds, peak, before, reset, rows_out=None):
+        entry = self.stages.setdefault(stage, {"stage": stage, "rows": rows, "rows_out": rows_out, "seconds": None,
+                                               "times": [], "cpu_s": None, "rows_per_s": None, "peak_rss": None,
+                                               "start_rss": before, "peak_reset": reset})
+        entry["times"].append(round(seconds, 6))
+        entry["seconds"] = min(entry["times"])
+        entry["cpu_s"] = round(cpu_seconds if entry["cpu_s"] is None else min(entry["cpu_s"], cpu_seconds), 6)
+        entry["rows_per_s"] = round(rows / entry["seconds"]) if entry["seconds"] else None
+        if peak is not None:
+            entry["peak_rss"] = max(entry["peak_rss"] or 0, peak)
+
+    def skip(self, stage, rows, reason):
+        self.stages.setdefault(stage, {"stage": stage, "rows": rows, "skipped": reason})
+
+    def results(self):
+        return list(self.stages.values())
+
+
+def status_step(plan, selected_status):
+    """Step 7 as the app runs it: the status selection and the retained frame."""
+    plan = plan.with_status(selected_status)
+    plan.filtered_df
+    return plan
+
+
+def csv_bytes(frame):
+    buffer = BytesIO()
+    frame.to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+
+def run_steps(recorder, path, settings, tables, xlsx_max_rows=XLSX_MAX_ROWS):
+    """One pass over every step of the app on the extract at ``path``."""
+    ri_company_dict, mrp_loan_type_dict, conversion = tables
+    valuation_date = settings["valuation_date"]
+
+    grid = recorder.measure("ingest", engine.read_raw, path)
+    header_row = recorder.measure("header_detection", engine.find_header_row, grid, rows=lambda _: len(grid))
+    input_df = recorder.measure("header_apply", engine.apply_header, grid, header_row)
+    del grid
+
+    # Steps 4, 5 and 6 are timed as the parts of the one plan that evaluates them
+    plan = recorder.measure("steps_4_6_plan", engine.plan_exclusions, input_df, settings["ignored_product_codes"],
+                            valuation_date, rows=lambda _: len(input_df), parts=True)
+    plan = recorder.measure("step_7_status", status_step, plan, settings["selected_status"],
+                            rows=lambda plan: len(plan.filtered_df))
+    output_df = recorder.measure("step_8_process_data", process_data, plan.filtered_df, valuation_date,
+                                 ri_company_dict, mrp_loan_type_dict, conversion)
+
+    rendered = recorder.measure("export_render", export_frame, output_df, True)
+    recorder.measure("export_output_csv", csv_bytes, rendered, rows=lambda _: len(rendered))
+    recorder.measure("export_mpf_zip", prophet.mpf_zip_bytes, rendered, rows=lambda _: len(rendered))
+    exports = [("export_output_xlsx", rendered), ("export_group_xlsx", plan.group_policies),
+               ("export_commencement_xlsx", plan.commencement_policies), ("export_maturity_xlsx", plan.maturity_policies),
+               ("export_maturity_error_xlsx", plan.maturity_error_policies)]
+    for stage, frame in exports:
+        if len(frame) > xlsx_max_rows:
+            recorder.skip(stage, len(frame), f"more than {xlsx_max_rows} rows")
+            continue
+        recorder.measure(stage, engine.to_excel_bytes, frame, rows=lambda _, frame=frame: len(frame))
+
+
+# ---------------------------------------------------------------------------
+# Runs
+# ---------------------------------------------------------------------------
+
+def extract_path(data_dir, rows, seed):
+    return os.path.join(data_dir, f"NB_MIS_12HNB_{synthetic.size_name(rows)}_seed{seed}.csv")
+
+
+def ensure_extract(data_dir, rows, seed):
+    """The synthetic extract of ``rows`` policies, written on first use."""
+    path = extract_path(data_dir, rows, seed)
+    if not os.path.exists(path):
+        print(f"Generating {rows:,} policies into {path}", file=sys.stderr)
+        # Written under a temporary name so an interrupted run leaves no partial extract behind
+        temporary = path + ".tmp.csv"
+        synthetic.write_extract(temporary, rows, seed)
+        os.replace(temporary, path)
+    return path
+
+
+def git_commit():
+    """HEAD of the working tree and whether it has uncommitted changes, or None outside a git checkout."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, capture_output=True,
+                                text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return {"commit": commit, "dirty": bool(status.strip())}
+
+
+def environment():
+    versions = {}
+    for name in ("pandas", "numpy", "pyarrow", "openpyxl"):
+        try:
+            versions[name] = __import__(name).__version__
+        except ImportError:
+            versions[name] = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "libraries": versions, "git": git_commit()}
+
+
+def load_tables(args):
+    ri_company_dict = reference_table(load_table(engine.load_ri_company_dict, args.ri_company_table, "RI_Company"),
+                                      engine.RI_COMPANY_DEFAULT)
+    mrp_loan_type_dict = reference_table(load_table(engine.load_mrp_loan_type_dict, args.loan_type_table, "MRP_LOAN_TYPE"),
+                                         engine.LOAN_TYPE_DEFAULT)
+    fx_rates = load_table(engine.load_fx_rates, args.fx_rate_table, "FX_RATE")
+    return ri_company_dict, mrp_loan_type_dict, fx.Conversion(fx_rates, fx.TABLE)
+
+
+def run_benchmarks(sizes, settings, tables, data_dir=DATA_DIR, seed=0, repeat=1, xlsx_max_rows=XLSX_MAX_ROWS):
+    """{"size", "rows", "file", "file_bytes", "stages"} per extract size."""
+    runs = []
+    for rows in sizes:
+        path = ensure_extract(data_dir, rows, seed)
+        recorder = Recorder()
+        for _ in range(repeat):
+            run_steps(recorder, path, settings, tables, xlsx_max_rows)
+        runs.append({"size": synthetic.size_name(rows), "rows": rows, "file": path, "file_bytes": os.path.getsize(path),
+                     "stages": recorder.results()})
+    return runs
+
+
+def benchmark_report(runs, settings, seed, repeat, xlsx_max_rows):
+    return {
+        "format": FORMAT_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "settings": {"valuation_date": settings["valuation_date"].isoformat(),
+                     "ignored_product_codes": list(settings["ignored_product_codes"]),
+                     "selected_status": list(settings["selected_status"]),
+                     "seed": seed, "repeat": repeat, "xlsx_max_rows": xlsx_max_rows},
+        "runs": runs,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Output
+# ---------------------------------------------------------------------------
+
+def megabytes(value):
+    return f"{value / 1024 ** 2:,.0f}" if value is not None else "-"
+
+
+def print_runs(runs):
+    for run in runs:
+        print(f"{run['size']} ({run['rows']:,} policies, {megabytes(run['file_bytes'])} MB file)")
+        print(f"  {'stage':<28}{'rows':>10}{'seconds':>10}{'rows/s':>13}{'peak MB':>10}")
+        for stage in run["stages"]:
+            if "skipped" in stage:
+                print(f"  {stage['stage']:<28}{stage['rows']:>10,}  skipped: {stage['skipped']}")
+                continue
+            rate = f"{stage['rows_per_s']:,}" if stage["rows_per_s"] is not None else "-"
+            print(f"  {stage['stage']:<28}{stage['rows']:>10,}{stage['seconds']:>10.3f}{rate:>13}"
+                  f"{megabytes(stage['peak_rss']):>10}")
+
+
+def compare_runs(runs, previous):
+    """
+    Rows of (size, stage, previous seconds, seconds, time ratio, previous
+    peak, peak) for the stages both results measured.
+    """
+    earlier = {(run["size"], stage["stage"]): stage for run in previous["runs"] for stage in run["stages"]}
+    rows = []
+    for run in runs:
+        for stage in run["stages"]:
+            before = earlier.get((run["size"], stage["stage"]))
+            if before is None or "skipped" in stage or "skipped" in before:
+                continue
+            ratio = stage["seconds"] / before["seconds"] if before["seconds"] else None
+            rows.append((run["size"], stage["stage"], before["seconds"], stage["seconds"], ratio,
+                         before["peak_rss"], stage["peak_rss"]))
+    return rows
+
+
+def print_comparison(rows, previous):
+    git = (previous.get("environment") or {}).get("git") or {}
+    print(f"Compared with {git.get('commit', 'an earlier run')[:12]} ({previous.get('created', '?')}); "
+          f"ratio > 1 is slower")
+    print(f"  {'size':<6}{'stage':<28}{'before s':>10}{'now s':>10}{'ratio':>8}{'before MB':>11}{'now MB':>9}")
+    for size, stage, before, now, ratio, peak_before, peak in rows:
+        shown = f"{ratio:.2f}" if ratio is not None else "-"
+        print(f"  {size:<6}{stage:<28}{before:>10.3f}{now:>10.3f}{shown:>8}{megabytes(peak_before):>11}{megabytes(peak):>9}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m valuation.bench",
+                                     description="Time every pipeline step on synthetic NB_MIS_12HNB extracts.")
+    parser.add_argument("--rows", nargs="+", default=["10k", "100k"], metavar="SIZE",
+                        help=f"Extract sizes: {', '.join(synthetic.SIZES)} or counts such as 250k (default: 10k 100k)")
+    parser.add_argument("--output", default=None, metavar="JSON", help="Write the results to this JSON file")
+    parser.add_argument("--compare", default=None, metavar="JSON", help="Compare with the results of an earlier run")
+    parser.add_argument("--data-dir", default=DATA_DIR,
+                        help="Directory of the generated extracts, reused between runs (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated extracts (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=1, metavar="N",
+                        help="Runs per size; the fastest time of each step is reported (default: %(default)s)")
+    parser.add_argument("--xlsx-max-rows", type=int, default=XLSX_MAX_ROWS, metavar="ROWS",
+                        help="Skip the xlsx exports of larger frames (default: %(default)s)")
+    parser.add_argument("--valuation-date", type=parse_date, default=VALUATION_DATE, metavar="DATE",
+                        help="Valuation date (YYYY-MM-DD, default: %(default)s)")
+    parser.add_argument("--ignore-product-code", action="append", default=None, metavar="CODE",
+                        help=f"Group MCR product code to ignore (repeatable, default: {' '.join(IGNORED_PRODUCT_CODES)})")
+    parser.add_argument("--status", action="append", default=None, metavar="STATUS",
+                        help=f"Policy status to include (repeatable, default: {' '.join(SELECTED_STATUS)})")
+    parser.add_argument("--ri-company-table", default=engine.RI_COMPANY_PATH)
+    parser.add_argument("--loan-type-table", default=engine.MRP_LOAN_TYPE_PATH)
+    parser.add_argument("--fx-rate-table", default=engine.FX_RATE_PATH)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        sizes = [synthetic.parse_rows(value) for value in args.rows]
+    except ValueError as e:
+        parser.error(str(e))
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    previous = None
+    if args.compare:
+        try:
+            with open(args.compare) as f:
+                previous = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading {args.compare}: {e}", file=sys.stderr)
+            return 1
+
+    settings = {"valuation_date": args.valuation_date,
+                "ignored_product_codes": args.ignore_product_code or IGNORED_PRODUCT_CODES,
+                "selected_status": args.status or SELECTED_STATUS}
+    runs = run_benchmarks(sizes, settings, load_tables(args), args.data_dir, args.seed, args.repeat, args.xlsx_max_rows)
+    print_runs(runs)
+    if previous is not None:
+        print_comparison(compare_runs(runs, previous), previous)
+    if args.output:
+        report = benchmark_report(runs, settings, args.seed, args.repeat, args.xlsx_max_rows)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""
+Command-line entry point for the MP file pipeline.
+
+Example::
+
+    python -m valuation "INPUT/NB_MIS_12HNB.csv" --valuation-date 2024-12-31 \\
+        --ignore-product-code PLAN07_V1 --status IN-FORCE --output-dir OUTPUT/M12_2024
+
+Several extracts, or a directory of them, run as one batch with merged outputs::
+
+    python -m valuation INPUT/ --valuation-date 2024-12-31 --status IN-FORCE --workers 4
+
+Several valuation dates in one pass, one output directory per DOV (M12_2024, M3_2025)::
+
+    python -m valuation "INPUT/NB_MIS_12HNB.csv" --valuation-date 2024-12-31 --valuation-date 2025-03-31 \\
+        --status IN-FORCE --output-dir OUTPUT
+
+Every run appends its steps (wall and CPU time, rows, peak memory) to
+the run log, LOGS/run_log.jsonl by default (``valuation.instrument``).
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+from valuation import batch, engine, exclusions, fx, instrument, streaming
+from valuation.joins import reference_table
+from valuation.output import generate_dov_indicator
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m valuation", description="Generate the MRP/Micro/Takaful MP file from an NB_MIS_12HNB extract.")
+    parser.add_argument("extract", nargs="+",
+                        help="Path to the extract (CSV or Excel); several extracts or a directory are run as one batch")
+    parser.add_argument("--valuation-date", required=True, type=parse_date, action="append", metavar="DATE",
+                        help="Valuation date (YYYY-MM-DD); repeat it to value the extract at several dates, "
+                             "writing the outputs of each into a DOV subdirectory of the output directory")
+    parser.add_argument("--header-row", type=int, default=None,
+                        help="Header row, as in Step 3 of the app (default: detected from the report layout)")
+    parser.add_argument("--ignore-product-code", action="append", default=[], metavar="CODE",
+                        help="Group MCR product code to ignore (repeatable)")
+    parser.add_argument("--status", action="append", default=[], required=True, metavar="STATUS",
+                        help="Policy status to include (repeatable)")
+    parser.add_argument("--output-dir", default="OUTPUT", help="Directory for the MP file and exclusion files (default: OUTPUT)")
+    parser.add_argument("--ri-company-table", default=engine.RI_COMPANY_PATH)
+    parser.add_argument("--loan-type-table", default=engine.MRP_LOAN_TYPE_PATH)
+    parser.add_argument("--ri-company-default", default=engine.RI_COMPANY_DEFAULT, metavar="COMPANY",
+                        help="RPR_COMPANY of policies not in the RI_Company table (default: %(default)s)")
+    parser.add_argument("--loan-type-default", default=engine.LOAN_TYPE_DEFAULT, metavar="TYPE",
+                        help="LoanType of product codes not in the MRP_LOAN_TYPE table (default: %(default)s)")
+    parser.add_argument("--fx-rate-table", default=engine.FX_RATE_PATH,
+                        help="Exchange rates by currency and effective date (default: %(default)s)")
+    parser.add_argument("--fx-rate-source", choices=fx.RATE_SOURCES, default=fx.TABLE,
+                        help="Rates for converting amounts to LKR: the rate table as of the valuation date (default), "
+                             "or the extract's Exchange Rate (Higher Rate) / (Current Rate) column")
+    parser.add_argument("--no-error-values", dest="error_values", action="store_false",
+                        help="Leave invalid fields blank in the MP file and model point files instead of writing \"Error\"")
+    parser.add_argument("--projected", action="store_true",
+                        help="Read only the columns the pipeline uses, typed (the exclusion files then hold only those columns)")
+    parser.add_argument("--chunk-size", type=int, default=None, metavar="ROWS",
+                        help="Stream the extract in chunks of this many rows, writing CSV instead of xlsx (bounded memory)")
+    parser.add_argument("--workers", type=int, default=None, metavar="N",
+                        help="Processes for a batch of extracts (default: one per CPU)")
+    parser.add_argument("--run-log", default=instrument.RUN_LOG_PATH, metavar="PATH",
+                        help="JSON lines file the timings and memory of the steps are appended to (default: %(default)s)")
+    parser.add_argument("--no-run-log", dest="run_log", action="store_const", const=None,
+                        help="Do not write the run log")
+    return parser
+
+
+def load_table(loader, path, label):
+    try:
+        return loader(path)
+    except Exception as e:
+        print(f"Warning: could not load {label} table ({e}); using defaults", file=sys.stderr)
+        return None
+
+
+def print_exclusions(summary):
+    """The exclusion reasons the step counts above do not show."""
+    policies = dict(zip(summary["code"], summary["policies"])) if summary is not None else {}
+    print(f"  no start date:          {policies.get(exclusions.NO_START_DATE, 0)}")
+    print(f"  status not selected:    {policies.get(exclusions.STATUS, 0)}")
+
+
+def print_unmatched(unmatched, indent="  "):
+    counts = ", ".join(f"{name} {count}" for name, count in unmatched.items())
+    print(f"{indent}not in reference tables: {counts}")
+
+
+def print_invalid(invalid, indent="  "):
+    counts = ", ".join(f"{rule} {count}" for rule, count in invalid.items()) or "none"
+    print(f"{indent}invalid fields: {counts}")
+
+
+def print_omitted(omitted, indent="  "):
+    """The MP file policies the .RPT files leave out."""
+    if omitted:
+        print(f"{indent}not in the .RPT files: {omitted} (no PROPHET_CODE)")
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    is_batch = len(args.extract) > 1 or os.path.isdir(args.extract[0])
+    if is_batch and args.chunk_size:
+        parser.error("--chunk-size streams one extract at a time")
+    if not is_batch:
+        args.extract = args.extract[0]
+    valuation_dates = args.valuation_date
+    if len(valuation_dates) > 1 and (is_batch or args.chunk_size):
+        parser.error("several valuation dates are supported for one extract, without --chunk-size")
+    args.valuation_date = valuation_dates[0]
+
+    run_log = instrument.RunLog("cli", extract=args.extract, valuation_dates=[str(d) for d in valuation_dates],
+                                status=args.status, chunk_size=args.chunk_size, projected=args.projected).start()
+    try:
+        return convert(args, valuation_dates, is_batch)
+    finally:
+        if run_log.finish(args.run_log):
+            print(f"  logged run {run_log.id} to {args.run_log}")
+
+
+def convert(args, valuation_dates, is_batch):
+    ri_company_dict = reference_table(load_table(engine.load_ri_company_dict, args.ri_company_table, "RI_Company"),
+                                      args.ri_company_default)
+    mrp_loan_type_dict = reference_table(load_table(engine.load_mrp_loan_type_dict, args.loan_type_table, "MRP_LOAN_TYPE"),
+                                         args.loan_type_default)
+    fx_rates = load_table(engine.load_fx_rates, args.fx_rate_table, "FX_RATE") if args.fx_rate_source == fx.TABLE else None
+    args.conversion = fx.Conversion(fx_rates, args.fx_rate_source)
+
+    if is_batch:
+        return main_batch(args, ri_company_dict, mrp_loan_type_dict)
+    if len(valuation_dates) > 1:
+        return main_dates(args, valuation_dates, ri_company_dict, mrp_loan_type_dict)
+    if args.chunk_size:
+        return main_streaming(args, ri_company_dict, mrp_loan_type_dict)
+
+    try:
+        with instrument.step("read") as record:
+            input_df = read_input(args)
+            record.rows_out = len(input_df)
+        read_time = record.wall_s
+
+        result = engine.run_pipeline(input_df, args.valuation_date, args.ignore_product_code, args.status,
+                                     ri_company_dict, mrp_loan_type_dict, args.conversion)
+
+        with instrument.step("write", len(result.output_df)) as record:
+            written = engine.write_outputs(result, args.output_dir, args.error_values)
+        write_time = record.wall_s
+    except Exception as e:
+        print(f"Error processing file: {e}", file=sys.stderr)
+        return 1
+
+    print(f"{os.path.basename(args.extract)}: {len(input_df)} policies read, {len(result.output_df)} written to the MP file")
+    print(f"  group MCR ignored:      {len(result.group_policies)}")
+    print(f"  commencement ignored:   {len(result.commencement_policies)}")
+    print(f"  matured ignored:        {len(result.maturity_policies)}")
+    print(f"  maturity errors:        {len(result.maturity_error_policies)}")
+    print_exclusions(result.exclusion_summary)
+    print_unmatched(result.unmatched)
+    print_invalid(result.invalid)
+    print_omitted(result.mpf_omitted)
+    print(f"  read {read_time:.2f}s, " + ", ".join(f"{k} {v:.2f}s" for k, v in result.timings.items()) + f", write {write_time:.2f}s")
+    for path in written:
+        print(f"  wrote {path}")
+    return 0
+
+
+def read_input(args):
+    if args.projected:
+        return engine.read_projected(args.extract, args.header_row)
+    return engine.read_extract(args.extract, args.header_row)
+
+
+def main_dates(args, valuation_dates, ri_company_dict, mrp_loan_type_dict):
+    start = time.perf_counter()
+    try:
+        input_df = read_input(args)
+        results = engine.run_pipeline_dates(input_df, valuation_dates, args.ignore_product_code, args.status,
+                                            ri_company_dict, mrp_loan_type_dict, args.conversion)
+    except Exception as e:
+        print(f"Error processing file: {e}", file=sys.stderr)
+        return 1
+    run_time = time.perf_counter() - start
+
+    print(f"{os.path.basename(args.extract)}: {len(input_df)} policies read, valued at {len(results)} dates ({run_time:.2f}s)")
+    for valuation_date, result in results.items():
+        dov = generate_dov_indicator(valuation_date)
+        try:
+            written = engine.write_outputs(result, os.path.join(args.output_dir, dov), args.error_values)
+        except Exception as e:
+            print(f"Error processing file: {e}", file=sys.stderr)
+            return 1
+        print(f"  {dov} ({valuation_date}): {len(result.output_df)} written to the MP file, "
+              f"{len(result.commencement_policies)} commencement ignored, {len(result.maturity_policies)} matured ignored, "
+              f"{len(result.maturity_error_policies)} maturity errors")
+        print_unmatched(result.unmatched, "    ")
+        print_invalid(result.invalid, "    ")
+        print_omitted(result.mpf_omitted, "    ")
+        for path in written:
+            print(f"    wrote {path}")
+    return 0
+
+
+def main_streaming(args, ri_company_dict, mrp_loan_type_dict):
+    try:
+        result = streaming.run_streaming(args.extract, args.output_dir, args.valuation_date, args.ignore_product_code, args.status,
+                                         ri_company_dict, mrp_loan_type_dict, args.header_row, chunk_size=args.chunk_size,
+                                         schema=engine.NB_MIS_12HNB_SCHEMA if args.projected else None,
+                                         conversion=args.conversion, error_values=args.error_values)
+    except Exception as e:
+        print(f"Error processing file: {e}", file=sys.stderr)
+        return 1
+
+    counts = result.counts
+    print(f"{os.path.basename(args.extract)}: {counts['input']} policies read in {result.chunks} chunks, {counts['output']} written to the MP file")
+    print(f"  group MCR ignored:      {counts['group']}")
+    print(f"  commencement ignored:   {counts['commencement']}")
+    print(f"  matured ignored:        {counts['maturity']}")
+    print(f"  maturity errors:        {counts['maturity_error']}")
+    print_exclusions(result.exclusion_summary)
+    print_unmatched(result.unmatched)
+    print_invalid(result.invalid)
+    print_omitted(counts["mpf_omitted"])
+    print("  " + ", ".join(f"{k} {v:.2f}s" for k, v in result.timings.items()))
+    for path in result.written:
+        print(f"  wrote {path}")
+    return 0
+
+
+def main_batch(args, ri_company_dict, mrp_loan_type_dict):
+    try:
+        # The extracts run in worker processes, measured here as one step
+        with instrument.step("run_batch") as record:
+            result = batch.run_batch(args.extract, args.valuation_date, args.ignore_product_code, args.status,
+                                     ri_company_dict, mrp_loan_type_dict, args.header_row, args.projected, args.workers,
+                                     args.conversion)
+            record.rows_in = sum(file.rows for file in result.files)
+            record.rows_out = sum(len(file.result.output_df) for file in result.files if file.result is not None)
+    except Exception as e:
+        print(f"Error processing files: {e}", file=sys.stderr)
+        return 1
+    run_time = record.wall_s
+
+    # A consolidated MP file missing an extract must not look complete
+    if result.failed:
+        for file in result.failed:
+            print(f"Error processing file {file.path}: {file.error}", file=sys.stderr)
+        print("No outputs written.", file=sys.stderr)
+        return 1
+
+    for file in result.files:
+        print(f"{os.path.basename(file.path)}: {file.rows} policies read, {len(file.result.output_df)} written to the MP file "
+              f"({file.seconds:.2f}s)")
+
+    try:
+        with instrument.step("write") as record:
+            written = batch.write_batch_outputs(result, args.output_dir, args.error_values)
+    except Exception as e:
+        print(f"Error processing files: {e}", file=sys.stderr)
+        return 1
+    write_time = record.wall_s
+
+    merged = result.merged()
+    print(f"{len(result.files)} extracts: {sum(file.rows for file in result.files)} policies read, "
+          f"{len(merged.output_df)} written to the MP file")
+    print(f"  group MCR ignored:      {len(merged.group_policies)}")
+    print(f"  commencement ignored:   {len(merged.commencement_policies)}")
+    print(f"  matured ignored:        {len(merged.maturity_policies)}")
+    print(f"  maturity errors:        {len(merged.maturity_error_policies)}")
+    print_exclusions(merged.exclusion_summary)
+    print_unmatched(merged.unmatched)
+    print_invalid(merged.invalid)
+    print_omitted(merged.mpf_omitted)
+    print(f"  run {run_time:.2f}s, write {write_time:.2f}s")
+    for path in written:
+        print(f"  wrote {path}")
+    return 0
@@ -0,0 +1,223 @@
+"""
+Date normalisation for the NB_MIS_12HNB extract.
+
+Date columns in the extract mix several encodings: Excel serial numbers
+(``26903``), ``dd-mm-yy`` text with or without a time (``28-07-80 0:00``,
+``07-06-24``) and, for Excel uploads, real datetime cells. This module
+classifies every value of a column by encoding in one pass, converts
+serials with integer day arithmetic, parses text with a format inferred
+for the whole column, and only ever parses each distinct value once.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+EXCEL_EPOCH = np.datetime64("1899-12-30", "D")
+MAX_EXCEL_SERIAL = 2958465  # 9999-12-31
+
+# Two-digit years up to this value are 20yy, above it 19yy (as strptime's %y)
+CENTURY_PIVOT = 68
+
+# Encodings reported per value
+MISSING = "missing"
+SERIAL = "serial"
+DATETIME = "datetime"
+TEXT = "text"
+INVALID = "invalid"
+
+# d-m-y / m-d-y text with 2 or 4 digit years and an optional time, e.g. "28-07-80 0:00"
+DMY_PATTERN = r"^(?P<a>\d{1,2})[-/.](?P<b>\d{1,2})[-/.](?P<year>\d{2}|\d{4})(?:[ T](?P<hour>\d{1,2}):(?P<minute>\d{2})(?::(?P<second>\d{2}))?)?$"
+# ISO text, e.g. "2024-06-07" or str() of a Timestamp "2024-06-07 00:00:00"
+ISO_PATTERN = r"^(?P<year>\d{4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})(?:[ T](?P<hour>\d{1,2}):(?P<minute>\d{2})(?::(?P<second>\d{2}))?)?$"
+NUMBER_PATTERN = r"^\d+(?:\.\d+)?$"
+
+
+@dataclass
+class ParsedDates:
+    """A normalised date column: datetime64, YYYYMMDD int32 (0 when missing) and the encoding per value."""
+    dates: pd.Series
+    yyyymmdd: pd.Series
+    encoding: pd.Series
+
+    @property
+    def valid(self):
+        return self.dates.notna()
+
+
+def serial_to_datetime(serials):
+    """Excel serial day numbers (float array, NaN allowed) to datetime64[ns]."""
+    serials = np.asarray(serials, dtype="float64")
+    days = np.floor(serials)
+    seconds = np.round((serials - days) * 86400)
+    valid = ~np.isnan(serials)
+    out = np.full(len(serials), np.datetime64("NaT"), dtype="datetime64[ns]")
+    out[valid] = (EXCEL_EPOCH + days[valid].astype("int64").astype("timedelta64[D]")
+                  + seconds[valid].astype("int64").astype("timedelta64[s]"))
+    return out
+
+
+def yyyymmdd(dates):
+    """datetime64 values to YYYYMMDD int32 (0 for NaT), by integer arithmetic."""
+    values = np.asarray(dates, dtype="datetime64[ns]")
+    valid = ~np.isnat(values)
+    day_values = values.astype("datetime64[D]")
+    month_values = values.astype("datetime64[M]")
+    years = values.astype("datetime64[Y]").astype("int64") + 1970
+    months = month_values.astype("int64") % 12 + 1
+    days = (day_values - month_values.astype("datetime64[D]")).astype("int64") + 1
+    return np.where(valid, years * 10000 + months * 100 + days, 0).astype("int32")
+
+
+def infer_day_first(first, second):
+    """
+    Day/month order for a d-m-y style column: whichever position ever exceeds
+    12 is the day. Report extracts are day-first, so that is the default.
+    """
+    first_is_day = bool((first > 12).any())
+    second_is_day = bool((second > 12).any())
+    return not (second_is_day and not first_is_day)
+
+
+def components_to_datetime(year, month, day, hour=None, minute=None, second=None):
+    """Build datetime64[ns] from integer component arrays (NaN where invalid); impossible dates become NaT."""
+    parts = pd.DataFrame({"year": year, "month": month, "day": day})
+    valid = parts.notna().all(axis=1).to_numpy()
+    out = np.full(len(parts), np.datetime64("NaT"), dtype="datetime64[ns]")
+    if valid.any():
+        good = parts[valid].astype("int64")
+        for name, values in (("hour", hour), ("minute", minute), ("second", second)):
+            if values is not None:
+                good[name] = np.nan_to_num(np.asarray(values, dtype="float64")[valid]).astype("int64")
+        out[valid] = pd.to_datetime(good, errors="coerce").to_numpy(dtype="datetime64[ns]")
+    return out
+
+
+def parse_text(text, not_after=None):
+    """
+    Parse distinct date strings with one format per column. Returns
+    (datetime64[ns] array, parsed mask).
+    """
+    text = pd.Series(text, dtype=object).astype(str).str.strip()
+    out = np.full(len(text), np.datetime64("NaT"), dtype="datetime64[ns]")
+
+    dmy_text = text.str.extract(DMY_PATTERN)
+    dmy = dmy_text.astype("float64")
+    is_dmy = dmy["a"].notna().to_numpy()
+    if is_dmy.any():
+        a, b = dmy["a"].to_numpy(), dmy["b"].to_numpy()
+        day_first = infer_day_first(a[is_dmy], b[is_dmy])
+        day, month = (a, b) if day_first else (b, a)
+        year = dmy["year"].to_numpy()
+        two_digit = (dmy_text["year"].str.len() == 2).to_numpy(dtype=bool)
+        year = np.where(two_digit, np.where(year <= CENTURY_PIVOT, 2000 + year, 1900 + year), year)
+        parsed = components_to_datetime(year, month, day, dmy["hour"], dmy["minute"], dmy["second"])
+        if not_after is not None:
+            # Two-digit years cannot tell 1964 from 2064; dates that would lie in the future are last century
+            late = two_digit & (parsed > np.datetime64(pd.Timestamp(not_after), "ns"))
+            year = np.where(late, year - 100, year)
+            parsed = np.where(late, components_to_datetime(year, month, day, dmy["hour"], dmy["minute"], dmy["second"]), parsed)
+        out[is_dmy] = parsed[is_dmy]
+
+    iso = text.str.extract(ISO_PATTERN).astype("float64")
+    is_iso = iso["year"].notna().to_numpy() & ~is_dmy
+    if is_iso.any():
+        parsed = components_to_datetime(iso["year"], iso["month"], iso["day"], iso["hour"], iso["minute"], iso["second"])
+        out[is_iso] = parsed[is_iso]
+
+    # Anything else (month names, other layouts) falls back to pandas, day-first as the extract is
+    rest = ~(is_dmy | is_iso)
+    if rest.any():
+        out[rest] = pd.to_datetime(text[rest], errors="coerce", dayfirst=True, format="mixed").to_numpy(dtype="datetime64[ns]")
+    return out, ~np.isnat(out)
+
+
+def normalise_dates(values, not_after=None):
+    """
+    Normalise a mixed-encoding date column.
+
+    ``not_after`` (e.g. the valuation date for birth dates) resolves two-digit
+    years: a date that would fall after it is moved back a century.
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    index = series.index
+
+    if pd.api.types.is_datetime64_any_dtype(series):
+        dates = series.dt.tz_localize(None) if getattr(series.dt, "tz", None) is not None else series
+        dates = dates.astype("datetime64[ns]")
+        encoding = np.where(dates.isna(), MISSING, DATETIME)
+        return ParsedDates(pd.Series(dates.to_numpy(), index=index), pd.Series(yyyymmdd(dates), index=index),
+                           pd.Series(pd.Categorical(encoding), index=index))
+
+    # Classify and parse each distinct value once
+    codes, uniques = pd.factorize(series)
+    uniques = np.asarray(uniques, dtype=object)
+    n = len(uniques)
+    parsed = np.full(n, np.datetime64("NaT"), dtype="datetime64[ns]")
+    encoding = np.full(n, INVALID, dtype=object)
+
+    is_datetime = np.fromiter((isinstance(v, (pd.Timestamp, np.datetime64)) or hasattr(v, "year") for v in uniques), dtype=bool, count=n)
+    is_number = np.fromiter((isinstance(v, (int, float, np.number)) and not isinstance(v, bool) for v in uniques), dtype=bool, count=n)
+    text = pd.Series(np.where(is_datetime | is_number, "", uniques.astype(str)), dtype=object).str.strip()
+    is_numeric_text = text.str.fullmatch(NUMBER_PATTERN).to_numpy(dtype=bool)
+    is_blank = text.isin(["", "0"]).to_numpy() & ~(is_datetime | is_number)
+
+    if is_datetime.any():
+        parsed[is_datetime] = pd.to_datetime(pd.Series(uniques[is_datetime]), errors="coerce").to_numpy(dtype="datetime64[ns]")
+        encoding[is_datetime] = DATETIME
+
+    serial_values = np.full(n, np.nan)
+    serial_values[is_number] = uniques[is_number].astype("float64")
+    serial_values[is_numeric_text & ~is_blank] = text[is_numeric_text & ~is_blank].astype("float64")
+    is_serial = (serial_values > 0) & (serial_values <= MAX_EXCEL_SERIAL)
+    parsed[is_serial] = serial_to_datetime(serial_values[is_serial])
+    encoding[is_serial] = SERIAL
+
+    is_text = ~(is_datetime | is_number | is_numeric_text | is_blank)
+    if is_text.any():
+        text_dates, text_ok = parse_text(text[is_text].to_numpy(), not_after)
+        parsed[is_text] = text_dates
+        encoding[np.flatnonzero(is_text)[text_ok]] = TEXT
+
+    encoding[is_blank | (is_number & (serial_values == 0))] = MISSING
+    encoding[is_numeric_text & (serial_values == 0)] = MISSING
+
+    # Broadcast back to rows; missing values (code -1) stay NaT
+    row_dates = np.full(len(series), np.datetime64("NaT"), dtype="datetime64[ns]")
+    row_encoding = np.full(len(series), MISSING, dtype=object)
+    present = codes >= 0
+    row_dates[present] = parsed[codes[present]]
+    row_encoding[present] = encoding[codes[present]]
+    row_dates = pd.Series(row_dates, index=index)
+    return ParsedDates(row_dates, pd.Series(yyyymmdd(row_dates), index=index),
+                       pd.Series(pd.Categorical(row_encoding), index=index))
+
+
+def parse_dates(values, not_after=None):
+    """datetime64 column from a mixed-encoding date column (NaT where no date)."""
+    return normalise_dates(values, not_after).dates
+
+
+def add_months(start, months, days=0):
+    """
+    ``start + pd.DateOffset(months=months, days=days)`` on whole arrays.
+
+    Months are added first with the day clamped to the end of the target
+    month (31 Jan + 1 month = 28/29 Feb), then the days, keeping the time
+    of day. ``months`` and ``days`` are integer arrays; NaT stays NaT.
+    """
+    start = np.asarray(start, dtype="datetime64[ns]")
+    months = np.asarray(months, dtype="int64")
+    days = np.asarray(days, dtype="int64")
+
+    month_start = start.astype("datetime64[M]")
+    day_of_month = (start.astype("datetime64[D]") - month_start.astype("datetime64[D]")).astype("int64")
+    time_of_day = start - start.astype("datetime64[D]")
+
+    target_month = month_start + months.astype("timedelta64[M]")
+    month_length = ((target_month + np.timedelta64(1, "M")).astype("datetime64[D]") - target_month.astype("datetime64[D]")).astype("int64")
+    day_of_month = np.minimum(day_of_month, month_length - 1)
+
+    result = target_month.astype("datetime64[D]") + (day_of_month + days).astype("timedelta64[D]")
+    return (result + time_of_day).astype("datetime64[ns]")
@@ -0,0 +1,346 @@
+"""
+MP file pipeline (Steps 3-8) without any Streamlit dependency.
+
+The Streamlit apps and the command-line entry point both call into this
+module, so a file converted in the browser and a file converted in a
+scripted month-end batch go through exactly the same code.
+"""
+import os
+from dataclasses import dataclass, field
+from io import BytesIO
+
+import pandas as pd
+
+from valuation import instrument
+from valuation.exclusions import plan_exclusions, plan_exclusions_dates
+from valuation.output import (LOAN_TYPE_DEFAULT, RI_COMPANY_DEFAULT, RULES, UNMATCHED_ATTR, VALIDATION_COLUMN, export_frame,
+                              generate_dov_indicator, invalid_counts, process_data, rule_mask, unmatched_counts,
+                              validation_report)
+from valuation.prophet import omitted_rows, write_mpf_files
+from valuation.report import DETECT_ROWS, banner_cells, banner_mask, covering_cells, detect_header_row
+from valuation.schema import NB_MIS_12HNB_SCHEMA, apply_schema, schema_positions
+from valuation.tables import (FX_RATE_PATH, MRP_LOAN_TYPE_PATH, RI_COMPANY_PATH, load_fx_rates, load_mrp_loan_type_dict,
+                              load_ri_company_dict)
+
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# File names used for the downloads / batch outputs
+OUTPUT_FILE = "generated_output.xlsx"
+GROUP_FILE = "selected_policies.xlsx"
+COMMENCEMENT_FILE = "ignored_policies.xlsx"
+MATURITY_FILE = "ignored_maturity_policies.xlsx"
+MATURITY_ERROR_FILE = "error_maturity_policies.xlsx"
+
+# Step 3 "Header Row" when the header cannot be detected
+DEFAULT_HEADER_ROW = 4
+
+
+# ---------------------------------------------------------------------------
+# Step 2 / 3: Reading the extract
+# ---------------------------------------------------------------------------
+
+def is_csv(name):
+    return str(name).lower().endswith(".csv")
+
+
+def read_raw(source, name=None):
+    """
+    Parse the whole extract once, without a header, into a raw grid.
+
+    The Step 2 preview and the Step 3 header-applied frame are both slices of
+    this grid, so changing the header row never re-reads the file. CSV cells
+    are kept as text, as a header-applied read of the extract gives them.
+    """
+    name = name if name is not None else getattr(source, "name", source)
+    with instrument.step("read_raw") as record:
+        grid = pd.read_csv(source, header=None, dtype=str) if is_csv(name) else pd.read_excel(source, header=None)
+        record.rows_out = len(grid)
+    return grid
+
+
+def read_head(source, name=None, nrows=DETECT_ROWS):
+    """The first raw rows only (header detection without parsing the whole file); rewinds ``source``."""
+    name = name if name is not None else getattr(source, "name", source)
+    head = pd.read_csv(source, header=None, dtype=str, nrows=nrows) if is_csv(name) else pd.read_excel(source, header=None, nrows=nrows)
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return head
+
+
+def projection(head, header_row=None, schema=NB_MIS_12HNB_SCHEMA):
+    """
+    What a projected read needs from the first raw rows: (header row, raw
+    header cells, {position: schema column}, banner cells, positions to read).
+    """
+    if header_row is None:
+        header_row = find_header_row(head)
+    if header_row + 1 >= len(head):
+        raise ValueError("No valid columns detected after skipping the selected header row. Please choose a different row.")
+    header = head.iloc[header_row + 1].tolist()
+    positions = schema_positions(header, schema)
+    banner = head.iloc[:header_row + 1]
+    cells = covering_cells(banner, banner_cells(banner), preferred=positions)
+    return header_row, header, positions, cells, sorted(set(positions) | set(cells))
+
+
+def project(body, header, positions, cells, schema=NB_MIS_12HNB_SCHEMA):
+    """Strip the banners from a body read by position, keep the schema columns and type them."""
+    banner = banner_mask(body, header, cells)
+    if banner.any():
+        body = body[~banner]
+    body = body[list(positions)]
+    body.columns = list(positions.values())
+    return apply_schema(body.reset_index(drop=True), schema)
+
+
+def read_projected(source, header_row=None, name=None, schema=NB_MIS_12HNB_SCHEMA):
+    """
+    Read only the columns of ``schema`` from the extract, typed (see
+    ``valuation.schema``). Header detection reads the first rows only.
+    """
+    name = name if name is not None else getattr(source, "name", source)
+    with instrument.step("read_projected") as record:
+        header_row, header, positions, cells, usecols = projection(read_head(source, name), header_row, schema)
+        if is_csv(name):
+            body = pd.read_csv(source, header=None, dtype=str, skiprows=header_row + 2, usecols=usecols)
+        else:
+            body = pd.read_excel(source, header=None, skiprows=header_row + 2, usecols=usecols)
+        input_df = project(body, header, positions, cells, schema)
+        record.rows_out = len(input_df)
+    return input_df
+
+
+def find_header_row(grid):
+    """The detected Step 3 header row of a raw grid, DEFAULT_HEADER_ROW when there is no NB_MIS_12HNB header."""
+    with instrument.step("header_detection", len(grid)):
+        header_row = detect_header_row(grid)
+    return header_row if header_row is not None else DEFAULT_HEADER_ROW
+
+
+def preview_rows(grid, nrows=10):
+    """The first rows of a raw grid as text, for the user to pick the header row."""
+    head = grid.iloc[:nrows]
+    return head.astype(str).where(head.notna())
+
+
+def apply_header(grid, header_row, strip_banners=True):
+    """
+    The extract with its header applied, sliced from a raw grid (no copy
+    unless page banners have to be dropped).
+
+    ``header_row`` has the same meaning as the "Header Row" input in Step 3:
+    that many rows are skipped, and the row after the next one holds the
+    column names. With ``strip_banners``, page banner and repeated header
+    rows inside the body are dropped (see ``valuation.report``).
+    """
+    body = grid.iloc[header_row + 1:]
+    if body.empty or len(body.columns) == 0:
+        raise ValueError("No valid columns detected after skipping the selected header row. Please choose a different row.")
+
+    with instrument.step("apply_header", len(grid)) as record:
+        # Rename columns based on the chosen header row (blank header cells get a unique placeholder)
+        header = body.iloc[0].tolist()
+        input_df = body.iloc[1:]
+        if strip_banners:
+            # Page banners of multi-page extracts repeat the rows above the header
+            banner = banner_mask(input_df, header, banner_cells(grid.iloc[:header_row + 1]))
+            if banner.any():
+                input_df = input_df[~banner]
+        input_df.columns = header_names(body.iloc[0])
+        input_df = input_df.reset_index(drop=True)
+        record.rows_out = len(input_df)
+    return input_df
+
+
+def read_extract(source, header_row=None, name=None):
+    """
+    Read the extract, skip the report banner and promote the header row.
+    Without ``header_row`` the header is detected (DEFAULT_HEADER_ROW if
+    it cannot be).
+    """
+    grid = read_raw(source, name)
+    if header_row is None:
+        header_row = find_header_row(grid)
+    return apply_header(grid, header_row)
+
+
+def header_names(header):
+    """Column names from a header row, naming blank cells "Unnamed: <position>"."""
+    return [name if pd.notna(name) else f"Unnamed: {i}" for i, name in enumerate(header.tolist())]
+
+
+# ---------------------------------------------------------------------------
+# Steps 4-7: options of the exclusion steps (the rules are valuation.exclusions)
+# ---------------------------------------------------------------------------
+
+def product_code_options(df):
+    return df['Product Code'].dropna().unique().tolist() if 'Product Code' in df else []
+
+
+def policy_status_options(df):
+    return df['Policy Status'].dropna().unique().tolist() if 'Policy Status' in df else []
+
+
+# ---------------------------------------------------------------------------
+# Whole pipeline
+# ---------------------------------------------------------------------------
+
+@dataclass
+class PipelineResult:
+    """Every frame the app shows or offers for download, for one run."""
+    input_df: pd.DataFrame
+    group_policies: pd.DataFrame
+    commencement_policies: pd.DataFrame
+    maturity_policies: pd.DataFrame
+    maturity_error_policies: pd.DataFrame
+    filtered_df: pd.DataFrame
+    output_df: pd.DataFrame
+    timings: dict = field(default_factory=dict)
+    # Policies per exclusion reason (exclusions.ExclusionPlan.summary)
+    exclusion_summary: pd.DataFrame = None
+
+    @property
+    def unmatched(self):
+        """{field: policies left at the default by the RI_Company / MRP_LOAN_TYPE joins}."""
+        return unmatched_counts(self.output_df)
+
+    @property
+    def invalid(self):
+        """{validation rule: policies breaking it} (``output.RULES``)."""
+        return invalid_counts(self.output_df)
+
+    @property
+    def mpf_omitted(self):
+        """Policies of the MP file written to no model point file (no known PROPHET_CODE)."""
+        return omitted_rows(self.output_df)
+
+    def exclusion_files(self):
+        """(file name, frame) for every exclusion download, in step order."""
+        return [
+            (GROUP_FILE, self.group_policies),
+            (COMMENCEMENT_FILE, self.commencement_policies),
+            (MATURITY_FILE, self.maturity_policies),
+            (MATURITY_ERROR_FILE, self.maturity_error_policies),
+        ]
+
+
+def pipeline_result(plan, output_df, timings):
+    return PipelineResult(plan.input_df, plan.group_policies, plan.commencement_policies, plan.maturity_policies,
+                          plan.maturity_error_policies, plan.filtered_df, output_df, timings, plan.summary())
+
+
+def run_pipeline(input_df, valuation_date, ignored_product_codes, selected_status,
+                 ri_company_dict=None, mrp_loan_type_dict=None, conversion=None, progress=None):
+    """
+    Run Steps 4-8 on a header-applied extract (``conversion`` as in
+    ``process_data``). Steps 4-7 are one pass of the exclusion planner.
+
+    ``progress(step, rows)``, if given, is called after each step with the
+    policies left (the output rows after ``process_data``). Each step is
+    measured by ``instrument.step``; ``timings`` holds their wall times.
+    """
+    ri_company_dict = ri_company_dict if ri_company_dict is not None else {}
+    mrp_loan_type_dict = mrp_loan_type_dict if mrp_loan_type_dict is not None else {}
+    progress = progress if progress is not None else (lambda step, rows: None)
+    timings = {}
+
+    with instrument.step('exclusions', len(input_df)) as record:
+        plan = plan_exclusions(input_df, ignored_product_codes, valuation_date)
+        record.rows_out = int(plan.status_candidates.sum())
+    timings['exclusions'] = record.wall_s
+    progress('exclusions', record.rows_out)
+
+    with instrument.step('status_filter', record.rows_out) as record:
+        plan = plan.with_status(selected_status)
+        record.rows_out = len(plan.filtered_df)
+    timings['status_filter'] = record.wall_s
+    progress('status_filter', record.rows_out)
+
+    with instrument.step('process_data', record.rows_out) as record:
+        output_df = process_data(plan.filtered_df, valuation_date, ri_company_dict, mrp_loan_type_dict, conversion)
+        record.rows_out = len(output_df)
+    timings['process_data'] = record.wall_s
+    progress('process_data', record.rows_out)
+
+    return pipeline_result(plan, output_df, timings)
+
+
+def run_pipeline_dates(input_df, valuation_dates, ignored_product_codes, selected_status,
+                       ri_company_dict=None, mrp_loan_type_dict=None, conversion=None):
+    """
+    Run Steps 4-8 at several valuation dates; returns {valuation date:
+    PipelineResult}, each equal to ``run_pipeline`` at that date.
+
+    The exclusion plans of all dates are made in one pass
+    (``exclusions.plan_exclusions_dates``): the group and status filters,
+    the start date parse and the maturity dates do not depend on the
+    valuation date and are computed once. Step 8 runs per date on that
+    date's policies, because it types its columns from the rows it is
+    given. The shared steps are timed once and reported in every result.
+    """
+    ri_company_dict = ri_company_dict if ri_company_dict is not None else {}
+    mrp_loan_type_dict = mrp_loan_type_dict if mrp_loan_type_dict is not None else {}
+    dovs = [generate_dov_indicator(valuation_date) for valuation_date in valuation_dates]
+    if len(set(dovs)) < len(dovs):
+        raise ValueError("Valuation dates must fall in different months (one MP file per DOV_INDICATOR).")
+    timings = {}
+
+    # Step rows count policy-date pairs
+    with instrument.step('exclusions', len(input_df) * len(valuation_dates)) as record:
+        plans = plan_exclusions_dates(input_df, ignored_product_codes, valuation_dates)
+        record.rows_out = sum(int(plan.status_candidates.sum()) for plan in plans)
+    timings['exclusions'] = record.wall_s
+
+    with instrument.step('status_filter', record.rows_out) as record:
+        plans = [plan.with_status(selected_status) for plan in plans]
+        record.rows_out = sum(len(plan.filtered_df) for plan in plans)
+    timings['status_filter'] = record.wall_s
+
+    results = {}
+    for valuation_date, plan in zip(valuation_dates, plans):
+        with instrument.step('process_data', len(plan.filtered_df)) as record:
+            output_df = process_data(plan.filtered_df, valuation_date, ri_company_dict, mrp_loan_type_dict, conversion)
+            record.rows_out = len(output_df)
+        results[valuation_date] = pipeline_result(plan, output_df, {**timings, 'process_data': record.wall_s})
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+def to_excel_bytes(df):
+    """Serialise a frame to an in-memory xlsx workbook."""
+    buffer = BytesIO()
+    df.to_excel(buffer, index=False)
+    buffer.seek(0)
+    return buffer
+
+
+def write_outputs(result, output_dir, error_values=True):
+    """
+    Write the MP file, the Prophet model point files (one .RPT per
+    PROPHET_CODE) and the exclusion files into ``output_dir``.
+
+    The group and commencement files are always written (as in the app); the
+    maturity files only when they contain policies. The invalid fields are
+    written as "Error" unless ``error_values`` is False (``export_frame``).
+    Policies without a known PROPHET_CODE are in no .RPT file
+    (``PipelineResult.mpf_omitted``). Returns the written paths.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with instrument.step("export_frame", len(result.output_df)):
+        output_df = export_frame(result.output_df, error_values)
+    written = []
+    for file_name, frame in [(OUTPUT_FILE, output_df)] + result.exclusion_files():
+        if frame.empty and file_name in (MATURITY_FILE, MATURITY_ERROR_FILE):
+            continue
+        path = os.path.join(output_dir, file_name)
+        with instrument.step(f"write {file_name}", len(frame)):
+            frame.to_excel(path, index=False)
+        written.append(path)
+    with instrument.step("write .RPT", len(output_df)) as record:
+        written.extend(write_mpf_files(output_df, output_dir))
+        record.rows_out = len(output_df) - result.mpf_omitted
+    return written
@@ -0,0 +1,230 @@
+"""
+Steps 4-7 as one exclusion plan.
+
+Every rule (group MCR product code, commencement after the valuation date,
+matured, status not selected) is evaluated as a boolean mask over the
+whole extract, and each policy gets one reason code: the first step that
+excludes it, as when the steps run one after the other. Policies whose
+maturity date cannot be calculated are flagged, not excluded.
+
+The exclusion downloads and the retained set are then row selections of
+the same two frames: the extract with the Policy Start Date parsed (what
+Step 5 shows) and, in addition, the term parsed and the Maturity Date
+(what Step 6 and later show). Columns the steps do not touch are shared,
+not copied, and the reason codes give the exclusion summary directly.
+"""
+from dataclasses import dataclass, replace
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from valuation import instrument
+from valuation.dates import add_months, parse_dates
+from valuation.numbers import to_numeric
+
+
+# Reason codes, in step order
+RETAINED = 0
+GROUP = 1
+NOT_COMMENCED = 2
+NO_START_DATE = 3
+MATURED = 4
+STATUS = 5
+
+REASONS = {
+    RETAINED: "Retained for the MP file",
+    GROUP: "Step 4: Group MCR product code ignored",
+    NOT_COMMENCED: "Step 5: Commencement date after the valuation date",
+    NO_START_DATE: "Step 5: No readable Policy Start Date",
+    MATURED: "Step 6: Matured on or before the valuation date",
+    STATUS: "Step 7: Policy status not selected",
+}
+SUMMARY_COLUMNS = ["code", "reason", "policies", "maturity errors"]
+# Columns the plan parses or adds, and the frames it selects on demand
+PARSED_COLUMNS = ['Policy Start Date', 'Policy Term (Months)', 'Maturity Date']
+SELECTIONS = ["group_policies", "commencement_policies", "maturity_policies", "maturity_error_policies", "filtered_df"]
+
+
+def maturity_dates(start_dates, term_months):
+    """
+    Maturity date = Policy Start Date + term. Year is adjusted by quotient,
+    Month by remainder, Fractional Months to Days (30 days per month).
+
+    Returns (datetime64 maturity dates, error mask). Policies without a start
+    date or with a blank / zero term are errors and have NaT.
+    """
+    start = start_dates.to_numpy(dtype="datetime64[ns]")
+    term = term_months.to_numpy(dtype="float64", na_value=np.nan)
+    error = np.isnat(start) | ~np.isfinite(term) | (term == 0)
+
+    total_months = np.where(error, 0, term)
+    years = np.floor_divide(total_months, 12)  # Quotient for years
+    months = np.trunc(np.mod(total_months, 12))  # Remainder for months
+    days = np.trunc(np.mod(total_months, 1) * 30)  # Fractional month to days (approximation)
+
+    maturity = add_months(np.where(error, np.datetime64("NaT"), start), (years * 12 + months).astype("int64"), days.astype("int64"))
+    return pd.Series(maturity, index=start_dates.index), error
+
+
+def start_dates(dates, skip):
+    """
+    Parsed Policy Start Date of every row not in ``skip`` (NaT there). Only
+    those rows are parsed, so the day/month order is inferred from the
+    policies Step 5 sees, as in the step-by-step filters.
+    """
+    if not skip.any():
+        return parse_dates(dates)
+    parsed = parse_dates(dates[~skip])
+    values = np.full(len(dates), np.datetime64("NaT"), dtype=parsed.dtype)
+    values[~skip] = parsed.to_numpy()
+    return pd.Series(values, index=dates.index, name=dates.name)
+
+
+def summarise(reason, maturity_error):
+    """Policies and maturity errors per reason code."""
+    return pd.DataFrame({
+        "code": list(REASONS),
+        "reason": list(REASONS.values()),
+        "policies": np.bincount(reason, minlength=len(REASONS)),
+        "maturity errors": np.bincount(reason[maturity_error], minlength=len(REASONS)),
+    }, columns=SUMMARY_COLUMNS)
+
+
+def combine_summaries(summaries):
+    """Sum exclusion summaries (of several extracts or chunks) reason by reason."""
+    summaries = [summary for summary in summaries if summary is not None]
+    if not summaries:
+        return summarise(np.zeros(0, dtype="int8"), np.zeros(0, dtype=bool))
+    total = summaries[0].copy()
+    for summary in summaries[1:]:
+        total[["policies", "maturity errors"]] += summary[["policies", "maturity errors"]].to_numpy()
+    return total
+
+
+@dataclass(eq=False)
+class ExclusionPlan:
+    """
+    The reason code of every policy of ``input_df`` and the frames the
+    exclusion files and the retained set are selected from. Until a status
+    selection is applied (``with_status``) the Step 7 candidates count as
+    retained.
+    """
+    input_df: pd.DataFrame
+    dated_df: pd.DataFrame
+    maturity_df: pd.DataFrame
+    reason: np.ndarray
+    maturity_error: np.ndarray
+    selected_status: tuple = None
+
+    def rows(self, code):
+        return np.flatnonzero(self.reason == code)
+
+    @property
+    def status_candidates(self):
+        """Policies that reach Step 7."""
+        return (self.reason == RETAINED) | (self.reason == STATUS)
+
+    @cached_property
+    def group_policies(self):
+        return self.input_df.iloc[self.rows(GROUP)]
+
+    @cached_property
+    def commencement_policies(self):
+        return self.dated_df.iloc[self.rows(NOT_COMMENCED)]
+
+    @cached_property
+    def maturity_policies(self):
+        return self.maturity_df.iloc[self.rows(MATURED)]
+
+    @cached_property
+    def maturity_error_policies(self):
+        return self.maturity_df.iloc[np.flatnonzero(self.maturity_error)]
+
+    @cached_property
+    def filtered_df(self):
+        return self.maturity_df.iloc[self.rows(RETAINED)]
+
+    def status_options(self):
+        """The statuses of the policies that reach Step 7, in file order."""
+        if 'Policy Status' not in self.input_df:
+            return []
+        return self.input_df['Policy Status'][self.status_candidates].dropna().unique().tolist()
+
+    def with_status(self, selected_status):
+        """Step 7: the plan with only the ``selected_status`` policies retained."""
+        candidates = self.status_candidates
+        selected = (self.input_df['Policy Status'].isin(selected_status).to_numpy(dtype=bool)
+                    if 'Policy Status' in self.input_df else np.zeros(len(self.reason), dtype=bool))
+        reason = self.reason.copy()
+        reason[candidates] = np.where(selected[candidates], RETAINED, STATUS)
+        return replace(self, reason=reason, selected_status=tuple(selected_status))
+
+    def summary(self):
+        """Policies (and maturity errors) per reason code; the policies add up to the extract."""
+        return summarise(self.reason, self.maturity_error)
+
+    def memory_usage(self):
+        """
+        Bytes the plan holds beyond ``input_df``: the reason codes, the
+        parsed columns and the frames selected so far.
+        """
+        total = self.reason.nbytes + self.maturity_error.nbytes
+        for name in PARSED_COLUMNS:
+            if name in self.maturity_df and (name not in self.input_df or self.maturity_df[name] is not self.input_df[name]):
+                total += int(self.maturity_df[name].memory_usage(deep=True, index=False))
+        for name in SELECTIONS:
+            if name in self.__dict__:
+                total += int(self.__dict__[name].memory_usage(deep=True).sum())
+        return total
+
+
+def plan_exclusions_dates(input_df, ignored_product_codes, valuation_dates):
+    """
+    Exclusion plans of ``input_df`` at several valuation dates, sharing the
+    parsed frames: the product code, date and term rules are evaluated for
+    every date at once.
+    """
+    rows = len(input_df)
+    dates = np.array([pd.to_datetime(valuation_date) for valuation_date in valuation_dates], dtype="datetime64[ns]")
+    # Step rows count policy-date pairs
+    with instrument.step("step_4_group", rows * len(dates)) as record:
+        group = (input_df['Product Code'].isin(ignored_product_codes).to_numpy(dtype=bool)
+                 if 'Product Code' in input_df else np.zeros(rows, dtype=bool))
+        reason = np.repeat(np.where(group, GROUP, RETAINED).astype("int8")[:, None], len(dates), axis=1)
+        candidate = np.repeat(~group[:, None], len(dates), axis=1)
+        record.rows_out = int(np.count_nonzero(candidate))
+    commenced = candidate
+    error = np.zeros(rows, dtype=bool)
+    dated_df = maturity_df = input_df
+
+    if 'Policy Start Date' in input_df:
+        with instrument.step("step_5_commencement", record.rows_out) as record:
+            start = start_dates(input_df['Policy Start Date'], group)
+            dated_df = maturity_df = input_df.assign(**{'Policy Start Date': start})
+            start_values = start.to_numpy(dtype="datetime64[ns]")[:, None]
+            # NaT compares False both ways: no start date, not retained by Step 5
+            commenced = candidate & (start_values <= dates)
+            not_commenced = candidate & (start_values > dates)
+            reason[not_commenced] = NOT_COMMENCED
+            reason[candidate & ~commenced & ~not_commenced] = NO_START_DATE
+            record.rows_out = int(np.count_nonzero(commenced))
+
+        if 'Policy Term (Months)' in input_df:
+            with instrument.step("step_6_maturity", record.rows_out) as record:
+                term = to_numeric(input_df['Policy Term (Months)'])
+                maturity, error = maturity_dates(start, term)
+                maturity_df = dated_df.assign(**{'Policy Term (Months)': term, 'Maturity Date': maturity})
+                matured = ~error[:, None] & (maturity.to_numpy(dtype="datetime64[ns]")[:, None] <= dates)
+                reason[commenced & matured] = MATURED
+                record.rows_out = int(np.count_nonzero(commenced & ~matured))
+
+    maturity_error = commenced & error[:, None]
+    return [ExclusionPlan(input_df, dated_df, maturity_df, np.ascontiguousarray(reason[:, i]),
+                          np.ascontiguousarray(maturity_error[:, i]))
+            for i in range(len(dates))]
+
+
+def plan_exclusions(input_df, ignored_product_codes, valuation_date):
+    """Exclusion plan of ``input_df`` at one valuation date (Steps 4-6; Step 7 is ``ExclusionPlan.with_status``)."""
+    return plan_exclusions_dates(input_df, ignored_product_codes, [valuation_date])[0]
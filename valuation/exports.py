@@ -0,0 +1,114 @@
+"""
+Lazy, cached xlsx downloads.
+
+Serialising a frame to xlsx (openpyxl) is the slowest thing the app does
+on large frames, so a workbook (or the zipped Prophet model point files)
+is only built when its download button is
+clicked (Streamlit calls the ``data`` callable on click). The bytes are
+cached process-wide by a fingerprint of the frame's content, so an
+unchanged frame is never serialised twice, whichever session asks for it.
+The cache is bounded in bytes and evicts least recently used workbooks.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from valuation import engine, prophet
+
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def frame_fingerprint(df):
+    """Content hash of a frame: column names, dtypes and every value."""
+    digest = hashlib.sha256()
+    digest.update(repr((df.shape, [str(name) for name in df.columns], [str(dtype) for dtype in df.dtypes])).encode())
+    if len(df.columns):
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    for position, dtype in enumerate(df.dtypes):
+        if dtype == object:
+            column = df.iloc[:, position]
+            # hash_pandas_object hashes mixed objects via str(), so 1 and "1" collide; add the types
+            if pd.api.types.infer_dtype(column, skipna=False).startswith("mixed"):
+                types = np.array([type(value).__name__ for value in column], dtype=object)
+                digest.update(pd.util.hash_array(types).tobytes())
+    return digest.hexdigest()
+
+
+def xlsx_bytes(frame):
+    return engine.to_excel_bytes(frame).getvalue()
+
+
+class WorkbookCache:
+    """
+    Download bytes keyed by (frame fingerprint, serializer), bounded to
+    ``max_bytes`` (LRU). The serializer defaults to xlsx.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, frame, serialize=xlsx_bytes):
+        key = (frame_fingerprint(frame), serialize.__name__)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        data = serialize(frame)
+
+        with self._lock:
+            if key not in self._entries and len(data) <= self.max_bytes:
+                self._entries[key] = data
+                self._bytes += len(data)
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= len(evicted)
+                    self.evictions += 1
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"workbooks": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+workbook_cache = WorkbookCache()
+
+
+def lazy_workbook(frame, cache=None, serialize=xlsx_bytes):
+    """A no-argument callable for ``st.download_button(data=...)`` that builds the file on click."""
+    cache = cache if cache is not None else workbook_cache
+    return lambda: cache.get(frame, serialize)
+
+
+def lazy_output(output_df, error_values=True, cache=None, serialize=xlsx_bytes):
+    """
+    Download callable for the Step 8 output: rendered for export
+    (``output.export_frame``, "Error" in the invalid fields unless
+    ``error_values`` is False) on click, then serialised.
+    """
+    cache = cache if cache is not None else workbook_cache
+    return lambda: cache.get(engine.export_frame(output_df, error_values), serialize)
+
+
+def lazy_mpf_zip(output_df, error_values=True, cache=None):
+    """Download callable for the Prophet model point files of the Step 8 output, zipped."""
+    return lazy_output(output_df, error_values, cache, prophet.mpf_zip_bytes)
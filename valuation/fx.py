@@ -0,0 +1,99 @@
+"""
+Currency conversion of the monetary MP file fields (SINGLE_PREM, LOAN_AMT_1).
+
+Amounts in the extract are in the policy currency and the MP file holds
+LKR. The rate of every policy is resolved once, as a vector, and applied
+to all monetary fields. The rate source is selectable:
+
+* table:    the FX_RATE table (``TABLE/FX_RATE.csv``), as-of joined on
+            (Currency, valuation date): the latest rate effective on or
+            before the valuation date.
+* higher:   the extract's "Exchange Rate (Higher Rate)" column.
+* current:  the extract's "Exchange Rate (Current Rate)" column.
+
+Policies without a rate (a currency missing from the table, no rate
+effective yet, a blank extract rate) are not converted: SINGLE_PREM is 0
+and LOAN_AMT_1 "Error", as for currencies other than LKR and USD before.
+Without a rate table the original fixed rates apply (LKR 1, USD 450).
+"""
+import hashlib
+from dataclasses import dataclass
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from valuation.numbers import parse_numbers
+
+
+TABLE = "table"
+RATE_COLUMNS = {
+    "higher": "Exchange Rate (Higher Rate)",
+    "current": "Exchange Rate (Current Rate)",
+}
+RATE_SOURCES = [TABLE, *RATE_COLUMNS]
+
+USD_RATE = 450
+FIXED_RATES = pd.DataFrame({
+    'Currency': ["LKR", "USD"],
+    'Effective Date': pd.to_datetime(["1900-01-01", "1900-01-01"]),
+    'Rate': [1.0, float(USD_RATE)],
+})
+
+
+@dataclass(frozen=True, eq=False)
+class Conversion:
+    """A rate source and, for the ``table`` source, the FX_RATE table (``tables.load_fx_rates``)."""
+    rates: pd.DataFrame = None
+    source: str = TABLE
+
+    def __post_init__(self):
+        if self.source not in RATE_SOURCES:
+            raise ValueError(f"Unknown exchange rate source '{self.source}', expected one of {', '.join(RATE_SOURCES)}.")
+
+    def __eq__(self, other):
+        # By content, so a stage keyed on an unchanged conversion is reused across reruns
+        if not isinstance(other, Conversion) or self.source != other.source:
+            return False
+        if self.rates is None or other.rates is None:
+            return self.rates is other.rates
+        return self.rates is other.rates or self.rates.equals(other.rates)
+
+    @cached_property
+    def digest(self):
+        """Content hash, for keying shared caches on the conversion (``valuation.artefacts``)."""
+        digest = hashlib.sha256(self.source.encode())
+        if self.rates is not None:
+            digest.update(repr([str(dtype) for dtype in self.rates.dtypes]).encode())
+            digest.update(pd.util.hash_pandas_object(self.rates, index=False).to_numpy().tobytes())
+        return digest.hexdigest()
+
+
+def rates_as_of(rates, currencies, valuation_date):
+    """Rate of each of ``currencies`` effective on ``valuation_date`` (NaN where none), by an as-of join."""
+    if not len(currencies):
+        return np.empty(0)
+    left = pd.DataFrame({'Currency': pd.Series(currencies, dtype="str"),
+                         'Effective Date': np.full(len(currencies), pd.Timestamp(valuation_date), dtype="datetime64[ns]")})
+    right = rates.astype({'Currency': "str", 'Effective Date': "datetime64[ns]"})
+    joined = pd.merge_asof(left, right, on='Effective Date', by='Currency', direction="backward")
+    return joined['Rate'].to_numpy(dtype="float64", na_value=np.nan)
+
+
+def row_rates(df, valuation_date, conversion=None):
+    """(rate to LKR, has-rate mask) of every policy; NaN rate where there is none."""
+    conversion = conversion if conversion is not None else Conversion()
+    if conversion.source == TABLE:
+        rates = conversion.rates if conversion.rates is not None else FIXED_RATES
+        codes, currencies = pd.factorize(df['Currency'])
+        unique_rates = rates_as_of(rates, np.asarray(currencies, dtype=object).astype(str), valuation_date)
+        out = np.full(len(df), np.nan)
+        present = codes >= 0
+        out[present] = unique_rates[codes[present]]
+    else:
+        column = RATE_COLUMNS[conversion.source]
+        if column not in df:
+            raise ValueError(f"The extract has no '{column}' column.")
+        out = parse_numbers(df[column]).values
+        out[df['Currency'].isna().to_numpy()] = np.nan
+    return out, ~np.isnan(out)
@@ -0,0 +1,337 @@
+"""
+Per-step instrumentation: wall time, CPU time, rows and peak memory.
+
+Every pipeline step runs inside ``step(name, rows_in)``, which measures
+it into a StepRecord. A step inside another step is one of its ``parts``
+(Steps 4, 5 and 6 inside the exclusion plan, ``read_raw`` inside the
+ingest stage). When a RunLog is started in the thread, the outermost
+steps are added to it; ``RunLog.finish`` appends the run to a JSON lines
+file (RUN_LOG_PATH, one line per run) so the cost of month-end runs can be
+trended (``load_run_log``). Without a run log the steps still measure,
+for the callers that report their own timings, and keep nothing.
+
+A step costs two reads of /proc/self/status and a few clock reads, a few
+tens of microseconds, so instrumentation stays on in production.
+
+Memory is the peak RSS while the step ran, less the RSS when it started
+(``peak_delta``). On Linux the process high-water mark is reset when a
+step starts and no other thread is measuring, which makes the peak exact
+(``peak_exact``). Steps overlapping a step of another session, and
+platforms without the reset, report an upper bound. CPU time is that of
+the process: it includes pyarrow's reader threads, and other sessions'
+work if they run at the same time.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import pandas as pd
+
+
+RUN_LOG_PATH = os.path.join("LOGS", "run_log.jsonl")
+
+RECORD_COLUMNS = ["step", "status", "calls", "wall_s", "cpu_s", "rows_in", "rows_out", "peak_delta_mb"]
+
+
+# ---------------------------------------------------------------------------
+# Memory
+# ---------------------------------------------------------------------------
+
+def proc_status(field):
+    """A memory field of /proc/self/status in bytes, None where there is no /proc."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak():
+    """Reset the peak RSS of the process (Linux only); False if it cannot be."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def current_rss():
+    rss = proc_status("VmRSS")
+    if rss is None:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        rss = psutil.Process().memory_info().rss
+    return rss
+
+
+def peak_rss():
+    peak = proc_status("VmHWM")
+    if peak is not None:
+        return peak
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return getattr(psutil.Process().memory_info(), "peak_wset", None)
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def highest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+# ---------------------------------------------------------------------------
+# Steps
+# ---------------------------------------------------------------------------
+
+_local = threading.local()
+_lock = threading.Lock()
+_measuring_threads = 0
+_write_lock = threading.Lock()
+
+
+@dataclass
+class StepRecord:
+    step: str
+    rows_in: int = None
+    rows_out: int = None
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    start_rss: int = None
+    peak_rss: int = None
+    # Peak RSS less the RSS at the start; of repeated steps, the largest
+    peak_delta: int = None
+    peak_exact: bool = False
+    # Served from a cache (the stage was not run)
+    cached: bool = False
+    error: str = None
+    calls: int = 1
+    parts: list = field(default_factory=list)
+
+    def add(self, record):
+        self.parts.append(record)
+
+    def to_dict(self):
+        return {"step": self.step, "rows_in": self.rows_in, "rows_out": self.rows_out,
+                "wall_s": round(self.wall_s, 6), "cpu_s": round(self.cpu_s, 6), "start_rss": self.start_rss,
+                "peak_rss": self.peak_rss, "peak_delta": self.peak_delta, "peak_exact": self.peak_exact,
+                "cached": self.cached, "error": self.error, "calls": self.calls,
+                "parts": [part.to_dict() for part in merged(self.parts)]}
+
+
+def merged(records):
+    """
+    Records with the repeated steps among them combined, in order of first
+    appearance: times and rows add up, the peak is the highest. A streamed
+    run then logs one "read_chunk" step, not one per chunk.
+    """
+    combined = {}
+    for record in records:
+        total = combined.get(record.step)
+        combined[record.step] = record if total is None else StepRecord(
+            total.step, plus(total.rows_in, record.rows_in), plus(total.rows_out, record.rows_out),
+            total.wall_s + record.wall_s, total.cpu_s + record.cpu_s, total.start_rss,
+            highest(total.peak_rss, record.peak_rss), highest(total.peak_delta, record.peak_delta),
+            total.peak_exact and record.peak_exact, total.cached and record.cached, total.error or record.error,
+            total.calls + record.calls, total.parts + record.parts)
+    return list(combined.values())
+
+
+def plus(a, b):
+    """Sum of two counts, either of which may be unknown (None)."""
+    return a if b is None else b if a is None else a + b
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _begin(stack):
+    """
+    Count this thread as measuring and reset the high-water mark if no
+    other thread is; the peak so far is first handed to this thread's open
+    steps. Returns whether the mark was reset.
+    """
+    global _measuring_threads
+    with _lock:
+        others = _measuring_threads - (1 if stack else 0)
+        if not stack:
+            _measuring_threads += 1
+        if others:
+            return False
+        if stack:
+            peak = peak_rss()
+            for record in stack:
+                record.peak_rss = highest(record.peak_rss, peak)
+        return reset_peak()
+
+
+def _end(stack):
+    global _measuring_threads
+    if not stack:
+        with _lock:
+            _measuring_threads -= 1
+
+
+@contextmanager
+def step(name, rows_in=None, log=None):
+    """
+    Measure the enclosed code as step ``name``; yields its StepRecord (set
+    ``rows_out``, or ``cached``, inside the block). The record goes to the
+    enclosing step, else to ``log`` or the thread's started RunLog.
+    """
+    stack = _stack()
+    record = StepRecord(name, rows_in)
+    record.peak_exact = _begin(stack)
+    record.start_rss = current_rss()
+    stack.append(record)
+    cpu = time.process_time()
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record.error = type(e).__name__
+        raise
+    finally:
+        record.wall_s = time.perf_counter() - start
+        record.cpu_s = time.process_time() - cpu
+        record.peak_rss = highest(record.peak_rss, peak_rss(), *(part.peak_rss for part in record.parts))
+        if record.peak_rss is not None and record.start_rss is not None:
+            record.peak_delta = max(record.peak_rss - record.start_rss, 0)
+        stack.pop()
+        _end(stack)
+        parent = stack[-1] if stack else log if log is not None else getattr(_local, "log", None)
+        if parent is not None:
+            parent.add(record)
+
+
+# ---------------------------------------------------------------------------
+# Run log
+# ---------------------------------------------------------------------------
+
+class RunLog:
+    """
+    The steps of one run: a script run of the app, a command-line
+    conversion, a background job or a download. ``context`` (file name,
+    valuation date, ...) is written with them.
+    """
+
+    def __init__(self, kind, **context):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.context = context
+        self.started = time.time()
+        self.finished = None
+        self.steps = []
+
+    def add(self, record):
+        self.steps.append(record)
+
+    def start(self):
+        """Collect the outermost steps of this thread until ``finish``."""
+        _local.log = self
+        return self
+
+    @property
+    def computed(self):
+        """Whether any step ran (a rerun of the app served from the caches only is not worth a log line)."""
+        return any(not record.cached for record in self.steps)
+
+    def finish(self, path=RUN_LOG_PATH):
+        """Stop collecting and append the run to ``path`` if a step ran (``path`` None: do not write). Returns whether it was written."""
+        if getattr(_local, "log", None) is self:
+            _local.log = None
+        self.finished = time.time()
+        if path is None or not self.computed:
+            return False
+        self.write(path)
+        return True
+
+    def to_dict(self):
+        finished = self.finished if self.finished is not None else time.time()
+        return {"run_id": self.id, "kind": self.kind,
+                "started": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+                "wall_s": round(finished - self.started, 6), "pid": os.getpid(), "context": self.context,
+                "steps": [record.to_dict() for record in merged(self.steps)]}
+
+    def write(self, path=RUN_LOG_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        line = json.dumps(self.to_dict(), default=str)
+        # One line per run, whole lines only when sessions finish together
+        with _write_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def records_frame(records):
+    """
+    The ``StepRecord.to_dict`` records as a table, parts indented under
+    their step: status (ran / cached / failed), calls, wall and CPU
+    seconds, rows in and out and the peak memory delta in MB.
+    """
+    rows = []
+
+    def visit(record, depth):
+        status = "failed" if record.get("error") else "cached" if record.get("cached") else "ran"
+        delta = record.get("peak_delta")
+        rows.append({"step": "    " * depth + record["step"], "status": status, "calls": record.get("calls", 1),
+                     "wall_s": round(record["wall_s"], 3), "cpu_s": round(record["cpu_s"], 3),
+                     "rows_in": record.get("rows_in"), "rows_out": record.get("rows_out"),
+                     "peak_delta_mb": round(delta / 1024 ** 2, 1) if delta is not None else None})
+        for part in record.get("parts", []):
+            visit(part, depth + 1)
+
+    for record in records:
+        visit(record, 0)
+    return pd.DataFrame(rows, columns=RECORD_COLUMNS).astype({"rows_in": "Int64", "rows_out": "Int64"})
+
+
+def load_run_log(path=RUN_LOG_PATH):
+    """
+    The run log as one row per step and part (``path`` names the parent
+    step, "exclusions/step_6_maturity"), with the run's id, kind, start
+    time and context, for trending run costs.
+    """
+    rows = []
+
+    def visit(run, record, parent):
+        name = f"{parent}/{record['step']}" if parent else record["step"]
+        rows.append({"run_id": run["run_id"], "kind": run["kind"], "started": run["started"], "path": name,
+                     **{key: record.get(key) for key in ("step", "calls", "wall_s", "cpu_s", "rows_in", "rows_out",
+                                                         "peak_delta", "peak_rss", "cached", "error")},
+                     "context": run.get("context")})
+        for part in record.get("parts", []):
+            visit(run, part, name)
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                run = json.loads(line)
+                for record in run["steps"]:
+                    visit(run, record, "")
+    frame = pd.DataFrame(rows)
+    if not frame.empty:
+        frame["started"] = pd.to_datetime(frame["started"])
+    return frame
@@ -0,0 +1,337 @@
+"""
+Background conversion jobs.
+
+A job converts one uploaded extract (Steps 3-8 and every output file) in
+a worker thread, outside the Streamlit script run: the page stays
+responsive, a widget click does not restart the conversion, and jobs of
+all sessions share one bounded pool instead of running side by side.
+At most ``max_workers`` jobs run at a time and ``max_queued`` wait;
+beyond that ``submit`` raises QueueFull.
+
+Each job lives in its own directory under ``JOBS_DIR``:
+
+    <job id>/job.json   status, progress and settings, rewritten on every update
+    <job id>/input/     the uploaded extract, removed when the job ends
+    <job id>/output/    the MP file, model point files and exclusion files
+
+so a session that was closed, or another session given the job ID,
+re-attaches to a running or finished job (``JobRunner.get``). Finished
+jobs and their files are removed ``ttl`` seconds after they end. Each
+job appends its steps to the run log (``instrument.RUN_LOG_PATH``).
+"""
+import functools
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from valuation import engine, instrument, streaming
+
+
+JOBS_DIR = os.path.join(".cache", "jobs")
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_MAX_QUEUED = 8
+DEFAULT_TTL = 24 * 60 * 60
+JOB_FILE = "job.json"
+
+# Job statuses; INTERRUPTED is a job left queued or running by an earlier process
+QUEUED, RUNNING, DONE, FAILED, CANCELLED, INTERRUPTED = "queued", "running", "done", "failed", "cancelled", "interrupted"
+FINISHED = (DONE, FAILED, CANCELLED, INTERRUPTED)
+
+# Stages a job reports, in order
+STAGES = ["queued", "ingest", "exclusions", "status_filter", "process_data", "write", "done"]
+
+
+class QueueFull(Exception):
+    """The job queue is at ``max_queued``; submit again when a job has started."""
+
+
+@dataclass
+class JobSpec:
+    """What to convert: the Step 1-8 choices of the app (``header_row`` None detects it)."""
+    name: str
+    valuation_date: object
+    ignored_product_codes: list
+    selected_status: list
+    header_row: int = None
+    ri_company_dict: object = None
+    mrp_loan_type_dict: object = None
+    conversion: object = None
+    error_values: bool = True
+    # Stream the extract in chunks of this many rows (CSV outputs, see valuation.streaming)
+    chunk_size: int = None
+
+    def describe(self):
+        """The settings shown with the job (the reference tables are left out)."""
+        return {"name": self.name, "valuation_date": str(self.valuation_date),
+                "ignored_product_codes": list(self.ignored_product_codes), "selected_status": list(self.selected_status),
+                "header_row": self.header_row, "error_values": self.error_values, "chunk_size": self.chunk_size}
+
+
+@dataclass(eq=False)
+class Job:
+    """
+    One conversion. ``progress`` holds the current stage and the rows
+    ingested, excluded by Steps 4-7 and written to the MP file;
+    ``bytes_written`` is measured from the output directory when read.
+    """
+    id: str
+    directory: str
+    settings: dict
+    status: str = QUEUED
+    submitted: float = field(default_factory=time.time)
+    started: float = None
+    finished: float = None
+    progress: dict = field(default_factory=lambda: {"stage": "queued"})
+    error: str = None
+    written: list = field(default_factory=list)
+    summary: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+        self.spec = None
+        self.future = None
+
+    @property
+    def input_dir(self):
+        return os.path.join(self.directory, "input")
+
+    @property
+    def output_dir(self):
+        return os.path.join(self.directory, "output")
+
+    @property
+    def bytes_written(self):
+        if not os.path.isdir(self.output_dir):
+            return 0
+        return sum(entry.stat().st_size for entry in os.scandir(self.output_dir) if entry.is_file())
+
+    @property
+    def fraction(self):
+        """Share of the stages done, for a progress bar."""
+        stage = self.progress.get("stage")
+        return STAGES.index(stage) / (len(STAGES) - 1) if stage in STAGES else 0.0
+
+    def artefacts(self):
+        """(file name, path) of every output file of a finished job that is still on disk."""
+        paths = [os.path.join(self.output_dir, name) for name in self.written]
+        return [(os.path.basename(path), path) for path in paths if os.path.exists(path)]
+
+    def to_dict(self):
+        return {"id": self.id, "settings": self.settings, "status": self.status, "submitted": self.submitted,
+                "started": self.started, "finished": self.finished, "progress": self.progress, "error": self.error,
+                "written": self.written, "summary": self.summary}
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, JOB_FILE)) as f:
+            state = json.load(f)
+        return cls(directory=directory, **state)
+
+    def save(self):
+        # Write under a temporary name so a reader never sees half a file
+        temporary = os.path.join(self.directory, f".{uuid.uuid4().hex}.tmp")
+        with open(temporary, "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(temporary, os.path.join(self.directory, JOB_FILE))
+
+    def update(self, **changes):
+        """Set job attributes (``progress`` is merged) and save."""
+        with self._lock:
+            progress = changes.pop("progress", None)
+            if progress:
+                self.progress = {**self.progress, **progress}
+            for name, value in changes.items():
+                setattr(self, name, value)
+            self.save()
+
+
+def run_job(job):
+    """Convert ``job.spec``: Steps 3-8 on the uploaded extract and every output file into ``job.output_dir``."""
+    spec = job.spec
+    source = os.path.join(job.input_dir, os.path.basename(spec.name))
+    if spec.chunk_size:
+        def chunk_done(result):
+            counts = result.counts
+            job.update(progress={"stage": "process_data", "rows_ingested": counts["input"],
+                                 "rows_excluded": counts["input"] - counts["output"], "output_rows": counts["output"]})
+
+        result = streaming.run_streaming(source, job.output_dir, spec.valuation_date, spec.ignored_product_codes,
+                                         spec.selected_status, spec.ri_company_dict, spec.mrp_loan_type_dict,
+                                         spec.header_row, spec.name, spec.chunk_size, conversion=spec.conversion,
+                                         error_values=spec.error_values, progress=chunk_done)
+        return result.written, {"unmatched": result.unmatched, "invalid": result.invalid}
+
+    input_df = engine.read_extract(source, spec.header_row, spec.name)
+    rows = len(input_df)
+    job.update(progress={"stage": "ingest", "rows_ingested": rows})
+
+    def step_done(step, left):
+        counts = {"output_rows": left} if step == "process_data" else {"rows_excluded": rows - left}
+        job.update(progress={"stage": step, **counts})
+
+    result = engine.run_pipeline(input_df, spec.valuation_date, spec.ignored_product_codes, spec.selected_status,
+                                 spec.ri_company_dict, spec.mrp_loan_type_dict, spec.conversion, progress=step_done)
+    job.update(progress={"stage": "write"})
+    written = engine.write_outputs(result, job.output_dir, spec.error_values)
+    return written, {"unmatched": result.unmatched, "invalid": result.invalid}
+
+
+class JobRunner:
+    """
+    Background jobs of this process, on a pool of ``max_workers`` threads
+    with at most ``max_queued`` jobs waiting; jobs of earlier processes are
+    read from ``directory``.
+    """
+
+    def __init__(self, directory=JOBS_DIR, max_workers=DEFAULT_MAX_WORKERS, max_queued=DEFAULT_MAX_QUEUED, ttl=DEFAULT_TTL):
+        self.directory = directory
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="valuation-job")
+        return self._executor
+
+    def submit(self, data, spec):
+        """Queue the conversion of the uploaded ``data`` (the bytes of ``spec.name``); returns the Job."""
+        self.expire()
+        with self._lock:
+            queued = sum(job.status == QUEUED for job in self._jobs.values())
+            if queued >= self.max_queued:
+                raise QueueFull(f"{queued} jobs are already waiting; try again when one has started.")
+            job_id = uuid.uuid4().hex[:12]
+            job = Job(job_id, os.path.join(self.directory, job_id), spec.describe())
+            job.spec = spec
+            self._jobs[job_id] = job
+
+        os.makedirs(job.input_dir, exist_ok=True)
+        with open(os.path.join(job.input_dir, os.path.basename(spec.name)), "wb") as f:
+            f.write(data)
+        job.save()
+        job.future = self.executor().submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        if job.status == CANCELLED:
+            return
+        job.update(status=RUNNING, started=time.time(), progress={"stage": "ingest"})
+        run_log = instrument.RunLog("job", job_id=job.id, file=job.spec.name,
+                                    valuation_date=str(job.spec.valuation_date)).start()
+        try:
+            written, summary = run_job(job)
+        except Exception as e:
+            job.update(status=FAILED, error=str(e), finished=time.time())
+        else:
+            job.update(status=DONE, finished=time.time(), progress={"stage": "done"},
+                       written=[os.path.relpath(path, job.output_dir) for path in written],
+                       summary={name: {key: int(count) for key, count in counts.items()} for name, counts in summary.items()})
+        finally:
+            shutil.rmtree(job.input_dir, ignore_errors=True)
+            run_log.finish()
+            job.spec = None
+
+    def get(self, job_id):
+        """The job with ``job_id``, running here or left on disk by an earlier run; None if unknown or expired."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        directory = os.path.join(self.directory, os.path.basename(str(job_id)))
+        try:
+            job = Job.load(directory)
+        except (OSError, ValueError, TypeError):
+            return None
+        if job.status not in FINISHED:
+            # Queued or running in a process that has since stopped
+            job.status = INTERRUPTED
+        return job
+
+    def jobs(self):
+        """Every known job, newest first."""
+        self.expire()
+        if not os.path.isdir(self.directory):
+            return []
+        jobs = [self.get(entry.name) for entry in os.scandir(self.directory) if entry.is_dir()]
+        return sorted((job for job in jobs if job is not None), key=lambda job: job.submitted, reverse=True)
+
+    def cancel(self, job_id):
+        """Cancel a job that has not started; returns whether it was cancelled."""
+        job = self._jobs.get(job_id)
+        if job is None or job.future is None or not job.future.cancel():
+            return False
+        job.update(status=CANCELLED, finished=time.time())
+        shutil.rmtree(job.input_dir, ignore_errors=True)
+        return True
+
+    def expire(self, now=None):
+        """Remove the jobs (and files) that finished more than ``ttl`` seconds ago."""
+        now = now if now is not None else time.time()
+        if not os.path.isdir(self.directory):
+            return
+        for entry in os.scandir(self.directory):
+            job = self.get(entry.name) if entry.is_dir() else None
+            if job is None or job.status not in FINISHED:
+                continue
+            if now - (job.finished or job.submitted) > self.ttl:
+                shutil.rmtree(job.directory, ignore_errors=True)
+                with self._lock:
+                    self._jobs.pop(job.id, None)
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {"queued": statuses.count(QUEUED), "running": statuses.count(RUNNING),
+                "max_workers": self.max_workers, "max_queued": self.max_queued}
+
+
+job_runner = JobRunner()
+
+
+def read_bytes(path):
+    """A finished artefact's contents, read when its download is requested."""
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def show_job(job, runner=None, refresh=2.0):
+    """
+    A job's status, progress and downloads in the Streamlit app. While the
+    job is queued or running the panel refreshes itself every ``refresh``
+    seconds, without re-running the rest of the page.
+    """
+    import streamlit as st
+    runner = runner if runner is not None else job_runner
+
+    def panel():
+        current = runner.get(job.id) or job
+        progress = current.progress
+        st.write(f"Job `{current.id}` · {current.settings.get('name')} · {current.status}")
+        if current.status in (QUEUED, RUNNING):
+            st.progress(current.fraction, text=f"Stage: {progress.get('stage')}")
+        st.caption(f"Rows ingested {progress.get('rows_ingested', 0):,} · excluded {progress.get('rows_excluded', 0):,} · "
+                   f"output rows {progress.get('output_rows', 0):,} · {current.bytes_written / 1024 ** 2:.1f} MB written")
+        if current.status == FAILED:
+            st.error(f"Error processing file: {current.error}")
+        elif current.status == INTERRUPTED:
+            st.warning("The job was interrupted by a restart of the app; submit it again.")
+        for name, path in current.artefacts():
+            st.download_button(f"Download {name}", data=functools.partial(read_bytes, path), file_name=name,
+                               key=f"job_{current.id}_{name}")
+        if current.status == QUEUED and st.button("Cancel job", key=f"cancel_{current.id}"):
+            runner.cancel(current.id)
+        if running and current.status in FINISHED:
+            # Stop refreshing: the next page run shows the finished job
+            st.rerun()
+
+    running = job.status in (QUEUED, RUNNING)
+    st.fragment(panel, run_every=refresh if running else None)()
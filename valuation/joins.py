@@ -0,0 +1,150 @@
+"""
+Indexed joins of the extract against the key -> value reference tables
+(RI_Company by Policy Number, MRP_LOAN_TYPE by Product Code).
+
+A reference table is kept as sorted arrays instead of a dict of strings:
+keys that are plain integers ("123456": no sign, no leading zero, up to 18
+digits) as int64, every other key as text. A column is normalised to the
+same two key kinds once and resolved with one ``searchsorted`` per kind;
+the unmatched count falls out of the same probe.
+
+Keys compare as ``str(key)``, exactly as the dict lookups they replace:
+"00123" is not 123, and an Excel 123456.0 is not "123456".
+"""
+import hashlib
+from dataclasses import dataclass, replace
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+
+# Keys held as int64: canonical decimal text that fits (str(int(key)) == key)
+INTEGER_KEY = r"0|[1-9][0-9]{0,17}"
+
+
+def key_text(keys):
+    """``str(key)`` of every key as a string Series ("nan" for missing keys, as ``str`` gives)."""
+    if isinstance(keys.dtype, pd.StringDtype):
+        # Already text: only the missing values need spelling out
+        return keys.fillna(str(keys.dtype.na_value))
+    return pd.Series(np.asarray(keys, dtype=object).astype(str), index=keys.index)
+
+
+def split_keys(text):
+    """(int64 keys, integer mask, text keys) of a string Series; a key is one or the other."""
+    integer = text.str.fullmatch(INTEGER_KEY).to_numpy(dtype=bool)
+    int_keys = np.zeros(len(text), dtype="int64")
+    if integer.any():
+        int_keys[integer] = text[integer].astype("int64").to_numpy()
+    return int_keys, integer, text[~integer].to_numpy(dtype=str)
+
+
+def probe(sorted_keys, keys):
+    """(position, found) of every key in ``sorted_keys``."""
+    if not len(sorted_keys):
+        return np.zeros(len(keys), dtype="intp"), np.zeros(len(keys), dtype=bool)
+    positions = np.searchsorted(sorted_keys, keys)
+    np.minimum(positions, len(sorted_keys) - 1, out=positions)
+    return positions, sorted_keys[positions] == keys
+
+
+@dataclass
+class JoinResult:
+    """A resolved column and the mask of keys found in the table."""
+    values: pd.Series
+    matched: np.ndarray
+
+    @property
+    def unmatched(self):
+        return int(len(self.matched) - np.count_nonzero(self.matched))
+
+
+@dataclass(frozen=True, eq=False)
+class ReferenceTable:
+    """
+    A key -> value table as sorted key arrays. ``default`` is the value for
+    unknown keys; None leaves it to the caller (``resolve``).
+    """
+    int_keys: np.ndarray
+    int_values: np.ndarray
+    text_keys: np.ndarray
+    text_values: np.ndarray
+    default: str = None
+
+    @classmethod
+    def from_columns(cls, keys, values, default=None):
+        """
+        Table of ``keys`` (compared as text) -> ``values``. Missing keys are
+        dropped; the last row wins for a repeated key, as in a dict.
+        """
+        keys = pd.Series(keys).reset_index(drop=True)
+        present = keys.notna().to_numpy()
+        text = key_text(keys[present].reset_index(drop=True))
+        values = np.asarray(values, dtype=object)[present]
+        int_keys, integer, text_keys = split_keys(text)
+
+        def index(keys, values):
+            # Sort by key, then keep the last of each run of equal keys
+            order = np.argsort(keys, kind="stable")
+            keys, values = keys[order], values[order]
+            last = np.ones(len(keys), dtype=bool)
+            last[:-1] = keys[1:] != keys[:-1]
+            return keys[last], values[last]
+
+        int_keys, int_values = index(int_keys[integer], values[integer])
+        text_keys, text_values = index(text_keys, values[~integer])
+        return cls(int_keys, int_values, text_keys, text_values, default)
+
+    @classmethod
+    def from_mapping(cls, mapping, default=None):
+        return cls.from_columns(list(mapping), list(mapping.values()), default)
+
+    def with_default(self, default):
+        return replace(self, default=default)
+
+    def __len__(self):
+        return len(self.int_keys) + len(self.text_keys)
+
+    def __eq__(self, other):
+        # By content, so a stage keyed on an unchanged table is reused across reruns
+        if not isinstance(other, ReferenceTable):
+            return False
+        if self is other:
+            return True
+        return (self.default == other.default
+                and all(np.array_equal(getattr(self, name), getattr(other, name))
+                        for name in ("int_keys", "int_values", "text_keys", "text_values")))
+
+    @cached_property
+    def digest(self):
+        """Content hash, for keying shared caches on the table (``valuation.artefacts``)."""
+        digest = hashlib.sha256(repr(self.default).encode())
+        for keys, values in ((self.int_keys, self.int_values), (self.text_keys, self.text_values)):
+            digest.update(pd.util.hash_array(keys.astype(object)).tobytes())
+            digest.update(pd.util.hash_array(values.astype(object)).tobytes())
+        return digest.hexdigest()
+
+    def resolve(self, keys, default=None):
+        """Value of every key in ``keys``; the table's default (else ``default``) where it is not in the table."""
+        default = self.default if self.default is not None else default
+        int_keys, integer, text_keys = split_keys(key_text(keys))
+        values = np.full(len(keys), default, dtype=object)
+        matched = np.zeros(len(keys), dtype=bool)
+        for mask, sorted_keys, sorted_values, probe_keys in ((integer, self.int_keys, self.int_values, int_keys[integer]),
+                                                             (~integer, self.text_keys, self.text_values, text_keys)):
+            positions, found = probe(sorted_keys, probe_keys)
+            rows = np.flatnonzero(mask)[found]
+            values[rows] = sorted_values[positions[found]]
+            matched[rows] = True
+        return JoinResult(pd.Series(values, index=keys.index, dtype=object).infer_objects(), matched)
+
+
+def reference_table(table, default=None):
+    """
+    ``table`` as a ReferenceTable: a ReferenceTable as is, a dict indexed
+    (None for no table). ``default`` replaces the table's default when given.
+    """
+    if not isinstance(table, ReferenceTable):
+        table = ReferenceTable.from_mapping(table if table is not None else {})
+    return table.with_default(default) if default is not None else table
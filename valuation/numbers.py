@@ -0,0 +1,85 @@
+"""
+Numeric coercion for the amount, rate and term columns of the extract.
+
+Numbers in the extract are text formatted for reading ("4,385" for a
+Single Premium with the policy fee, "-250.00", "1.99E+11") or, for Excel
+uploads, real numbers. This module parses a whole column at once: numbers
+pass through, text is matched against one pattern (optional sign, digits
+with or without "," thousands separators, optional decimals and exponent)
+and converted in bulk, and each distinct value is only parsed once.
+
+Every value is reported as parsed, missing (blank) or failed (present but
+not a number, e.g. "N/A", "4,38" or "12%").
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+# Sign, integer part with or without thousands separators, decimals, exponent; ASCII digits only
+NUMBER_PATTERN = r"[+-]?(?:(?:[0-9]{1,3}(?:,[0-9]{3})+|[0-9]+)(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][+-]?[0-9]+)?"
+
+
+@dataclass
+class ParsedNumbers:
+    """A parsed numeric column: float64 values (NaN unless parsed) and the missing / failed rows."""
+    values: np.ndarray
+    missing: np.ndarray
+    failed: np.ndarray
+
+    @property
+    def parsed(self):
+        return ~(self.missing | self.failed)
+
+
+def is_number(value):
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+
+
+def parse_unique(uniques):
+    """(values, missing, failed) for an object array of distinct values."""
+    n = len(uniques)
+    values = np.full(n, np.nan)
+    numeric = np.fromiter((is_number(value) for value in uniques), dtype=bool, count=n)
+    values[numeric] = uniques[numeric].astype("float64")
+
+    text = pd.Series(np.where(numeric, "", uniques.astype(str)), dtype=object).str.strip()
+    blank = text.eq("").to_numpy() & ~numeric
+    matched = text.str.fullmatch(NUMBER_PATTERN).to_numpy(dtype=bool) & ~numeric
+    if matched.any():
+        values[matched] = text[matched].str.replace(",", "", regex=False).to_numpy(dtype=object).astype("float64")
+
+    missing = blank | (numeric & np.isnan(values))
+    failed = ~(missing | np.isfinite(values))
+    values[failed] = np.nan
+    return values, missing, failed
+
+
+def parse_numbers(values):
+    """Parse a column of numbers and number-formatted text."""
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        out = series.to_numpy(dtype="float64", na_value=np.nan, copy=True)
+        missing = np.isnan(out)
+        failed = np.isinf(out)
+        out[failed] = np.nan
+        return ParsedNumbers(out, missing, failed)
+
+    codes, uniques = pd.factorize(series)
+    unique_values, unique_missing, unique_failed = parse_unique(np.asarray(uniques, dtype=object))
+    # Missing values (code -1) stay missing
+    present = codes >= 0
+    out = np.full(len(series), np.nan)
+    missing = ~present
+    failed = np.zeros(len(series), dtype=bool)
+    out[present] = unique_values[codes[present]]
+    missing[present] = unique_missing[codes[present]]
+    failed[present] = unique_failed[codes[present]]
+    return ParsedNumbers(out, missing, failed)
+
+
+def to_numeric(values):
+    """float64 Series of a column's numbers, NaN where missing or not a number."""
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    return pd.Series(parse_numbers(series).values, index=series.index)
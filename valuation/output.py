@@ -0,0 +1,486 @@
+"""
+Step 8: Columnar builder for the 43 Prophet model point fields.
+
+Every field is computed on whole columns (string accessors, boolean masks,
+``Series.map`` and arithmetic) instead of a Python call per policy. Dates go
+through the shared date engine in ``valuation.dates``, amounts, rates and
+terms through the numeric parser in ``valuation.numbers`` (which, unlike
+the original ``isdigit`` check, reads thousands separators, negative
+numbers and exponents instead of treating them as 0).
+
+Fields that can be invalid are typed (nullable integers, floats,
+categoricals) and missing where invalid; why a row is invalid is recorded
+in one bitmask column, VALIDATION, with a bit per rule (``RULES``). The
+"Error" sentinels of the original row-by-row rules are only written on
+export (``export_frame``), which gives back the original int/float/text
+mix of each column value for value.
+"""
+import numpy as np
+import pandas as pd
+
+from valuation.dates import normalise_dates
+from valuation.fx import row_rates
+from valuation.joins import reference_table
+from valuation.numbers import parse_numbers
+
+
+# Plan Code prefix -> (PROPHET_CODE, PLAN_NO)
+PLAN_PREFIXES = [
+    ("PLAN07", "C_07MRP", 7),
+    ("PLAN11", "C_11MICRO", 11),
+    ("PLAN25", "C_25MRPTAKAFUL", 25),
+]
+
+# Values for keys missing from the reference tables (a table's own default takes precedence)
+RI_COMPANY_DEFAULT = "MunichRe"
+LOAN_TYPE_DEFAULT = "Error"
+
+# output_df.attrs key of {field: rows whose key is not in the reference table}
+UNMATCHED_ATTR = "unmatched"
+
+# Validation rules, one bit each in the VALIDATION column
+VALIDATION_COLUMN = "VALIDATION"
+INVALID_PLAN_CODE = 1 << 0
+INVALID_START_DATE = 1 << 1
+INVALID_BIRTH_DATE = 1 << 2
+INVALID_GENDER = 1 << 3
+INVALID_GENDER2 = 1 << 4
+INVALID_TERM = 1 << 5
+NO_EXCHANGE_RATE = 1 << 6
+INVALID_TPD_OPTION = 1 << 7
+UNKNOWN_LOAN_TYPE = 1 << 8
+
+# bit -> (rule, fields written as "Error" on export, description)
+RULES = {
+    INVALID_PLAN_CODE: ("plan_code", ("PROPHET_CODE", "PLAN_NO"), "Plan Code without a PLAN07 / PLAN11 / PLAN25 prefix"),
+    INVALID_START_DATE: ("start_date", ("COMM_DAT",), "No readable Policy Start Date"),
+    INVALID_BIRTH_DATE: ("birth_date", ("BIRTH_DAT",), "No readable DOB (Life 1), or one after the valuation date"),
+    INVALID_GENDER: ("gender", ("SEX",), "Gender (Life 1) is not male / female"),
+    INVALID_GENDER2: ("gender_2", ("SEX2",), "Gender (Life 2) is not male / female"),
+    INVALID_TERM: ("term", ("POL_TERM_Y",), "Blank, unreadable, zero or negative Policy Term (Months)"),
+    NO_EXCHANGE_RATE: ("exchange_rate", ("LOAN_AMT_1",), "No exchange rate for the currency"),
+    INVALID_TPD_OPTION: ("tpd_option", ("TPD_DECLINE",), "TPD Option - Life 1 is not Yes / No"),
+    UNKNOWN_LOAN_TYPE: ("loan_type", (), "Product Code not in the MRP_LOAN_TYPE table (LoanType is the default)"),
+}
+
+# How the original builder typed each field that can hold "Error": text,
+# inferred from the values (object), or numeric unless a row is invalid
+ERROR_FIELDS = {
+    "PROPHET_CODE": "text",
+    "PLAN_NO": "object",
+    "COMM_DAT": "numeric",
+    "BIRTH_DAT": "numeric",
+    "SEX": "object",
+    "SEX2": "object",
+    "POL_TERM_Y": "numeric",
+    "LOAN_AMT_1": "numeric",
+    "TPD_DECLINE": "object",
+}
+
+
+# ---------------------------------------------------------------------------
+# Column helpers
+# ---------------------------------------------------------------------------
+
+def as_text(series):
+    """``str(value)`` of every value as a string Series ("nan" for missing values, as ``str`` gives)."""
+    return pd.Series(np.asarray(series, dtype=object).astype(str), index=series.index)
+
+
+def finish(values, index):
+    """Wrap an object array and let pandas pick the dtype, as ``Series.apply`` does."""
+    return pd.Series(values, index=index, dtype=object).infer_objects()
+
+
+def to_number(series):
+    """
+    Columnar ``convert_to_number``: (float values, mask of converted rows).
+    Rows that are not converted (blank or not a number) hold 0.
+    """
+    parsed = parse_numbers(series)
+    converted = parsed.parsed
+    return np.where(converted, parsed.values, 0.0), converted
+
+
+def numeric_result(values, is_float, index):
+    """A column that is float where ``is_float`` and integer 0 elsewhere, typed like ``apply``."""
+    if is_float.any():
+        return pd.Series(values, index=index, dtype="float64")
+    return pd.Series(np.zeros(len(index), dtype="int64"), index=index)
+
+
+def nullable_int(values, missing, index, dtype="Int32"):
+    """A nullable integer column of ``values``, missing (NA) in the ``missing`` rows."""
+    values = np.asarray(values).astype(dtype.lower())
+    return pd.Series(pd.arrays.IntegerArray(values, np.array(missing, dtype=bool)), index=index)
+
+
+def clean_lower(series):
+    """``str(value).strip().lower()`` for every value, plus the missing / blank masks."""
+    missing = series.isna().to_numpy()
+    stripped = as_text(series).str.strip()
+    blank = (stripped == "").to_numpy(dtype=bool)
+    return stripped.str.lower(), stripped, missing, blank
+
+
+# ---------------------------------------------------------------------------
+# Field rules
+# ---------------------------------------------------------------------------
+
+def prophet_and_plan_no(plan_code):
+    """PROPHET_CODE (categorical) and PLAN_NO (Int8) from the Plan Code prefix, and the unknown-prefix mask."""
+    text = as_text(plan_code)
+    matches = [text.str.startswith(prefix).to_numpy(dtype=bool) for prefix, _, _ in PLAN_PREFIXES]
+    codes = np.select(matches, list(range(len(PLAN_PREFIXES))), default=-1)
+    unknown = codes < 0
+    prophet_code = pd.Categorical.from_codes(codes, [code for _, code, _ in PLAN_PREFIXES])
+    plan_no = np.array([number for _, _, number in PLAN_PREFIXES])[np.where(unknown, 0, codes)]
+    return pd.Series(prophet_code, index=plan_code.index), nullable_int(plan_no, unknown, plan_code.index, "Int8"), unknown
+
+
+def policy_numbers(policy_number):
+    """PolNo: digit-only text becomes an integer, everything else is kept as is."""
+    values = np.array(policy_number, dtype=object)
+    if pd.api.types.infer_dtype(values, skipna=True) == "string":
+        is_text = policy_number.notna().to_numpy()
+    else:  # Mixed Excel cells: only text is converted
+        is_text = np.fromiter((isinstance(value, str) for value in values), dtype=bool, count=len(values))
+    digits = is_text & as_text(policy_number).str.isdecimal().to_numpy(dtype=bool)
+    if digits.any():
+        text = values[digits].astype(str)
+        try:
+            values[digits] = text.astype("int64").tolist()
+        except (OverflowError, ValueError):
+            values[digits] = [int(value) for value in text]
+    return finish(values, policy_number.index)
+
+
+def birth_and_start_dates(dates, not_after=None):
+    """
+    COMM_DAT / BIRTH_DAT: 8-digit YYYYMMDD integers (0 where there is no
+    date) and the invalid mask: no date, or one after ``not_after`` (the
+    valuation date, for birth dates) once two-digit years are resolved.
+    """
+    parsed = normalise_dates(dates, not_after)
+    invalid = ~parsed.valid.to_numpy()
+    if not_after is not None:
+        invalid |= (parsed.dates > pd.Timestamp(not_after)).to_numpy(dtype=bool)
+    return parsed.yyyymmdd.to_numpy().astype("int64"), invalid
+
+
+def genders(gender):
+    """SEX / SEX2: male -> 0, female -> 1 (Int8), missing for anything else; and the invalid mask."""
+    lower, _, missing, blank = clean_lower(gender)
+    valid = ~(missing | blank)
+    male = valid & lower.isin(["male", "m"]).to_numpy()
+    female = valid & lower.isin(["female", "f"]).to_numpy()
+    invalid = ~(male | female)
+    return nullable_int(female.astype("int8"), invalid, gender.index, "Int8"), invalid
+
+
+def policy_term_years(months):
+    """POL_TERM_Y: term in years, NaN for blank, unreadable, zero or negative terms; and the invalid mask."""
+    values = parse_numbers(months).values
+    invalid = np.isnan(values) | (values <= 0)
+    return pd.Series(np.where(invalid, np.nan, values / 12), index=months.index), invalid
+
+
+def single_premiums(single_premium, rate, has_rate):
+    """SINGLE_PREM: premium converted to LKR (``valuation.fx``), 0 where the policy has no rate."""
+    amount, converted = to_number(single_premium)
+    values = np.where(has_rate, amount * rate, 0.0)
+    return numeric_result(values, has_rate & converted, single_premium.index)
+
+
+def loan_amounts(loan_amount, rate, has_rate):
+    """
+    LOAN_AMT_1: loan amount converted to LKR, missing where the policy has
+    no rate. Integer (0) when no amount is a number, as the original rule.
+    """
+    amount, converted = to_number(loan_amount)
+    values = np.where(has_rate, amount * rate, 0.0)
+    if not converted.any():
+        return nullable_int(values, ~has_rate, loan_amount.index, "Int64")
+    return pd.Series(np.where(has_rate, values, np.nan), index=loan_amount.index)
+
+
+def loan_interest(df):
+    """LOAN_INT_1: fixed rate, or current + additional AWPLR for variable loans."""
+    interest_type, _, _, _ = clean_lower(df['Interest Type'])
+    fixed = (interest_type == "fixed").to_numpy(dtype=bool)
+    variable = (interest_type == "variable").to_numpy(dtype=bool)
+
+    fixed_rate, fixed_converted = to_number(df['Fixed Interest'])
+    current, current_converted = to_number(df['Current AWPLR'])
+    additional, additional_converted = to_number(df['Additional AWPLR'])
+
+    values = np.select([fixed, variable], [fixed_rate, current + additional], default=0.0)
+    is_float = (fixed & fixed_converted) | (variable & (current_converted | additional_converted))
+    return numeric_result(values, is_float, df.index)
+
+
+def tpd_codes(tpd_option):
+    """Yes -> 0 ("N"), No -> 1 ("Y"), -1 for anything else (blank, "0", other text)."""
+    lower, stripped, missing, blank = clean_lower(tpd_option)
+    zero = (stripped == "0").to_numpy(dtype=bool)
+    valid = ~(missing | blank | zero)
+    codes = np.full(len(tpd_option), -1, dtype="int8")
+    codes[valid & (lower == "yes").to_numpy(dtype=bool)] = 0
+    codes[valid & (lower == "no").to_numpy(dtype=bool)] = 1
+    return codes
+
+
+def tpd_declines(tpd_option, blank_value):
+    """TPD_DECLINE2: Yes -> "N", No -> "Y", ``blank_value`` otherwise."""
+    codes = tpd_codes(tpd_option)
+    out = np.full(len(tpd_option), blank_value, dtype=object)
+    out[codes == 0] = "N"
+    out[codes == 1] = "Y"
+    return finish(out, tpd_option.index)
+
+
+def tpd_decline(tpd_option):
+    """TPD_DECLINE: categorical "N" / "Y", missing otherwise; and the invalid mask."""
+    codes = tpd_codes(tpd_option)
+    return pd.Series(pd.Categorical.from_codes(codes, ["N", "Y"]), index=tpd_option.index), codes < 0
+
+
+def unmatched_counts(output_df):
+    """{field: policies whose key is not in the reference table} of a ``process_data`` result."""
+    return dict(output_df.attrs.get(UNMATCHED_ATTR, {}))
+
+
+def generate_dov_indicator(date):
+    return f"M{date.month}_{date.year}"
+
+
+# ---------------------------------------------------------------------------
+# Output builder
+# ---------------------------------------------------------------------------
+
+def process_data(df, valuation_date, ri_company_dict, mrp_loan_type_dict, conversion=None):
+    """
+    Step 8: Build the 43 Prophet model point fields from the filtered
+    policies. ``conversion`` (``valuation.fx.Conversion``) selects the
+    exchange rates; by default the fixed LKR / USD rates.
+
+    The reference tables are ``joins.ReferenceTable`` (or plain dicts);
+    the number of policies each join leaves at its default is recorded in
+    ``output_data.attrs["unmatched"]``. The VALIDATION column after the 43
+    fields holds the broken rules of every policy (``RULES``); it is not
+    exported (``export_frame``).
+    """
+    output_data = pd.DataFrame(index=df.index)
+    validation = np.zeros(len(df), dtype="uint16")
+    prophet_code, plan_no, unknown_plan = prophet_and_plan_no(df['Plan Code'])
+    validation[unknown_plan] |= INVALID_PLAN_CODE
+    # Exchange rate of every policy, applied to all monetary fields
+    rate, has_rate = row_rates(df, valuation_date, conversion)
+
+    # 1. SPCODE (Static Value)
+    output_data['SPCODE'] = 1
+    output_data['SPCODE'] = output_data['SPCODE'].astype(int)
+
+    # 2. PROPHET_CODE (Derived from Plan Code)
+    output_data['PROPHET_CODE'] = prophet_code
+
+    # 3. PolNo (Integer or Text Based on Original Data Type)
+    output_data['PolNo'] = policy_numbers(df['Policy Number'])
+
+    # 4. PLAN_NO (Derived from Plan Code as Integer)
+    output_data['PLAN_NO'] = plan_no
+
+    # 5. COMM_DAT (Formatted as 8-digit YYYYMMDD as Integer from Policy Start Date)
+    comm_dat, no_start_date = birth_and_start_dates(df['Policy Start Date'])
+    output_data['COMM_DAT'] = nullable_int(comm_dat, no_start_date, df.index)
+    validation[no_start_date] |= INVALID_START_DATE
+
+    # 6. NEXT_DUE_DATE (Static Value)
+    output_data['NEXT_DUE_DATE'] = 0
+
+    # 7. BIRTH_DAT (Formatted as 8-digit YYYYMMDD as Integer from DOB (Life 1))
+    birth_dat, invalid_birth_date = birth_and_start_dates(df['DOB (Life 1)'], valuation_date)
+    output_data['BIRTH_DAT'] = nullable_int(birth_dat, invalid_birth_date, df.index)
+    validation[invalid_birth_date] |= INVALID_BIRTH_DATE
+
+    # 8. SEX (Mapped from Gender (Life 1))
+    output_data['SEX'], invalid_gender = genders(df['Gender (Life 1)'])
+    validation[invalid_gender] |= INVALID_GENDER
+
+    # 9. BIRTH_DAT2 (Formatted as 8-digit YYYYMMDD as Integer from DOB (Life 2))
+    output_data['BIRTH_DAT2'] = pd.Series(birth_and_start_dates(df['DOB (Life 2)'], valuation_date)[0], index=df.index)
+
+    # 10. SEX2 (Mapped from Gender (Life 2))
+    output_data['SEX2'], invalid_gender2 = genders(df['Gender (Life 2)'])
+    validation[invalid_gender2] |= INVALID_GENDER2
+
+    # 11. POL_TERM_Y (Policy Term in Years)
+    output_data['POL_TERM_Y'], invalid_term = policy_term_years(df['Policy Term (Months)'])
+    validation[invalid_term] |= INVALID_TERM
+
+    # 12. PREM_FREQ (Static Value)
+    output_data['PREM_FREQ'] = 0
+
+    # 13. ANNUAL_PREM (Static Value)
+    output_data['ANNUAL_PREM'] = 0
+
+    # 14. SINGLE_PREM (Extracted from Single Premium as Number)
+    output_data['SINGLE_PREM'] = single_premiums(df['Single Premium'], rate, has_rate)
+
+    # 15. SUM_ASSURED
+    output_data['SUM_ASSURED'] = 0
+
+    # 16. INIT_DECB_IF
+    output_data['INIT_DECB_IF'] = 0
+
+    # 17. LOAN_AMT_1
+    output_data['LOAN_AMT_1'] = loan_amounts(df['Loan Amount (Death Benefit) -Life 1'], rate, has_rate)
+    validation[~has_rate] |= NO_EXCHANGE_RATE
+
+    # 18. LOAN_AMT_2
+    output_data['LOAN_AMT_2'] = 0
+
+    # 19. LOAN_AMT_3
+    output_data['LOAN_AMT_3'] = 0
+
+    # 20. LOAN_INT_1 Calculation
+    output_data['LOAN_INT_1'] = loan_interest(df)
+
+    # 21. LOAN_INT_2
+    output_data['LOAN_INT_2'] = 0
+
+    # 22. LOAN_INT_3
+    output_data['LOAN_INT_3'] = 0
+
+    # 23. TPD_DECLINE Calculation
+    output_data['TPD_DECLINE'], invalid_tpd = tpd_decline(df['TPD Option  - Life 1'])
+    validation[invalid_tpd] |= INVALID_TPD_OPTION
+
+    # 24. TPD_DECLINE2 Calculation
+    output_data['TPD_DECLINE2'] = tpd_declines(df['TPD Option  - Life 2'], 0)
+
+    # 25. MAT_BEN_PP
+    output_data['MAT_BEN_PP'] = 0
+
+    # 26. CURR_FUND_BAL
+    output_data['CURR_FUND_BAL'] = 0
+
+    # 27. SUM_ASSD_HB
+    output_data['SUM_ASSD_HB'] = 0
+
+    # 28. ANN_ANNUITY
+    output_data['ANN_ANNUITY'] = 0
+
+    # 29. DEFER_PER_Y
+    output_data['DEFER_PER_Y'] = 0
+
+    # 30. RPR_COMPANY Mapping (Using Preloaded Table)
+    ri_company = reference_table(ri_company_dict).resolve(df['Policy Number'], RI_COMPANY_DEFAULT)
+    output_data['RPR_COMPANY'] = ri_company.values
+
+    # 31. SERIES_NO
+    output_data['SERIES_NO'] = 0
+
+    # 32. PREM_TERM_Y
+    output_data['PREM_TERM_Y'] = 0
+
+    # 33. GRACE_START_ONE
+    output_data['GRACE_START_ONE'] = 0
+
+    # 34. GRACE_PERIOD_ONE
+    output_data['GRACE_PERIOD_ONE'] = 0
+
+    # 35. DOV_INDICATOR Calculation
+    output_data['DOV_INDICATOR'] = generate_dov_indicator(valuation_date)
+
+    # 36. GRACE_START_TWO
+    output_data['GRACE_START_TWO'] = 0
+
+    # 37. GRACE_PERIOD_TWO
+    output_data['GRACE_PERIOD_TWO'] = 0
+
+    # 38. STUDY_GUARD_TYPE
+    output_data['STUDY_GUARD_TYPE'] = 0
+
+    # 39. MRP_LOAN_TYPE Mapping (Using Preloaded Table)
+    loan_type = reference_table(mrp_loan_type_dict).resolve(df['Product Code'], LOAN_TYPE_DEFAULT)
+    output_data['LoanType'] = loan_type.values
+    validation[~loan_type.matched] |= UNKNOWN_LOAN_TYPE
+
+    # 40. GRACE_START_THREE
+    output_data['GRACE_START_THREE'] = 0
+
+    # 41. GRACE_PERIOD_THREE
+    output_data['GRACE_PERIOD_THREE'] = 0
+
+    # 42. MCR_LOAN_TYPE
+    output_data['MCR_LOAN_TYPE'] = 0
+
+    # 43. CHANNEL_CODE
+    output_data['CHANNEL_CODE'] = "Partnership"
+
+    output_data[VALIDATION_COLUMN] = validation
+    output_data.attrs[UNMATCHED_ATTR] = {'RPR_COMPANY': ri_company.unmatched, 'LoanType': loan_type.unmatched}
+    return output_data
+
+
+# ---------------------------------------------------------------------------
+# Validation and export
+# ---------------------------------------------------------------------------
+
+def rule_mask(output_df, rules=None):
+    """Rows of a ``process_data`` result breaking any of ``rules`` (bits OR-ed together; default: any rule)."""
+    rules = rules if rules is not None else sum(RULES)
+    return (output_df[VALIDATION_COLUMN].to_numpy() & rules) != 0
+
+
+def validation_report(output_df):
+    """Policies breaking each validation rule (a policy can break several)."""
+    validation = output_df[VALIDATION_COLUMN].to_numpy()
+    return pd.DataFrame({
+        "rule": [rule for rule, _, _ in RULES.values()],
+        "fields": [", ".join(fields) for _, fields, _ in RULES.values()],
+        "description": [description for _, _, description in RULES.values()],
+        "policies": [np.count_nonzero(validation & bit) for bit in RULES],
+    })
+
+
+def invalid_counts(output_df):
+    """{rule: policies breaking it}, for the rules at least one policy breaks."""
+    validation = output_df[VALIDATION_COLUMN].to_numpy()
+    counts = {rule: np.count_nonzero(validation & bit) for bit, (rule, _, _) in RULES.items()}
+    return {rule: count for rule, count in counts.items() if count}
+
+
+def render_field(column, error, kind, sentinel):
+    """One field with ``sentinel`` in the ``error`` rows, typed as the original builder typed it (``ERROR_FIELDS``)."""
+    if kind == "numeric" and not error.any():
+        return pd.Series(column.to_numpy(dtype="int64" if pd.api.types.is_integer_dtype(column.dtype) else "float64"),
+                         index=column.index)
+    values = column.to_numpy(dtype=object)
+    values[error] = sentinel
+    if kind == "text":
+        return pd.Series(values.astype(str), index=column.index)
+    return finish(values, column.index)
+
+
+def render_errors(output_df, sentinel="Error"):
+    """The 43 fields with ``sentinel`` in every field of a broken rule, as the original row-by-row rules wrote them."""
+    validation = output_df[VALIDATION_COLUMN].to_numpy()
+    rendered = output_df.drop(columns=VALIDATION_COLUMN)
+    for bit, (_, fields, _) in RULES.items():
+        error = (validation & bit) != 0
+        for name in fields:
+            rendered[name] = render_field(rendered[name], error, ERROR_FIELDS[name], sentinel)
+    return rendered
+
+
+def export_frame(output_df, error_values=True):
+    """
+    The Step 8 output as written to the MP file and the model point files:
+    with "Error" in the invalid fields, or, without ``error_values``, typed
+    with the invalid fields left blank.
+    """
+    if error_values:
+        return render_errors(output_df)
+    return output_df.drop(columns=VALIDATION_COLUMN)
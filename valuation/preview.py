@@ -0,0 +1,129 @@
+"""
+Paginated, sortable previews for the Streamlit apps.
+
+``st.dataframe`` serialises the whole frame to the browser on every rerun,
+which for a large extract is tens of MB per widget change. These helpers
+slice out one page (optionally in sorted order) and convert only that page
+for display; the sort order and the column summary are computed once per
+frame and reused while the frame (the same object, as returned by the
+stage cache) is shown.
+"""
+import numpy as np
+import pandas as pd
+
+
+PAGE_SIZE = 100
+PAGE_SIZES = [25, 100, 500]
+
+# Sort choice meaning "rows in file order"
+FILE_ORDER = -1
+
+
+def page_count(rows, page_size=PAGE_SIZE):
+    return max(1, -(-rows // page_size))
+
+
+def sort_order(series, ascending=True):
+    """
+    Row positions of ``series`` in sorted order (stable, missing values
+    last). Columns mixing types that do not compare (text and numbers in an
+    Excel upload) are sorted by their text.
+    """
+    values = series.reset_index(drop=True)
+    try:
+        return values.sort_values(ascending=ascending, kind="stable", na_position="last").index.to_numpy()
+    except TypeError:
+        text = values.where(values.isna(), values.astype(str))
+        return text.sort_values(ascending=ascending, kind="stable", na_position="last").index.to_numpy()
+
+
+def summary(frame):
+    """Type and non-missing count of every column."""
+    return pd.DataFrame({"column": [str(name) for name in frame.columns],
+                         "dtype": [str(dtype) for dtype in frame.dtypes],
+                         "non-missing": frame.count().to_numpy()})
+
+
+def display_page(page):
+    """
+    A page made safe for Arrow serialisation: object columns mixing types
+    are shown as text (missing values stay missing). Only the page is converted.
+    """
+    columns = {}
+    for position in range(page.shape[1]):
+        column = page.iloc[:, position]
+        if column.dtype == object and pd.api.types.infer_dtype(column, skipna=True).startswith("mixed"):
+            columns[position] = column.where(column.isna(), column.astype(str))
+    if not columns:
+        return page
+    page = page.copy()
+    for position, column in columns.items():
+        page.isetitem(position, column)
+    return page
+
+
+class PreviewCache:
+    """Sort orders and summaries per preview, kept while the previewed frame is the same object."""
+
+    def __init__(self, store, namespace="preview_cache"):
+        if namespace not in store:
+            store[namespace] = {}
+        self.entries = store[namespace]
+
+    def _entry(self, key, frame):
+        entry = self.entries.get(key)
+        if entry is None or entry["frame"] is not frame:
+            entry = self.entries[key] = {"frame": frame, "orders": {}, "summary": None}
+        return entry
+
+    def order(self, key, frame, position, ascending):
+        orders = self._entry(key, frame)["orders"]
+        if (position, ascending) not in orders:
+            # Only the latest sort is kept
+            orders.clear()
+            orders[(position, ascending)] = sort_order(frame.iloc[:, position], ascending)
+        return orders[(position, ascending)]
+
+    def summary(self, key, frame):
+        entry = self._entry(key, frame)
+        if entry["summary"] is None:
+            entry["summary"] = summary(frame)
+        return entry["summary"]
+
+
+def page_view(frame, page, page_size=PAGE_SIZE, order=None):
+    """Rows of page ``page`` (0-based), in ``order`` (row positions) when given."""
+    start = page * page_size
+    positions = np.arange(start, min(start + page_size, len(frame))) if order is None else order[start:start + page_size]
+    return frame.iloc[positions]
+
+
+def paged_dataframe(frame, key, format_page=display_page, store=None):
+    """
+    Show ``frame`` one page at a time with sort and page controls, a row
+    count and a column summary. ``format_page`` prepares the visible page
+    for display; ``key`` must be unique per preview on the page.
+    """
+    import streamlit as st
+    cache = PreviewCache(st.session_state if store is None else store)
+
+    sort_col, order_col, size_col, page_col = st.columns([3, 1, 1, 1])
+    labels = {FILE_ORDER: "(file order)", **{position: str(name) for position, name in enumerate(frame.columns)}}
+    sort_by = sort_col.selectbox("Sort by", list(labels), format_func=labels.get, key=f"{key}_sort")
+    descending = order_col.selectbox("Order", [False, True], format_func=lambda d: "Descending" if d else "Ascending",
+                                     key=f"{key}_descending")
+    page_size = size_col.selectbox("Rows per page", PAGE_SIZES, index=PAGE_SIZES.index(PAGE_SIZE), key=f"{key}_size")
+    pages = page_count(len(frame), page_size)
+    # The frame may have shrunk since the page was chosen
+    if st.session_state.get(f"{key}_page", 1) > pages:
+        st.session_state[f"{key}_page"] = pages
+    page = page_col.number_input("Page", min_value=1, max_value=pages, step=1, key=f"{key}_page")
+
+    order = None if sort_by == FILE_ORDER or sort_by >= frame.shape[1] else cache.order(key, frame, sort_by, not descending)
+    view = page_view(frame, page - 1, page_size, order)
+    st.dataframe(format_page(view) if format_page is not None else view)
+
+    first = (page - 1) * page_size
+    st.caption(f"Rows {min(first + 1, len(frame)):,}–{first + len(view):,} of {len(frame):,} · {frame.shape[1]} columns")
+    with st.expander("Column summary"):
+        st.dataframe(cache.summary(key, frame), hide_index=True)
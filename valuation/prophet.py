@@ -0,0 +1,269 @@
+"""
+Prophet model point files (.RPT) from the Step 8 output.
+
+Each PROPHET_CODE gets its own file in the layout Prophet loads:
+
+    OUTPUT_FORMAT,1
+    NUMLINES,2
+    VARIABLE_TYPES,T1,I,T14,I,...
+    !,SPCODE,PROPHET_CODE,PolNo,...
+    *,1,"C_07MRP",1234567,...
+
+Columns of integers are declared I, of other numbers N and anything else
+T + the widest value (quoted), from the values in that file. Rows without
+a known PROPHET_CODE (an unknown plan code) go into no file;
+``omitted_rows`` counts them. Rows are formatted a chunk at a time: each
+distinct value is formatted once and the lines are assembled as raw bytes
+with numpy, so memory stays flat however many policies there are.
+"""
+import os
+import shutil
+import zipfile
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from valuation.output import PLAN_PREFIXES
+
+
+PROPHET_CODES = [code for _, code, _ in PLAN_PREFIXES]
+RPT_EXTENSION = ".RPT"
+ZIP_MIME = "application/zip"
+MPF_ZIP_FILE = "model_point_files.zip"
+CHUNK_SIZE = 100_000
+NEWLINE = b"\r\n"
+
+# Column kinds, in merge order: a column with no values takes the kind of the other chunks
+EMPTY, INTEGER, FLOAT, TEXT = -1, 0, 1, 2
+INTEGER_VALUES = {"integer", "boolean"}
+FLOAT_VALUES = {"floating", "mixed-integer-float", "decimal"}
+
+
+def rpt_file_name(prophet_code):
+    return f"{prophet_code}{RPT_EXTENSION}"
+
+
+def column_kinds(df):
+    """
+    Per column (kind, width) of the values written: INTEGER, FLOAT, TEXT,
+    or EMPTY when the column holds no value; width is the length of its
+    longest value as text. The kind comes from the non-missing values, not
+    the dtype, so a column of numbers is numeric even where other rows of
+    the frame made it object ("Error"). Kinds of the chunks of a frame
+    merge with ``merge_kinds`` into the frame's kinds.
+    """
+    kinds = []
+    for position in range(df.shape[1]):
+        uniques = pd.Series(pd.unique(df.iloc[:, position].dropna()), dtype=object)
+        values = pd.api.types.infer_dtype(uniques, skipna=True)
+        if values == "empty":
+            kind = EMPTY
+        elif values in INTEGER_VALUES:
+            kind = INTEGER
+        elif values in FLOAT_VALUES:
+            kind = FLOAT
+        else:
+            kind = TEXT
+        width = int(uniques.astype(str).str.len().max()) if len(uniques) else 0
+        kinds.append((kind, width))
+    return kinds
+
+
+def merge_kinds(kinds, other):
+    if kinds is None:
+        return other
+    return [(max(a, c), max(b, d)) for (a, b), (c, d) in zip(kinds, other)]
+
+
+def type_codes(kinds):
+    """
+    Prophet variable types for column kinds: I (integer), N (numeric, and
+    a column with no values in the file) or T<width> (text).
+    """
+    return ["I" if kind == INTEGER else "N" if kind in (FLOAT, EMPTY) else f"T{max(width, 1)}" for kind, width in kinds]
+
+
+def variable_types(df):
+    """Prophet variable type per column: I (integer), N (numeric) or T<width> (text)."""
+    return type_codes(column_kinds(df))
+
+
+def omitted_rows(output_df):
+    """Rows written to no model point file: PROPHET_CODE "Error" or missing."""
+    return int((~output_df['PROPHET_CODE'].isin(PROPHET_CODES)).sum())
+
+
+def header_lines(columns, types, numlines):
+    return [
+        "OUTPUT_FORMAT,1",
+        f"NUMLINES,{numlines}",
+        "VARIABLE_TYPES," + ",".join(["T1"] + types),
+        "!," + ",".join(str(name) for name in columns),
+    ]
+
+
+def format_value(value):
+    """One value as MPF text: numbers bare, text quoted, missing values empty."""
+    if isinstance(value, (bool, np.bool_)):
+        return str(int(value))
+    if isinstance(value, (int, np.integer)):
+        return str(value)
+    if isinstance(value, (float, np.floating)):
+        return "" if np.isnan(value) else repr(float(value))
+    if value is None or value is pd.NA or value is pd.NaT:
+        return ""
+    return '"' + str(value).replace('"', "'") + '"'
+
+
+def column_text(series):
+    """
+    A column as (codes, texts): the MPF text of each distinct value as bytes
+    and each row's index into it. Only the distinct values are formatted.
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    uniques = np.asarray(uniques)
+    if uniques.dtype.kind in "iu":
+        texts = uniques.astype("S")
+    elif uniques.dtype.kind == "f":
+        texts = np.where(np.isnan(uniques), b"", uniques.astype("S"))
+    else:
+        texts = np.array([format_value(value).encode("utf-8") for value in uniques], dtype="S")
+    return codes, texts
+
+
+def format_lines(chunk):
+    """
+    The ``*`` data lines for a chunk of the output frame, as bytes.
+
+    Columns holding one value in the chunk (most of the static fields) are
+    folded into literal byte runs; the rest are copied into one flat byte
+    buffer with numpy scatters, one per column.
+    """
+    n = len(chunk)
+    pieces = []  # (codes or None for a literal, texts)
+    literal = b"*"
+    for position in range(chunk.shape[1]):
+        codes, texts = column_text(chunk.iloc[:, position])
+        literal += b","
+        if len(texts) == 1:
+            literal += texts[0]
+            continue
+        pieces.append((None, np.array([literal], dtype="S")))
+        pieces.append((codes, texts))
+        literal = b""
+    pieces.append((None, np.array([literal + NEWLINE], dtype="S")))
+
+    lengths = [np.char.str_len(texts) if codes is None else np.char.str_len(texts)[codes] for codes, texts in pieces]
+    line_lengths = sum(lengths)
+    offsets = np.zeros(n, dtype="int64")
+    np.cumsum(line_lengths[:-1], out=offsets[1:])
+    out = np.empty(int(line_lengths.sum()), dtype="uint8")
+
+    for (codes, texts), length in zip(pieces, lengths):
+        width = texts.dtype.itemsize
+        data = texts.view("uint8").reshape(len(texts), width)
+        if codes is None:
+            width = int(length[0])
+            out[offsets[:, None] + np.arange(width)] = data[0, :width]
+        else:
+            keep = np.arange(width) < length[:, None]
+            out[(offsets[:, None] + np.arange(width))[keep]] = data[codes][keep]
+        offsets += length
+    return out.tobytes()
+
+
+def write_mpf(output_df, open_file, chunk_size=CHUNK_SIZE):
+    """
+    Stream ``output_df`` into one model point file per PROPHET_CODE.
+
+    ``open_file(prophet_code)`` returns a writable binary file. Each file's
+    variable types come from its own rows. Rows without a known PROPHET_CODE
+    are not written (``omitted_rows``). Returns {prophet_code: rows written}.
+    """
+    codes = output_df['PROPHET_CODE'].to_numpy()
+
+    written = {}
+    for code in PROPHET_CODES:
+        rows = np.flatnonzero(codes == code)
+        if not len(rows):
+            continue
+        types = variable_types(output_df.iloc[rows])
+        # One file open at a time, so the same code writes into a zip archive
+        with open_file(code) as f:
+            f.write(NEWLINE.join(line.encode("utf-8") for line in header_lines(output_df.columns, types, len(rows))) + NEWLINE)
+            for start in range(0, len(rows), chunk_size):
+                f.write(format_lines(output_df.iloc[rows[start:start + chunk_size]]))
+        written[code] = len(rows)
+    return written
+
+
+def write_mpf_files(output_df, output_dir, chunk_size=CHUNK_SIZE):
+    """Write ``<PROPHET_CODE>.RPT`` files into ``output_dir``; returns the written paths."""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {code: os.path.join(output_dir, rpt_file_name(code)) for code in PROPHET_CODES}
+    written = write_mpf(output_df, lambda code: open(paths[code], "wb"), chunk_size)
+    return [paths[code] for code in written]
+
+
+def mpf_zip_bytes(output_df, chunk_size=CHUNK_SIZE):
+    """All model point files of ``output_df`` in one zip (for the download button)."""
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        write_mpf(output_df, lambda code: archive.open(rpt_file_name(code), "w"), chunk_size)
+    return buffer.getvalue()
+
+
+class MpfWriter:
+    """
+    Model point files written chunk by chunk (streaming mode).
+
+    Each chunk's lines are appended to a ``.part`` file per PROPHET_CODE;
+    ``close`` writes the header, whose line count and variable types are
+    only known at the end, and moves the lines in behind it. ``omitted``
+    counts the rows without a known PROPHET_CODE.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.columns = None
+        self.kinds = {}
+        self.counts = {}
+        self.omitted = 0
+        self._parts = {}
+
+    def path(self, prophet_code):
+        return os.path.join(self.output_dir, rpt_file_name(prophet_code))
+
+    def write(self, output_df):
+        if self.columns is None:
+            self.columns = list(output_df.columns)
+        if output_df.empty:
+            return
+        self.omitted += omitted_rows(output_df)
+        codes = output_df['PROPHET_CODE'].to_numpy()
+        for code in PROPHET_CODES:
+            rows = np.flatnonzero(codes == code)
+            if not len(rows):
+                continue
+            if code not in self._parts:
+                os.makedirs(self.output_dir, exist_ok=True)
+                self._parts[code] = open(self.path(code) + ".part", "wb")
+            chunk = output_df.iloc[rows]
+            self.kinds[code] = merge_kinds(self.kinds.get(code), column_kinds(chunk))
+            self._parts[code].write(format_lines(chunk))
+            self.counts[code] = self.counts.get(code, 0) + len(rows)
+
+    def close(self):
+        """Finish the files; returns the written paths."""
+        written = []
+        for code, part in self._parts.items():
+            part.close()
+            types = type_codes(self.kinds[code])
+            with open(self.path(code), "wb") as f, open(part.name, "rb") as lines:
+                f.write(NEWLINE.join(line.encode("utf-8") for line in header_lines(self.columns, types, self.counts[code])) + NEWLINE)
+                shutil.copyfileobj(lines, f)
+            os.remove(part.name)
+            written.append(self.path(code))
+        self._parts = {}
+        return written
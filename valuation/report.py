@@ -0,0 +1,110 @@
+"""
+Report layout of the NB_MIS_12HNB extract: header row and page banners.
+
+The extract is a printed report. Each page starts with a banner ("Main data
+extraction", "From ... To ...", "REPORT ID : NB_MIS_12HNB" and the User /
+Print Date / Page Number cells on the right). Then, on the first page and
+possibly on every page, comes the column header. This module finds the
+header from the first rows of the raw grid only. It then marks the banner
+and repeated header rows inside the body, so they can be dropped in the
+same pass that applies the header.
+"""
+import numpy as np
+
+
+# Column names that identify the header row; a row holding this many of them is the header
+HEADER_SIGNATURE = [
+    "Policy Number",
+    "Product Code",
+    "Plan Code",
+    "Policy Start Date",
+    "Policy Term (Months)",
+    "Currency",
+    "Policy Status",
+]
+MIN_SIGNATURE_MATCHES = 3
+
+# Only this many raw rows are scanned for the header
+DETECT_ROWS = 50
+
+
+def cell_text(frame):
+    """Stripped text of every cell (missing cells stay missing)."""
+    return frame.apply(lambda column: column.astype("str").str.strip() if column.notna().any() else column)
+
+
+def detect_header_row(grid, max_rows=DETECT_ROWS):
+    """
+    The Step 3 "Header Row" value for a raw grid (the column names are on
+    raw row ``header_row + 1``), or None when no row in the first
+    ``max_rows`` looks like the NB_MIS_12HNB header.
+    """
+    head = cell_text(grid.iloc[:max_rows])
+    matches = head.isin(HEADER_SIGNATURE).sum(axis=1).to_numpy()
+    found = np.flatnonzero(matches >= MIN_SIGNATURE_MATCHES)
+    if not len(found) or found[0] == 0:
+        return None
+    return int(found[0]) - 1
+
+
+def banner_cells(banner):
+    """
+    {column position: labels} from the banner rows above the header. Only
+    cells containing a letter are kept: labels and report titles repeat on
+    every page, page numbers and separators (":", "/") do not identify one.
+    """
+    cells = {}
+    text = cell_text(banner)
+    for position in range(text.shape[1]):
+        values = text.iloc[:, position].dropna()
+        labels = set(values[values.str.contains(r"[A-Za-z]", regex=True)])
+        if labels:
+            cells[position] = labels
+    return cells
+
+
+def covering_cells(banner, cells, preferred=()):
+    """
+    The smallest set of ``cells`` columns (greedily) that still recognises
+    every banner row, for reads that parse only some columns. Columns in
+    ``preferred`` (read anyway) are taken first.
+    """
+    text = cell_text(banner)
+    hits = {position: set(np.flatnonzero(text.iloc[:, position].isin(labels).to_numpy(dtype=bool)))
+            for position, labels in cells.items()}
+    uncovered = set().union(*hits.values()) if hits else set()
+    chosen = {}
+    for position in preferred:
+        if position in hits and hits[position] & uncovered:
+            chosen[position] = cells[position]
+            uncovered -= hits[position]
+    while uncovered:
+        position = max(hits, key=lambda p: len(hits[p] & uncovered))
+        chosen[position] = cells[position]
+        uncovered -= hits[position]
+    return chosen
+
+
+def banner_mask(body, header, cells):
+    """
+    Rows of a body frame that are page banners or repeated header rows.
+
+    ``body`` is still labelled by raw column position (as sliced from the
+    raw grid, possibly only some of its columns). ``header`` is the list of
+    raw header cells and ``cells`` the labels from ``banner_cells``. Only
+    the banner columns and the signature columns are examined.
+    """
+    mask = np.zeros(len(body), dtype=bool)
+    for position, labels in cells.items():
+        if position in body.columns:
+            column = body[position]
+            mask |= column.astype("str").str.strip().isin(labels).to_numpy(dtype=bool) & column.notna().to_numpy()
+
+    signature = [position for position, name in enumerate(header)
+                 if isinstance(name, str) and name.strip() in HEADER_SIGNATURE and position in body.columns]
+    if len(signature) >= MIN_SIGNATURE_MATCHES:
+        repeats = np.zeros(len(body), dtype="int64")
+        for position in signature:
+            repeats += (body[position].astype("str").str.strip() == header[position].strip()).to_numpy(dtype=bool)
+        mask |= repeats >= MIN_SIGNATURE_MATCHES
+    return mask
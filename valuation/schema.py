@@ -0,0 +1,81 @@
+"""
+Projected, typed read schema for the NB_MIS_12HNB extract.
+
+The report has 68 columns, but the pipeline reads only about 20 of them.
+A projected read parses just those columns (plus the few columns the
+page banners use, dropped after the banners are stripped). This keeps
+names, NIC numbers, addresses and the loading columns out of memory. It
+also types the columns once, up front:
+
+* category:  low-cardinality codes and labels
+* float64:   amounts and rates, parsed as Step 8 parses them
+             (``valuation.numbers``); blanks and values that are not numbers
+             are NaN, which Step 8 treats the same as an unreadable value.
+             float32 is not used: it changes the amounts and rates written
+             to the MP file (9.92 becomes 9.920000076...).
+* term:      Policy Term (Months), parsed the same way. It is Int64 when
+             every term is whole, else float64, because Step 6 turns
+             fractional months into days.
+* object:    kept as read (policy numbers and the mixed-encoding dates)
+"""
+import numpy as np
+
+from valuation.numbers import to_numeric
+
+NB_MIS_12HNB_SCHEMA = {
+    "Policy Number": "object",
+    "Bank": "category",
+    "Branch Name": "category",
+    "Product Code": "category",
+    "Plan Code": "category",
+    "DOB (Life 1)": "object",
+    "Gender (Life 1)": "category",
+    "DOB (Life 2)": "object",
+    "Gender (Life 2)": "category",
+    "Policy Start Date": "object",
+    "Policy Term (Months)": "term",
+    "Interest Type": "category",
+    "Fixed Interest": "float64",
+    "Current AWPLR": "float64",
+    "Additional AWPLR": "float64",
+    "TPD Option  - Life 1": "category",
+    "TPD Option  - Life 2": "category",
+    "Loan Amount (Death Benefit) -Life 1": "float64",
+    "Currency": "category",
+    "Exchange Rate (Higher Rate)": "float64",
+    "Exchange Rate (Current Rate)": "float64",
+    "Single Premium": "float64",
+    "Policy Status": "category",
+}
+
+
+def schema_positions(header, schema=NB_MIS_12HNB_SCHEMA):
+    """{position: column name} of the schema columns found in a raw header row."""
+    positions = {}
+    for position, name in enumerate(header):
+        if isinstance(name, str) and name in schema and name not in positions.values():
+            positions[position] = name
+    return positions
+
+
+def to_term(series):
+    values = to_numeric(series)
+    finite = values.dropna()
+    if (finite == np.trunc(finite)).all() and (finite.abs() < 2 ** 53).all():
+        return values.astype("Int64")
+    return values
+
+
+def apply_schema(df, schema=NB_MIS_12HNB_SCHEMA):
+    """Cast the columns of a header-applied frame to their schema types (other columns are left alone)."""
+    columns = {}
+    for name, kind in schema.items():
+        if name not in df:
+            continue
+        if kind == "category":
+            columns[name] = df[name].astype("category")
+        elif kind == "float64":
+            columns[name] = to_numeric(df[name])
+        elif kind == "term":
+            columns[name] = to_term(df[name])
+    return df.assign(**columns) if columns else df
@@ -0,0 +1,213 @@
+"""
+Incremental execution of the pipeline for the Streamlit apps.
+
+The pipeline is modelled as a chain of stages:
+
+    ingest -> header -> exclusion plan (Steps 4-6) -> status filter -> output build
+
+Each stage's result is memoised under a key made of its own inputs and
+its upstream stage's key. A widget change therefore only re-runs the
+stages at and below the step it affects: toggling a policy status re-runs
+Step 7 and Step 8 only. Steps 4-6 are one stage: the exclusion planner
+evaluates them in one pass. The results are shared by all sessions, in
+the byte-bounded ``valuation.artefacts`` cache; a mutable mapping
+(``st.session_state`` in the app) keeps each session's keys and counts.
+Download workbooks are not a stage: they are built on click and cached by
+``valuation.exports``. Parsed uploads are also cached on disk across
+sessions, by ``valuation.upload_cache``.
+
+Every stage, and every download when it is built, is measured by
+``valuation.instrument``; the session keeps the last measurement of each
+for the app's "Performance" panel (``performance``).
+"""
+import hashlib
+from io import BytesIO
+
+from valuation import engine, exports, instrument, prophet
+from valuation.artefacts import artefact_cache, key_digest
+from valuation.exclusions import RETAINED, plan_exclusions
+from valuation.upload_cache import upload_cache
+
+
+STAGES = ["ingest", "header", "exclusions", "status", "output"]
+
+
+def read_grid(data, name, digest=None):
+    if digest is None:
+        grid = engine.read_raw(BytesIO(data), name)
+    else:
+        # The same bytes parse differently as CSV and as Excel
+        key = f"{digest}-{'csv' if engine.is_csv(name) else 'excel'}"
+        grid = upload_cache.get(key, lambda: engine.read_raw(BytesIO(data), name))
+    return grid, engine.find_header_row(grid)
+
+
+class StageCache:
+    """
+    Stage results of one session. The results are held once per process
+    in ``artefacts`` (``valuation.artefacts``), keyed by a digest of the
+    stage key, so sessions with the same upload and choices share them;
+    ``store`` (under ``namespace``) only keeps the session's digests and
+    counts.
+    """
+
+    def __init__(self, store, namespace="stage_cache", artefacts=None):
+        if namespace not in store:
+            store[namespace] = {"entries": {}, "runs": {}, "hits": {}, "seconds": {}, "records": {}}
+        self.state = store[namespace]
+        self.artefacts = artefacts if artefacts is not None else artefact_cache
+
+    def run(self, stage, key, func, *args, rows_in=None, rows=len):
+        """
+        The stage result, computed with ``func(*args)`` unless cached, and
+        measured as an ``instrument`` step with ``rows(value)`` rows out.
+        The measurement of a computed stage is kept for ``records``.
+        """
+        digest = key_digest((stage, key))
+        with instrument.step(stage, rows_in) as record:
+            value, cached = self.artefacts.get_or_compute(digest, stage, func, *args)
+            record.cached = cached
+            record.rows_out = rows(value)
+        if cached:
+            self.state["hits"][stage] = self.state["hits"].get(stage, 0) + 1
+        else:
+            self.state["seconds"][stage] = record.wall_s
+            self.state["runs"][stage] = self.state["runs"].get(stage, 0) + 1
+            self.state.setdefault("records", {})[stage] = record.to_dict()
+        self.state["entries"][stage] = digest
+        return value
+
+    def records(self):
+        """The last measurement (``StepRecord.to_dict``) of each stage computed in this session, in stage order."""
+        records = self.state.get("records", {})
+        return [records[stage] for stage in STAGES if stage in records]
+
+    def stats(self):
+        """Runs, cache hits and last run time per stage."""
+        return [{"stage": stage,
+                 "runs": self.state["runs"].get(stage, 0),
+                 "hits": self.state["hits"].get(stage, 0),
+                 "last_seconds": self.state["seconds"].get(stage)}
+                for stage in STAGES if stage in self.state["runs"] or stage in self.state["hits"]]
+
+
+class IncrementalPipeline:
+    """
+    The Step 2-8 pipeline with each stage memoised in a StageCache.
+
+    Call the stages in order; each one returns the same values as the
+    corresponding ``engine`` function.
+    """
+
+    def __init__(self, store, namespace="stage_cache", artefacts=None):
+        self.cache = StageCache(store, namespace, artefacts)
+        self.keys = {}
+
+    def _run(self, stage, upstream, params, func, *args, rows_in=None, rows=len):
+        key = (self.keys.get(upstream), params) if upstream else params
+        self.keys[stage] = key
+        return self.cache.run(stage, key, func, *args, rows_in=rows_in, rows=rows)
+
+    def ingest(self, data, name, nrows=10, file_id=None):
+        """
+        Parse the uploaded bytes once into a raw grid and return the preview
+        rows; the header row detected in the grid is kept in
+        ``detected_header_row``. ``file_id`` (the Streamlit upload id) lets
+        re-runs skip re-hashing the same upload.
+        """
+        digests = self.cache.state.setdefault("digests", {})
+        digest = digests.get(file_id) if file_id is not None else None
+        if digest is None:
+            digest = hashlib.sha256(data).hexdigest()
+            if file_id is not None:
+                digests.clear()
+                digests[file_id] = digest
+        self.grid, self.detected_header_row = self._run("ingest", None, (digest, name), read_grid, data, name, digest,
+                                                        rows=lambda value: len(value[0]))
+        return engine.preview_rows(self.grid, nrows)
+
+    def header(self, header_row, prepare=None):
+        """Header-applied extract sliced from the raw grid; ``prepare`` is an optional clean-up run once on the result."""
+        def apply():
+            input_df = engine.apply_header(self.grid, header_row)
+            return prepare(input_df) if prepare is not None else input_df
+        return self._run("header", "ingest", (header_row, getattr(prepare, "__qualname__", None)), apply,
+                         rows_in=len(self.grid))
+
+    def exclusions(self, input_df, ignored_product_codes, valuation_date):
+        """Steps 4-6: the ``exclusions.ExclusionPlan`` of the extract; its downloads are built once per plan."""
+        return self._run("exclusions", "header", (tuple(ignored_product_codes), valuation_date),
+                         plan_exclusions, input_df, ignored_product_codes, valuation_date,
+                         rows_in=len(input_df), rows=lambda plan: int(plan.status_candidates.sum()))
+
+    def status(self, plan, selected_status):
+        """Step 7: the plan with the selected statuses applied (``plan.filtered_df`` is the Step 8 input)."""
+        return self._run("status", "exclusions", tuple(selected_status), plan.with_status, selected_status,
+                         rows_in=int(plan.status_candidates.sum()), rows=lambda plan: int((plan.reason == RETAINED).sum()))
+
+    def output(self, filtered_df, valuation_date, ri_company_dict, mrp_loan_type_dict, conversion=None):
+        # The tables are cached per process, so an unchanged table is the same object
+        return self._run("output", "status", (valuation_date, ri_company_dict, mrp_loan_type_dict, conversion),
+                         engine.process_data, filtered_df, valuation_date, ri_company_dict, mrp_loan_type_dict, conversion,
+                         rows_in=len(filtered_df))
+
+    def _measured(self, file_name, rows, data):
+        """
+        ``data`` (a download callable) measured when it is called: the
+        measurement is kept for the Performance panel and written to the
+        run log as a run of its own.
+        """
+        records = self.cache.state.setdefault("exports", {})
+
+        def measured():
+            run_log = instrument.RunLog("download", file=file_name)
+            try:
+                with instrument.step(f"export {file_name}", rows, log=run_log) as record:
+                    value = data()
+                    record.rows_out = rows
+            finally:
+                records[file_name] = record.to_dict()
+                run_log.finish()
+            return value
+        return measured
+
+    def export(self, frame, file_name="download.xlsx"):
+        """Download callable for ``frame``: the xlsx is built on click and cached by content."""
+        return self._measured(file_name, len(frame), exports.lazy_workbook(frame))
+
+    def export_output(self, output_df, error_values=True):
+        """Download callable for the Step 8 output workbook, rendered for export on click."""
+        return self._measured(engine.OUTPUT_FILE, len(output_df), exports.lazy_output(output_df, error_values))
+
+    def export_mpf(self, output_df, error_values=True):
+        """Download callable for the zipped Prophet model point files of the Step 8 output."""
+        return self._measured(prophet.MPF_ZIP_FILE, len(output_df), exports.lazy_mpf_zip(output_df, error_values))
+
+    def stats(self):
+        return self.cache.stats()
+
+    def performance(self):
+        """
+        The last measurement of each stage computed in this session and of
+        each download built, as a table (``instrument.records_frame``).
+        """
+        return instrument.records_frame(self.cache.records() + list(self.cache.state.get("exports", {}).values()))
+
+    def upload_stats(self):
+        """Hits, misses, entries and size of the on-disk cache of parsed uploads."""
+        return upload_cache.stats()
+
+    def memory_report(self):
+        """
+        Memory use of the caches shared by all sessions: one row per stage
+        artefact (see ``artefacts.ArtefactCache.report``) and the totals of
+        the artefact, workbook and upload caches.
+        """
+        totals = {"artefacts": self.cache.artefacts.stats(), "workbooks": exports.workbook_cache.stats(),
+                  "uploads": upload_cache.stats()}
+        return self.cache.artefacts.report(), totals
+
+    def clear_shared(self):
+        """Empty the artefact and workbook caches of all sessions (the stages re-run on next use)."""
+        self.cache.artefacts.clear()
+        exports.workbook_cache.clear()
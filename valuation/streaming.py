@@ -0,0 +1,232 @@
+"""
+Chunked streaming mode for extracts too large to hold in memory.
+
+The extract is read ``chunk_size`` raw rows at a time; every chunk gets the
+header applied and its page banners stripped, then goes through the same
+Steps 4-8 as the in-memory pipeline (``engine.run_pipeline``). The results
+are appended to the sinks as they come: CSV files for the MP file and the
+exclusion files (xlsx cannot be appended to, and stops at 1,048,576 rows),
+and the Prophet model point files. Peak memory depends on the chunk size,
+not on the size of the file.
+
+Every step works row by row except the day/month order of text dates, which
+is inferred per chunk instead of per column. Day-first extracts (as
+NB_MIS_12HNB is) give the same values as the in-memory path. The amounts
+Step 8 types from the whole column (``FLOAT_FIELDS``) are always float here,
+so every chunk writes them the same way.
+"""
+import os
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from valuation import engine, instrument
+from valuation.exclusions import combine_summaries
+from valuation.prophet import MpfWriter
+from valuation.report import DETECT_ROWS, banner_cells, banner_mask
+
+
+CHUNK_SIZE = 100_000
+
+# Integer 0 in-memory when no value in the column is a number, float otherwise;
+# a chunk cannot see the rest of the column, so streaming always writes float
+FLOAT_FIELDS = ("SINGLE_PREM", "LOAN_AMT_1", "LOAN_INT_1")
+
+
+def csv_file_name(file_name):
+    return os.path.splitext(file_name)[0] + ".csv"
+
+
+def iter_raw(source, name=None, chunk_size=CHUNK_SIZE, skiprows=0, usecols=None):
+    """
+    Raw grid chunks (no header), as ``engine.read_raw`` would return them in
+    one piece; ``skiprows`` and ``usecols`` (raw positions) as in ``pd.read_csv``.
+    """
+    name = name if name is not None else getattr(source, "name", source)
+    if engine.is_csv(name):
+        yield from pd.read_csv(source, header=None, dtype=str, chunksize=chunk_size, skiprows=skiprows, usecols=usecols)
+        return
+
+    # pandas cannot stream xlsx; openpyxl's read-only mode can
+    from openpyxl import load_workbook
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = []
+        for row in workbook.worksheets[0].iter_rows(min_row=skiprows + 1, values_only=True):
+            rows.append(row if usecols is None else tuple(row[i] if i < len(row) else None for i in usecols))
+            if len(rows) == chunk_size:
+                yield raw_frame(rows, usecols)
+                rows = []
+        if rows:
+            yield raw_frame(rows, usecols)
+    finally:
+        workbook.close()
+
+
+def raw_frame(rows, usecols=None):
+    frame = pd.DataFrame(rows, columns=usecols, dtype=object)
+    # openpyxl gives None and "" for blank cells where read_excel gives NaN
+    return frame.where(frame.notna() & (frame != ""), np.nan)
+
+
+def iter_extract(source, header_row=None, name=None, chunk_size=CHUNK_SIZE, schema=None):
+    """
+    Header-applied chunks of ``chunk_size`` rows or fewer (before banners
+    are stripped), page banners stripped. The header is detected from the
+    first rows (``engine.read_head``) unless ``header_row`` is given. With a
+    ``schema`` only its columns are read, typed (``engine.read_projected``).
+    """
+    name = name if name is not None else getattr(source, "name", source)
+    head = read_head(source, name, header_row)
+    if schema is not None:
+        yield from iter_projected(source, head, header_row, name, chunk_size, schema)
+        return
+
+    if header_row is None:
+        header_row = engine.find_header_row(head)
+    if header_row + 1 >= len(head):
+        raise ValueError("No valid columns detected after skipping the selected header row. Please choose a different row.")
+    header = head.iloc[header_row + 1].tolist()
+    names = engine.header_names(head.iloc[header_row + 1])
+    cells = banner_cells(head.iloc[:header_row + 1])
+
+    rows = 0
+    for chunk in iter_raw(source, name, chunk_size, skiprows=header_row + 2):
+        # Rows narrower or wider than the header are padded or cut to it
+        chunk = chunk.reindex(columns=range(len(names)))
+        banner = banner_mask(chunk, header, cells)
+        if banner.any():
+            chunk = chunk[~banner]
+        chunk.columns = names
+        chunk.index = pd.RangeIndex(rows, rows + len(chunk))
+        rows += len(chunk)
+        yield chunk
+
+
+def read_head(source, name, header_row=None):
+    """The first rows of the extract: enough to detect the header, or to reach a given ``header_row``."""
+    return engine.read_head(source, name, max(DETECT_ROWS, header_row + 2 if header_row is not None else 0))
+
+
+def iter_projected(source, head, header_row, name, chunk_size, schema):
+    header_row, header, positions, cells, usecols = engine.projection(head, header_row, schema)
+    rows = 0
+    for chunk in iter_raw(source, name, chunk_size, skiprows=header_row + 2, usecols=usecols):
+        chunk = engine.project(chunk, header, positions, cells, schema)
+        chunk.index = pd.RangeIndex(rows, rows + len(chunk))
+        rows += len(chunk)
+        yield chunk
+
+
+class CsvSink:
+    """
+    Appends frames to one CSV file, writing the column header once. With
+    ``keep_empty`` a header-only file is written when no rows ever arrive.
+    """
+
+    def __init__(self, path, keep_empty=True):
+        self.path = path
+        self.keep_empty = keep_empty
+        self.columns = None
+        self.rows = 0
+
+    def write(self, frame):
+        if self.columns is None:
+            self.columns = list(frame.columns)
+        if frame.empty:
+            return
+        frame.to_csv(self.path, mode="a" if self.rows else "w", header=not self.rows, index=False)
+        self.rows += len(frame)
+
+    def close(self):
+        """The path when the file was written, else None."""
+        if not self.rows:
+            if not self.keep_empty or self.columns is None:
+                return None
+            pd.DataFrame(columns=self.columns).to_csv(self.path, index=False)
+        return self.path
+
+
+@dataclass
+class StreamResult:
+    """
+    Row counts per sink, accumulated step timings, unmatched join keys,
+    validation rule counts, exclusion summary and the written files of a
+    streaming run.
+    """
+    counts: dict = field(default_factory=dict)
+    timings: dict = field(default_factory=dict)
+    unmatched: dict = field(default_factory=dict)
+    invalid: dict = field(default_factory=dict)
+    exclusion_summary: pd.DataFrame = None
+    written: list = field(default_factory=list)
+    chunks: int = 0
+
+
+def run_streaming(source, output_dir, valuation_date, ignored_product_codes, selected_status,
+                  ri_company_dict=None, mrp_loan_type_dict=None, header_row=None, name=None, chunk_size=CHUNK_SIZE,
+                  schema=None, conversion=None, error_values=True, progress=None):
+    """
+    Run Steps 3-8 over the extract chunk by chunk, writing every output
+    into ``output_dir`` as it goes. With a ``schema`` only its columns are
+    read (the exclusion files then hold only those columns). The invalid
+    fields are written as "Error" unless ``error_values`` is False.
+    ``progress(result)``, if given, is called with the StreamResult so far
+    after each chunk.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    # Same files as engine.write_outputs, as CSV; the maturity files only when they get rows
+    sinks = {
+        "output": CsvSink(os.path.join(output_dir, csv_file_name(engine.OUTPUT_FILE))),
+        "group": CsvSink(os.path.join(output_dir, csv_file_name(engine.GROUP_FILE))),
+        "commencement": CsvSink(os.path.join(output_dir, csv_file_name(engine.COMMENCEMENT_FILE))),
+        "maturity": CsvSink(os.path.join(output_dir, csv_file_name(engine.MATURITY_FILE)), keep_empty=False),
+        "maturity_error": CsvSink(os.path.join(output_dir, csv_file_name(engine.MATURITY_ERROR_FILE)), keep_empty=False),
+    }
+    mpf = MpfWriter(output_dir)
+    result = StreamResult(counts={"input": 0})
+
+    chunks = iter_extract(source, header_row, name, chunk_size, schema)
+    while True:
+        with instrument.step("read_chunk") as record:
+            input_df = next(chunks, None)
+            record.rows_out = len(input_df) if input_df is not None else 0
+        result.timings['read'] = result.timings.get('read', 0.0) + record.wall_s
+        if input_df is None:
+            break
+        chunk = engine.run_pipeline(input_df, valuation_date, ignored_product_codes, selected_status,
+                                    ri_company_dict, mrp_loan_type_dict, conversion)
+        for step, seconds in chunk.timings.items():
+            result.timings[step] = result.timings.get(step, 0.0) + seconds
+        for name, count in chunk.unmatched.items():
+            result.unmatched[name] = result.unmatched.get(name, 0) + count
+        for rule, count in chunk.invalid.items():
+            result.invalid[rule] = result.invalid.get(rule, 0) + count
+        result.exclusion_summary = combine_summaries([result.exclusion_summary, chunk.exclusion_summary])
+
+        with instrument.step("write", len(input_df)) as record:
+            output_df = chunk.output_df.astype(dict.fromkeys(FLOAT_FIELDS, "float64"))
+            output_df = engine.export_frame(output_df, error_values)
+            sinks["output"].write(output_df)
+            sinks["group"].write(chunk.group_policies)
+            sinks["commencement"].write(chunk.commencement_policies)
+            sinks["maturity"].write(chunk.maturity_policies)
+            sinks["maturity_error"].write(chunk.maturity_error_policies)
+            mpf.write(output_df)
+        result.timings['write'] = result.timings.get('write', 0.0) + record.wall_s
+
+        result.counts["input"] += len(input_df)
+        result.chunks += 1
+        if progress is not None:
+            result.counts["output"] = sinks["output"].rows
+            progress(result)
+
+    for key, sink in sinks.items():
+        result.counts[key] = sink.rows
+        path = sink.close()
+        if path is not None:
+            result.written.append(path)
+    result.written.extend(mpf.close())
+    result.counts["mpf_omitted"] = mpf.omitted
+    return result
@@ -0,0 +1,424 @@
+"""
+Synthetic NB_MIS_12HNB extracts for benchmarks.
+
+The only real sample has about a hundred policies, so the cost of a step at
+month-end volumes cannot be seen from it. ``write_extract`` writes a
+seeded, realistic extract of any size, laid out as the printed report:
+the page banner and column header of the sample at the top of every page.
+The policies reproduce the quirks of the real extract:
+
+- DOB and expiry dates as 'dd-mm-yy 0:00' text or as Excel serials
+  ('26903'); Policy Start Date as 'dd-mm-yy';
+- old ('807100025V') and new NIC numbers, the new ones as Excel shows
+  them ('1.99E+11');
+- Male / Female with a few 'M', 'F' and blank genders;
+- LKR and USD policies with their exchange rates;
+- Fixed and Variable interest (Company Buffer and AWPLR for Variable);
+- Yes / No TPD options;
+- Single Premium as plain text and, with the policy fee, mostly
+  comma-formatted ('4,385');
+- Life 2 fields blank except for about one policy in twelve;
+- every policy status, group MCR product codes, policies commencing after
+  the report date, matured policies and a few without a start date, so
+  Steps 4-7 all have something to exclude.
+
+Rows are generated in chunks, so a 5M row file needs no more memory than
+a small one. Example::
+
+    python -m valuation.synthetic 1m .cache/bench/NB_MIS_12HNB_1m.csv --seed 7
+"""
+import argparse
+import functools
+import math
+import os
+import re
+import sys
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+
+# The header of the extract, cell by cell (the blank cells hold the banner's right-hand labels)
+HEADER = [
+    'Policy Number', 'Bank', 'Branch Name', 'Product Code', 'Plan Code', 'Loan Schedule Type', 'Name (Life 1)',
+    'DOB (Life 1)', 'NIC (Life 1)', 'Gender (Life 1)', 'Name (Life 2)', 'NIC (Life 2)', 'DOB (Life 2)',
+    'Age at Policy Start(Life 1)', 'Age at Policy Start(Life 2)', 'Gender (Life 2)', 'Occupation (Life 1)',
+    'Occupation (Life 2)', 'Address', 'Policy Start Date', 'Policy Expiry Date', 'Policy Term (Months)',
+    'Grace Period (Months)', 'Term of Fixed Interest (Months)', 'Interest Type', 'Fixed Interest', 'Company Buffer',
+    'Current AWPLR', 'Additional AWPLR', 'TPD Option  - Life 1', 'TPD Option  - Life 2', 'Smoker or not',
+    'Expiry Date (Death Benefit  - Life 1)', 'Expiry Date (Death Benefit  - Life 2)', ' Expiry Date (TPD  - Life 1)',
+    'Expiry Date (TPD  - Life 2)', 'Loan Amount (Death Benefit) -Life 1', 'Loan Amount (TPD Benefit) -Life 1',
+    'Loan Amount (Death Benefit) -Life 2', 'Loan Amount (TPD Benefit) -Life 2',
+    'Health Loadings   (Death Benefit) -Life 1', 'Health Loadings   (Death Benefit) -Life 2',
+    'Health Loadings   (TPD) -Life 1', 'Health Loadings   (TPD) -Life 2',
+    'Occupation Loadings   (Death Benefit) -Life 1', 'Occupation Loadings   (Death Benefit) -Life 2',
+    'Occupation Loadings   (TPD) -Life 1', 'Occupation Loadings   (TPD) -Life 2',
+    'Occupation Extra Per Mile   (Death Benefit) -Life 1', 'Occupation Extra Per Mile   (Death Benefit) -Life 2',
+    'Occupation Extra Per Mile   (TPD) -Life 1', 'Occupation Extra Per Mile   (TPD) -Life 2', 'Discount %', 'Currency',
+    'Exchange Rate (Higher Rate)', 'Exchange Rate (Current Rate)', 'Reinsurance Company', 'Single Premium',
+    'Single Premium with Policy fee', 'Surrender Value as at report generated end date',
+    'Date of Death/ Surrender (If applicable)', '', 'RI (Automatic or Facultative)', '', '', 'Policy Status', '', '',
+]
+WIDTH = len(HEADER)
+
+# Named sizes of the benchmark extracts
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "5m": 5_000_000}
+
+# Policies per printed page (each page starts with the banner and, with repeat_header, the header)
+PAGE_ROWS = 10_000
+CHUNK_SIZE = 100_000
+# Excel sheets stop at 1,048,576 rows, banners included
+XLSX_MAX_ROWS = 1_000_000
+
+REPORT_DATE = date(2025, 2, 1)
+EXCEL_EPOCH = np.datetime64("1899-12-30", "D")
+# Dates are formatted from a table of every day in this range
+FIRST_DAY = "1900-01-01"
+DAYS = 200 * 366
+
+PRODUCT_CODES = {
+    'PLAN25_V1': 0.50, 'PLAN11_V4': 0.15, 'PLAN07_V1': 0.09, 'PLAN07_V2': 0.05, 'PLAN11_V1': 0.04,
+    'PLAN07_V5': 0.03, 'PLAN11_V5': 0.03, 'PLAN11_V9': 0.02, 'PLAN07_V12': 0.01, 'PLAN07_V6': 0.01,
+    'PLAN07_V3': 0.03, 'PLAN07_V10': 0.02, 'PLAN11_V2': 0.02,
+}
+BANKS = {
+    'AMANA BANK': 0.45, 'HATTON NATIONAL BANK': 0.30, 'DFCC BANK': 0.05, 'NATIONAL SAVINGS BANK': 0.04,
+    'COMMERCIAL BANK OF CEYLON PLC': 0.04, 'BANK OF CEYLON': 0.03, 'NATIONAL DEVELOPMENT BANK': 0.02,
+    "PEOPLE'S BANK": 0.03, 'MERCHANT BANK OF SRI LANKA': 0.02, 'HEAD OFFICE': 0.01, 'HNB PANADURA': 0.01,
+}
+TOWNS = [
+    'NINTHAVUR', 'MONARAGALA', 'GAMPOLA', 'MAWANELLA', 'GALLE', 'KOTTAWA', 'KANDY', 'KURUNEGALA', 'MATARA',
+    'KALMUNAI', 'AKKARAIPATTU', 'BATTICALOA', 'JAFFNA', 'NEGOMBO', 'PANADURA', 'KEKIRAWA', 'KATUGASTOTA',
+    'HABARADUWA', 'KANDANA', 'POLGASOWITA', 'ANURADHAPURA', 'BADULLA', 'RATNAPURA', 'CHILAW', 'AMPARA',
+    'TRINCOMALEE', 'KEGALLE', 'MATALE', 'WATTALA', 'MAHARAGAMA', 'DEHIWALA', 'HORANA', 'KALUTARA', 'ELPITIYA',
+]
+STREETS = [
+    'MAIN STREET', 'GALLE ROAD', 'OLD GALLE ROAD', 'BEACH ROAD', 'TEMPLE ROAD', 'STATION ROAD', 'Meera road',
+    'Nawalapitiya Road', 'PARATTA ROAD', 'KANDY ROAD', 'HOSPITAL ROAD', 'Samaranayake Mawatha', 'SCHOOL LANE',
+    '6TH LANE', 'PADDY FIELD GARDEN', 'CHURCH ROAD', 'MOSQUE ROAD', 'NEW TOWN',
+]
+GIVEN_NAMES = [
+    'KAPUGE', 'URAPALA GAMAGE', 'SAMASUNDARA MUDIYANSELAGE', 'KOLAMUNNE MUDIYANSELAGE', 'AHAMED', 'MOHAMED',
+    'ABDUL CAFFOOR', 'Thevakumary', 'PATHIRANNEHELAGE', 'Kaluarachchige', 'TUWAN', 'NAJEEB', 'WICKRAMASINGHE',
+    'HERATH MUDIYANSELAGE', 'RANASINGHE ARACHCHIGE', 'SELVARAJAH', 'FATHIMA', 'Noor', 'DISSANAYAKE', 'PERERA',
+]
+FAMILY_NAMES = [
+    'JEEWANI ARUNA PUSHPAKANTHI', 'JANAKA WIJAYAKUMARA', 'NILANTHI CHANDRIKA', 'GAMAINI WIMALASENA',
+    'JAMALDEEN NAJEEB', 'MOHAMED HANIFA', 'Selvakumaran', 'LIMARA MANDARI WEERASINGHE', 'Hashini Nadeeka',
+    'IZZATH AHAMED', 'Mohamed Zeenathul Munabra', 'LALALDEEN NONA THASHMILA', 'SUNIL SHANTHA', 'KUMARI PERERA',
+    'RIZWAN', 'SITHY NAFEESA', 'THARINDU MADUSHANKA', 'KAMALA DEVI', 'ANURA BANDARA', 'NIROSHA DILRUKSHI',
+]
+OCCUPATIONS = {
+    'Businessman': 0.18, 'Business Owner': 0.16, 'Agricultural worker-Farmer': 0.15, 'Teachers': 0.12,
+    'Bank Officer': 0.09, 'Pensioners': 0.04, 'Managers': 0.04, 'Directors': 0.03, 'Software Engineers': 0.03,
+    'Executives and Officers': 0.03, 'Ayurvedic Doctors': 0.02, 'Insurance Salesmen': 0.02, 'House Wife': 0.05,
+    'Jewellery and Gem Workers': 0.02, 'Drivers': 0.02,
+}
+STATUSES = {
+    'IN-FORCE': 0.83, 'AWAITING MEDICAL REQUIREMENTS': 0.06, 'PROPOSAL CANCELLED': 0.05,
+    'AWAITING GENERAL DOCUMENTS': 0.02, 'SURRENDERED': 0.02, 'EXPIRED': 0.01, 'LAPSED': 0.01,
+}
+GENDERS = {'Male': 0.74, 'Female': 0.23, 'M': 0.01, 'F': 0.01, '': 0.01}
+GENDERS_2 = {'Female': 0.93, 'Male': 0.04, 'F': 0.01, 'M': 0.01, '': 0.005, 'Other': 0.005}
+TERMS = {60: 0.22, 36: 0.14, 12: 0.13, 48: 0.09, 120: 0.07, 24: 0.05, 180: 0.04, 84: 0.04, 96: 0.04, 72: 0.03,
+         144: 0.03, 240: 0.03, 140: 0.02, 56: 0.02, 300: 0.02, 1: 0.01, 0: 0.01, 6: 0.01}
+FIXED_RATES = ['13.5', '8', '18', '15.5', '5', '15', '12', '14', '16.5', '10', '11.25', '9.5']
+AWPLR = ['9.92', '11.5', '11.91', '11.78', '9.32', '10.44', '12.1']
+ADDITIONAL_AWPLR = ['3', '2.5', '4', '3.5']
+USD_RATES = (300.45, 297.8)
+
+LIFE_2_SHARE = 0.08
+SERIAL_DATE_SHARE = 0.4
+
+
+def parse_rows(value):
+    """A row count: a name of SIZES, or a number with an optional k / m suffix ('250k', '2.5m', '40000')."""
+    text = str(value).strip().lower().replace("_", "").replace(",", "")
+    if text in SIZES:
+        return SIZES[text]
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([km]?)", text)
+    if match is None:
+        raise ValueError(f"Invalid row count '{value}', expected e.g. 10k, 1m or 250000")
+    return int(float(match.group(1)) * {"": 1, "k": 1_000, "m": 1_000_000}[match.group(2)])
+
+
+def size_name(rows):
+    for name, size in SIZES.items():
+        if size == rows:
+            return name
+    return str(rows)
+
+
+def choice(rng, weights, rows):
+    values = list(weights)
+    p = np.array([weights[value] for value in values], dtype=float)
+    return np.array(values, dtype=object)[rng.choice(len(values), size=rows, p=p / p.sum())]
+
+
+def pick(rng, values, rows):
+    return np.array(values, dtype=object)[rng.integers(0, len(values), rows)]
+
+
+def text(values):
+    return np.asarray(values).astype(str).astype(object)
+
+
+def blank(values, mask):
+    """``values`` with the ``mask`` cells blank."""
+    values = np.asarray(values, dtype=object).copy()
+    values[mask] = ''
+    return values
+
+
+@functools.lru_cache(maxsize=None)
+def date_texts():
+    """'dd-mm-yy' of every day from FIRST_DAY on, by day number (strftime per value is the slowest step otherwise)."""
+    days = pd.date_range(FIRST_DAY, periods=DAYS, freq="D")
+    return days.strftime("%d-%m-%y").to_numpy(dtype=object)
+
+
+def short_dates(days):
+    """'dd-mm-yy' text of datetime64[D] values."""
+    return date_texts()[(days - np.datetime64(FIRST_DAY, "D")).astype("int64")]
+
+
+def report_dates(rng, days):
+    """Dates as the extract holds them: 'dd-mm-yy 0:00' text, or the Excel serial for SERIAL_DATE_SHARE of them."""
+    serial = rng.random(len(days)) < SERIAL_DATE_SHARE
+    return np.where(serial, text((days - EXCEL_EPOCH).astype("int64")),
+                    short_dates(days) + ' 0:00')
+
+
+def amounts(values):
+    """Whole amounts without decimals, others with two ('3673.89'); formatted from integer cents, floats print slowly."""
+    cents = np.round(values * 100).astype("int64")
+    units = text(cents // 100)
+    fraction = np.char.zfill(text(cents % 100).astype(str), 2).astype(object)
+    return np.where(cents % 100 == 0, units, units + '.' + fraction)
+
+
+def grouped(values):
+    """Amounts with thousands separators ('4,385', '3,673.89')."""
+    return np.array([f"{value:,.0f}" if value == round(value) else f"{value:,.2f}" for value in values], dtype=object)
+
+
+def nic_numbers(rng, birth, female):
+    """Old NIC numbers ('807100025V') for the born before 1990, new 12-digit ones (shown as '1.99E+11') for the rest."""
+    years = birth.astype("datetime64[Y]").astype("int64") + 1970
+    day = (birth - birth.astype("datetime64[Y]")).astype("int64") + 1 + np.where(female, 500, 0)
+    serial = rng.integers(0, 10_000, len(birth))
+    old = text(years % 100 * 10_000_000 + day * 10_000 + serial)
+    old = np.char.zfill(old.astype(str), 9).astype(object) + 'V'
+    new = np.char.mod('%.2E', (years * 10_000_000 + day * 10_000 + serial) * 10.0).astype(object)
+    return np.where(years < 1990, old, new)
+
+
+def people(rng, rows, starts):
+    """Name, birth date, age at the start date and NIC of one life per policy; ``female`` decides the NIC."""
+    names = pick(rng, GIVEN_NAMES, rows) + ' ' + pick(rng, FAMILY_NAMES, rows)
+    upper = rng.random(rows) < 0.8
+    names = np.where(upper, pd.Series(names).str.upper().to_numpy(dtype=object), names)
+    ages = rng.integers(18, 66, rows)
+    birth = starts - (ages * 365.25 + rng.integers(0, 365, rows)).astype("int64").astype("timedelta64[D]")
+    return names, birth, ages
+
+
+def generate_rows(rows, seed=0, offset=0, report_date=REPORT_DATE):
+    """
+    ``rows`` policies as raw extract rows (text cells, blank as '',
+    labelled by column position like a raw grid). The same ``seed`` and
+    ``offset`` (the number of the first policy) give the same rows.
+    """
+    rng = np.random.default_rng([seed, offset])
+    end = np.datetime64(report_date, "D")
+    cells = {}
+
+    cells['Policy Number'] = text(400_000_001 + offset + np.arange(rows))
+    product = choice(rng, PRODUCT_CODES, rows)
+    cells['Product Code'] = product
+    # The plan code is the product code but for a few policies moved to another variant of the plan
+    moved = rng.random(rows) < 0.02
+    cells['Plan Code'] = np.where(moved, pd.Series(product).str.replace(r"_V\d+$", "_V1", regex=True).to_numpy(dtype=object),
+                                  product)
+    cells['Bank'] = choice(rng, BANKS, rows)
+    cells['Branch Name'] = pick(rng, TOWNS + ['HEAD OFFICE'], rows)
+    cells['Loan Schedule Type'] = np.full(rows, 'Standard', dtype=object)
+
+    # Start dates up to ten years back, most of them recent, and a month past the report date (not commenced yet)
+    starts = end + 31 - rng.exponential(900, rows).clip(0, 3_650).astype("int64").astype("timedelta64[D]")
+    term = choice(rng, TERMS, rows).astype("int64")
+    expiry = starts + (term * 30.4375).round().astype("int64").astype("timedelta64[D]") - np.timedelta64(1, "D")
+    cells['Policy Start Date'] = blank(short_dates(starts), rng.random(rows) < 0.001)
+    cells['Policy Expiry Date'] = report_dates(rng, expiry)
+    cells['Policy Term (Months)'] = text(term)
+    cells['Grace Period (Months)'] = blank(pick(rng, ['12', '36', '48', '60', '24', '18'], rows), rng.random(rows) < 0.71)
+
+    names, birth, ages = people(rng, rows, starts)
+    gender = choice(rng, GENDERS, rows)
+    female = np.isin(gender, ['Female', 'F'])
+    cells['Name (Life 1)'] = names
+    cells['DOB (Life 1)'] = report_dates(rng, birth)
+    cells['NIC (Life 1)'] = nic_numbers(rng, birth, female)
+    cells['Gender (Life 1)'] = gender
+    cells['Age at Policy Start(Life 1)'] = text(ages)
+    cells['Occupation (Life 1)'] = choice(rng, OCCUPATIONS, rows)
+    cells['Address'] = blank('NO ' + text(rng.integers(1, 500, rows)) + ', ' + pick(rng, STREETS, rows) + ', '
+                             + pick(rng, TOWNS, rows), rng.random(rows) < 0.02)
+
+    # Life 2: blank for most policies; its gender is filled in regardless, as in the extract
+    life_2 = rng.random(rows) < LIFE_2_SHARE
+    names_2, birth_2, ages_2 = people(rng, rows, starts)
+    gender_2 = choice(rng, GENDERS_2, rows)
+    cells['Name (Life 2)'] = blank(names_2, ~life_2)
+    cells['DOB (Life 2)'] = blank(report_dates(rng, birth_2), ~life_2)
+    cells['NIC (Life 2)'] = blank(nic_numbers(rng, birth_2, np.isin(gender_2, ['Female', 'F'])), ~life_2)
+    cells['Age at Policy Start(Life 2)'] = blank(text(ages_2), ~life_2)
+    cells['Gender (Life 2)'] = gender_2
+    cells['Occupation (Life 2)'] = blank(choice(rng, OCCUPATIONS, rows), ~life_2)
+
+    variable = rng.random(rows) < 0.14
+    cells['Interest Type'] = np.where(variable, 'Variable', 'Fixed').astype(object)
+    cells['Term of Fixed Interest (Months)'] = text(term)
+    cells['Fixed Interest'] = np.where(variable, '0', pick(rng, FIXED_RATES, rows))
+    cells['Company Buffer'] = np.where(variable, '5', '').astype(object)
+    cells['Current AWPLR'] = blank(pick(rng, AWPLR, rows), ~variable)
+    cells['Additional AWPLR'] = blank(pick(rng, ADDITIONAL_AWPLR, rows), ~variable)
+
+    tpd = rng.random(rows) < 0.9
+    cells['TPD Option  - Life 1'] = np.where(tpd, 'Yes', 'No').astype(object)
+    cells['TPD Option  - Life 2'] = np.where(life_2, np.where(rng.random(rows) < 0.9, 'Yes', 'No'), '').astype(object)
+    cells['Smoker or not'] = np.where(rng.random(rows) < 0.02, 'Smoker', 'Non-Smoker').astype(object)
+
+    expiry_text = report_dates(rng, expiry)
+    cells['Expiry Date (Death Benefit  - Life 1)'] = expiry_text
+    cells[' Expiry Date (TPD  - Life 1)'] = blank(expiry_text, ~tpd)
+    expiry_text_2 = blank(report_dates(rng, expiry), ~life_2)
+    cells['Expiry Date (Death Benefit  - Life 2)'] = expiry_text_2
+    cells['Expiry Date (TPD  - Life 2)'] = expiry_text_2
+
+    usd = rng.random(rows) < 0.03
+    loan = np.round(np.exp(rng.normal(13.5, 1.2, rows)) / 50_000).clip(1, 1_000) * 50_000
+    loan = np.where(usd, np.round(loan / 400, -2).clip(100), loan)
+    loan_text = text(loan.astype("int64"))
+    cells['Loan Amount (Death Benefit) -Life 1'] = loan_text
+    cells['Loan Amount (TPD Benefit) -Life 1'] = blank(loan_text, ~tpd)
+    cells['Loan Amount (Death Benefit) -Life 2'] = blank(loan_text, ~life_2)
+    cells['Loan Amount (TPD Benefit) -Life 2'] = blank(loan_text, ~life_2)
+    cells['Health Loadings   (Death Benefit) -Life 1'] = blank(pick(rng, ['25', '50'], rows), rng.random(rows) > 0.04)
+    cells['Health Loadings   (TPD) -Life 1'] = blank(pick(rng, ['50', '75', '100'], rows), rng.random(rows) > 0.05)
+    cells['Occupation Loadings   (TPD) -Life 1'] = blank(np.full(rows, '200', dtype=object), rng.random(rows) > 0.01)
+
+    discount = blank(pick(rng, ['7', '20', '15', '17.2', '10', '4.92', '13.86', '16', '6', '5'], rows), rng.random(rows) < 0.02)
+    cells['Discount %'] = np.where(rng.random(rows) < 0.83, '0', discount)
+    cells['Currency'] = np.where(usd, 'USD', 'LKR').astype(object)
+    cells['Exchange Rate (Higher Rate)'] = np.where(usd, str(USD_RATES[0]), '1').astype(object)
+    cells['Exchange Rate (Current Rate)'] = np.where(usd, str(USD_RATES[1]), '1').astype(object)
+    cells['Reinsurance Company'] = np.where(rng.random(rows) < 0.8, 'Yes', 'No').astype(object)
+
+    premium = loan * np.maximum(term, 1) / 12 * rng.uniform(0.0015, 0.006, rows)
+    premium = np.where(rng.random(rows) < 0.8, np.round(premium), np.round(premium, 2))
+    cells['Single Premium'] = amounts(premium)
+    # With the policy fee the premium is usually comma-formatted, sometimes a plain number
+    cells['Single Premium with Policy fee'] = np.where(rng.random(rows) < 0.6, grouped(premium), amounts(premium))
+    surrender = np.where(rng.random(rows) < 0.4, 0.0, np.round(premium * rng.uniform(0.05, 0.8, rows), 2))
+    cells['Surrender Value as at report generated end date'] = amounts(surrender)
+
+    status = choice(rng, STATUSES, rows)
+    cells['Policy Status'] = status
+    ended = np.isin(status, ['PROPOSAL CANCELLED', 'SURRENDERED'])
+    cells['Date of Death/ Surrender (If applicable)'] = blank(short_dates(starts) + ' 0:00', ~ended)
+    cells['RI (Automatic or Facultative)'] = blank(np.full(rows, 'Facultative', dtype=object), rng.random(rows) > 0.04)
+
+    empty = np.full(rows, '', dtype=object)
+    return pd.DataFrame({position: cells.get(name, empty) if name else empty for position, name in enumerate(HEADER)},
+                        dtype=object)
+
+
+def banner_rows(page, pages, report_date=REPORT_DATE, user="NITHARM", repeat_header=True):
+    """The banner of one page of the report (and the header under it)."""
+    rows = [[None] * WIDTH for _ in range(5)]
+    rows[0][0] = 'Main data extraction'
+    rows[1][0] = f"From 01/01/2000 To {report_date:%d/%m/%Y}"
+    rows[2][0] = 'REPORT ID : NB_MIS_12HNB'
+    rows[2][61:65] = ['User', None, ':', user]
+    rows[3][61:65] = ['Print Date', None, ':', f"{report_date:%d-%m-%y} 9:39"]
+    rows[4][61:68] = ['Page Number', None, ':', str(page), None, '/', str(pages)]
+    if page == 1 or repeat_header:
+        rows.append([name or None for name in HEADER])
+    return pd.DataFrame(rows)
+
+
+def iter_report(rows, seed=0, page_rows=PAGE_ROWS, repeat_header=True, chunk_size=CHUNK_SIZE, report_date=REPORT_DATE):
+    """The report as raw frames of at most about ``chunk_size`` rows: the policies with a banner before every page."""
+    if not rows:
+        yield banner_rows(1, 1, report_date)
+        return
+    page_rows = page_rows or rows
+    pages = math.ceil(rows / page_rows)
+    for offset in range(0, rows, chunk_size):
+        count = min(chunk_size, rows - offset)
+        policies = generate_rows(count, seed, offset, report_date)
+        parts = []
+        start = 0
+        while start < count:
+            if (offset + start) % page_rows == 0:
+                parts.append(banner_rows((offset + start) // page_rows + 1, pages, report_date, repeat_header=repeat_header))
+            stop = min(count, start + page_rows - (offset + start) % page_rows)
+            parts.append(policies.iloc[start:stop])
+            start = stop
+        yield pd.concat(parts, ignore_index=True)
+
+
+def write_extract(path, rows, seed=0, page_rows=PAGE_ROWS, repeat_header=True, chunk_size=CHUNK_SIZE,
+                  report_date=REPORT_DATE):
+    """
+    Write a synthetic extract of ``rows`` policies to ``path`` (.csv, or
+    .xlsx up to XLSX_MAX_ROWS). Every ``page_rows`` policies a page banner
+    is written, followed by the header again with ``repeat_header``.
+    Returns ``path``.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if path.lower().endswith(".xlsx"):
+        if rows > XLSX_MAX_ROWS:
+            raise ValueError(f"An xlsx extract holds at most {XLSX_MAX_ROWS:,} policies; write {rows:,} as .csv")
+        frame = pd.concat(iter_report(rows, seed, page_rows, repeat_header, chunk_size, report_date), ignore_index=True)
+        frame.to_excel(path, header=False, index=False)
+        return path
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        for frame in iter_report(rows, seed, page_rows, repeat_header, chunk_size, report_date):
+            frame.to_csv(f, header=False, index=False)
+    return path
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m valuation.synthetic",
+                                     description="Write a synthetic NB_MIS_12HNB extract for benchmarks.")
+    parser.add_argument("rows", help=f"Policies to generate: {', '.join(SIZES)} or a count such as 250k")
+    parser.add_argument("path", help="Output file (.csv, or .xlsx for small extracts)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: %(default)s)")
+    parser.add_argument("--page-rows", type=int, default=PAGE_ROWS, metavar="ROWS",
+                        help="Policies per report page; 0 writes a single banner (default: %(default)s)")
+    parser.add_argument("--no-repeat-header", dest="repeat_header", action="store_false",
+                        help="Print the column header on the first page only")
+    parser.add_argument("--report-date", type=date.fromisoformat, default=REPORT_DATE, metavar="DATE",
+                        help="End date of the report (YYYY-MM-DD, default: %(default)s)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        rows = parse_rows(args.rows)
+        write_extract(args.path, rows, args.seed, args.page_rows, args.repeat_header, report_date=args.report_date)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(f"Wrote {rows:,} policies to {args.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
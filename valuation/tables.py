@@ -0,0 +1,180 @@
+"""
+Reference tables from the TABLE folder, parsed once per process.
+
+Streamlit re-runs the app script on every widget interaction, in every
+session. The tables here are kept in a process-wide cache (shared by all
+sessions) and only parsed again when the file changes: a changed mtime or
+size triggers a content hash, and only a changed hash triggers a re-parse.
+Cached tables are shared, so callers must treat them as read-only.
+"""
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+from io import BytesIO
+
+import pandas as pd
+
+from valuation.joins import ReferenceTable
+
+
+RI_COMPANY_PATH = "TABLE/RI_Company.csv"
+MRP_LOAN_TYPE_PATH = "TABLE/MRP_LOAN_TYPE.csv"
+MAPPING_WORKBOOK_PATH = "TABLE/TABLE.xlsx"
+FX_RATE_PATH = "TABLE/FX_RATE.csv"
+
+
+# ---------------------------------------------------------------------------
+# Parsers (bytes -> table)
+# ---------------------------------------------------------------------------
+
+def parse_ri_company(data):
+    """PolicyNo -> RI_Company mapping from the RI_Company table, indexed for joins."""
+    ri_company_df = pd.read_csv(BytesIO(data), dtype=str)
+    return ReferenceTable.from_columns(ri_company_df['PolicyNo'].str.strip(), ri_company_df['RI_Company'].str.strip())
+
+
+def parse_mrp_loan_type(data):
+    """Product Code -> Loan Type (RBC) mapping from the MRP_LOAN_TYPE table, indexed for joins."""
+    mrp_loan_type_df = pd.read_csv(BytesIO(data), dtype=str)
+    return ReferenceTable.from_columns(mrp_loan_type_df['Product Code'].str.strip(),
+                                      mrp_loan_type_df['Loan Type - RBC'].str.strip())
+
+
+def parse_fx_rates(data):
+    """
+    Exchange rates to LKR from the FX_RATE table (Currency, Effective Date,
+    Rate), sorted by effective date for as-of lookups.
+    """
+    fx_rate_df = pd.read_csv(BytesIO(data), dtype=str)
+    rates = pd.DataFrame({
+        'Currency': fx_rate_df['Currency'].astype(str).str.strip(),
+        'Effective Date': pd.to_datetime(fx_rate_df['Effective Date'].str.strip(), format="%Y-%m-%d"),
+        'Rate': pd.to_numeric(fx_rate_df['Rate'].str.strip()).astype("float64"),
+    })
+    return rates.sort_values(['Effective Date', 'Currency'], kind="stable").reset_index(drop=True)
+
+
+def parse_mapping_workbook(data):
+    """
+    The mapping tables kept side by side on the first sheet of TABLE.xlsx
+    ("System Status", "Plan Code Identification", "Prophet Codes", ...).
+
+    Each block has its title in the top title row; its header is the first
+    non-blank row below the title and its rows run to the first blank row.
+    Returns {title: DataFrame}.
+    """
+    grid = pd.read_excel(BytesIO(data), header=None, dtype=object)
+    title_rows = grid.notna().any(axis=1)
+    if not title_rows.any():
+        return {}
+    title_row = title_rows.idxmax()
+    titles = grid.loc[title_row].dropna()
+    starts = list(titles.index) + [grid.columns[-1] + 1]
+
+    blocks = {}
+    for (start, title), end in zip(titles.items(), starts[1:]):
+        block = grid.loc[title_row + 1:, start:end - 1].dropna(axis=1, how="all")
+        filled = block.notna().any(axis=1)
+        if not filled.any():
+            continue
+        block = block.loc[filled.idxmax():]
+        blank = ~block.notna().any(axis=1)
+        if blank.any():
+            block = block.loc[:blank.idxmax() - 1]
+        table = block.iloc[1:].reset_index(drop=True)
+        table.columns = [str(name).strip() if pd.notna(name) else f"Unnamed: {i}" for i, name in enumerate(block.iloc[0])]
+        blocks[str(title).strip()] = table
+    return blocks
+
+
+# ---------------------------------------------------------------------------
+# Cache
+# ---------------------------------------------------------------------------
+
+@dataclass
+class TableEntry:
+    value: object
+    mtime_ns: int
+    size: int
+    digest: str
+    load_seconds: float
+    loads: int = 1
+    hits: int = 0
+    rehashes: int = 0
+
+
+class TableCache:
+    """Process-wide cache of parsed reference tables, keyed by (path, parser)."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def load(self, path, parser):
+        key = (os.path.abspath(path), parser.__name__)
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+                entry.hits += 1
+                return entry.value
+
+            with open(path, "rb") as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            if entry is not None and entry.digest == digest:
+                # Touched but unchanged: keep the parsed table
+                entry.mtime_ns, entry.size = stat.st_mtime_ns, stat.st_size
+                entry.hits += 1
+                entry.rehashes += 1
+                return entry.value
+
+            start = time.perf_counter()
+            value = parser(data)
+            load_seconds = time.perf_counter() - start
+            loads = entry.loads + 1 if entry is not None else 1
+            self._entries[key] = TableEntry(value, stat.st_mtime_ns, stat.st_size, digest, load_seconds, loads)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """One row per cached table: parse time, parse / hit counts and content hash."""
+        with self._lock:
+            rows = [{
+                "table": os.path.relpath(path),
+                "parser": parser_name,
+                "load_seconds": entry.load_seconds,
+                "loads": entry.loads,
+                "hits": entry.hits,
+                "rehashes": entry.rehashes,
+                "sha256": entry.digest[:12],
+            } for (path, parser_name), entry in self._entries.items()]
+        return pd.DataFrame(rows, columns=["table", "parser", "load_seconds", "loads", "hits", "rehashes", "sha256"])
+
+
+table_cache = TableCache()
+
+
+def load_ri_company_dict(path=RI_COMPANY_PATH):
+    return table_cache.load(path, parse_ri_company)
+
+
+def load_mrp_loan_type_dict(path=MRP_LOAN_TYPE_PATH):
+    return table_cache.load(path, parse_mrp_loan_type)
+
+
+def load_fx_rates(path=FX_RATE_PATH):
+    return table_cache.load(path, parse_fx_rates)
+
+
+def load_mapping_tables(path=MAPPING_WORKBOOK_PATH):
+    return table_cache.load(path, parse_mapping_workbook)
+
+
+def table_stats():
+    return table_cache.stats()
@@ -0,0 +1,213 @@
+"""
+Content-addressed Parquet cache of parsed uploads.
+
+Parsing an extract (above all an Excel one) is the slowest part of an
+upload, and the same month-end file is uploaded again and again. The raw
+grid parsed from an upload is stored as Parquet under the SHA-256 of the
+uploaded bytes; an identical upload is then loaded, memory-mapped, instead
+of parsed. The grid rather than the header-applied frame is cached because
+the header-applied frame is a zero-copy slice of it (``engine.apply_header``),
+so one entry serves every Header Row choice and the preview.
+
+Parquet columns hold one type, but Excel grids have object columns mixing
+text, numbers and datetimes. Those are stored as text plus a type code per
+cell and rebuilt value for value on load. Grids with cell types outside
+that set are not cached.
+
+The cache is capped in bytes; least recently used entries (by file mtime,
+touched on every hit) are evicted first.
+"""
+import datetime
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+CACHE_DIR = os.path.join(".cache", "uploads")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+FORMAT_VERSION = 1
+
+# Type codes of the cells of a mixed object column
+MISSING, TEXT, INTEGER, FLOAT, DATETIME, BOOLEAN = range(6)
+KIND_SUFFIX = "#kind"
+
+
+class Unsupported(Exception):
+    """A grid the cache cannot store exactly."""
+
+
+def cell_kind(value):
+    if isinstance(value, bool):
+        return BOOLEAN
+    if isinstance(value, str):
+        return TEXT
+    if isinstance(value, (int, np.integer)):
+        return INTEGER
+    if isinstance(value, (float, np.floating)):
+        return MISSING if np.isnan(value) else FLOAT
+    if isinstance(value, datetime.datetime):
+        return DATETIME
+    if value is None:
+        return MISSING
+    raise Unsupported(type(value).__name__)
+
+
+def encode_mixed(column):
+    """A mixed object column as (text, type code) arrays."""
+    values = column.to_numpy(dtype=object)
+    kinds = np.fromiter((cell_kind(value) for value in values), dtype="int8", count=len(values))
+    text = np.full(len(values), None, dtype=object)
+    present = kinds != MISSING
+    text[present] = [value.isoformat() if kind == DATETIME else repr(value) if kind == FLOAT else str(value)
+                     for value, kind in zip(values[present], kinds[present])]
+    return text, kinds
+
+
+def decode_mixed(text, kinds):
+    """Rebuild a mixed object column from ``encode_mixed`` output, by type."""
+    out = np.full(len(kinds), np.nan, dtype=object)
+    for kind, convert in ((TEXT, None),
+                          (INTEGER, lambda t: t.astype("int64")),
+                          (FLOAT, lambda t: t.astype("float64")),
+                          (BOOLEAN, lambda t: t == "True"),
+                          (DATETIME, lambda t: pd.to_datetime(t).to_pydatetime())):
+        rows = kinds == kind
+        if rows.any():
+            values = text[rows]
+            out[rows] = values if convert is None else convert(values.astype(str)).astype(object)
+    return out
+
+
+def encode_grid(grid):
+    """A grid as an Arrow table (string column names) plus what is needed to restore it."""
+    columns, meta = {}, {"labels": [], "mixed": [], "object": []}
+    for position, label in enumerate(grid.columns):
+        key = str(position)
+        column = grid.iloc[:, position]
+        meta["labels"].append(label if isinstance(label, (int, str)) else str(label))
+        if column.dtype == object:
+            if pd.api.types.infer_dtype(column, skipna=True) in ("string", "empty"):
+                meta["object"].append(key)
+                columns[key] = pa.array(column.to_numpy(dtype=object), type=pa.string(), from_pandas=True)
+            else:
+                text, kinds = encode_mixed(column)
+                meta["mixed"].append(key)
+                columns[key] = pa.array(text, type=pa.string(), from_pandas=True)
+                columns[key + KIND_SUFFIX] = pa.array(kinds)
+        else:
+            columns[key] = pa.Array.from_pandas(column)
+    table = pa.table(columns)
+    return table.replace_schema_metadata({b"valuation": json.dumps({"version": FORMAT_VERSION, **meta}).encode()})
+
+
+def decode_grid(table):
+    meta = json.loads(table.schema.metadata[b"valuation"])
+    if meta.get("version") != FORMAT_VERSION:
+        raise Unsupported("cache format")
+    columns = {}
+    for position, label in enumerate(meta["labels"]):
+        key = str(position)
+        if key in meta["mixed"]:
+            text = table.column(key).to_numpy(zero_copy_only=False)
+            kinds = table.column(key + KIND_SUFFIX).to_numpy()
+            columns[label] = decode_mixed(text, kinds)
+        elif key in meta["object"]:
+            columns[label] = pd.Series(table.column(key).to_numpy(zero_copy_only=False), dtype=object)
+        else:
+            columns[label] = table.column(key).to_pandas()
+    return pd.DataFrame(columns)
+
+
+class UploadCache:
+    """Parsed grids on disk, keyed by the SHA-256 of the uploaded bytes, LRU-capped at ``max_bytes``."""
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def path(self, digest):
+        return os.path.join(self.directory, f"{digest}.parquet")
+
+    def get(self, digest, parse):
+        """The grid for ``digest``: loaded from the cache, else returned by ``parse()`` and stored."""
+        path = self.path(digest)
+        if os.path.exists(path):
+            try:
+                grid = decode_grid(pq.read_table(path, memory_map=True))
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+            else:
+                os.utime(path)
+                with self._lock:
+                    self.hits += 1
+                return grid
+
+        with self._lock:
+            self.misses += 1
+        grid = parse()
+        self.put(digest, grid)
+        return grid
+
+    def put(self, digest, grid):
+        try:
+            table = encode_grid(grid)
+        except (Unsupported, pa.ArrowException):
+            with self._lock:
+                self.errors += 1
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Write under a temporary name so a concurrent reader never sees half a file
+        temporary = os.path.join(self.directory, f".{uuid.uuid4().hex}.tmp")
+        pq.write_table(table, temporary)
+        os.replace(temporary, self.path(digest))
+        self.evict()
+
+    def entries(self):
+        """(path, bytes, mtime) of every cached grid, least recently used first."""
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".parquet"):
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            os.remove(path)
+
+    def stats(self):
+        entries = self.entries()
+        with self._lock:
+            return {"entries": len(entries), "bytes": sum(size for _, size, _ in entries), "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions, "errors": self.errors}
+
+
+upload_cache = UploadCache()